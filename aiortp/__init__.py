@@ -1,2 +1,3 @@
 from .scheduler import RTPScheduler
-from .sources import AudioFile, DTMF, Tone
+from .shard import ShardedScheduler
+from .sources import AudioFile, DTMF, StreamingAudioFile, Tone
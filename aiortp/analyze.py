@@ -0,0 +1,160 @@
+"""Score a directory of captured calls in parallel.
+
+    aiortp-analyze captures/ -o summary.csv --workers 8
+
+Every pcap or rtpdump file under the given directories is read with
+``read_capture`` and each SSRC in it is scored with ``StreamStats``.
+Files are spread over a process pool in chunks, and the results are
+written as one table with a row per stream.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import fnmatch
+import os
+import sys
+import time
+
+import numpy as np
+
+from .capture import read_capture
+from .stats import StreamStats
+
+
+PATTERNS = ('*.pcap', '*.rtpdump')
+
+COLUMNS = ('path', 'ssrc', 'packets', 'duration', 'loss', 'duplicates',
+           'jitter_mean', 'jitter_max', 'delta_max', 'rms', 'level',
+           'codecs', 'error')
+
+
+def find_captures(paths, patterns=PATTERNS):
+    """Capture files under ``paths``, in a stable order."""
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append(path)
+            continue
+        for root, _, files in os.walk(path):
+            found.extend(os.path.join(root, name) for name in files
+                         if any(fnmatch.fnmatch(name, pattern)
+                                for pattern in patterns))
+    return sorted(found)
+
+
+def _row(path, ssrc, stats):
+    jitter = stats.jitter
+    return (path, ssrc, len(stats.packets), stats.duration.total_seconds(),
+            stats.loss, stats.duplicates,
+            float(np.mean(jitter)) if jitter.size else 0.0,
+            float(np.max(jitter)) if jitter.size else 0.0,
+            float(np.max(stats.deltas)) if stats.deltas.size else 0.0,
+            stats.rms, stats.level, ' '.join(stats.codecs), '')
+
+
+def _failed(path, ssrc, exc):
+    return (path, ssrc) + (None,) * (len(COLUMNS) - 3) + (repr(exc),)
+
+
+def analyze(path):
+    """Score one capture, returning a row per SSRC in it.
+
+    Errors are reported in the ``error`` column rather than raised, so
+    one bad file doesn't abort a run.
+    """
+    try:
+        batch = read_capture(path)
+    except Exception as exc:
+        return [_failed(path, None, exc)]
+
+    ssrcs = batch.headers['ssrc']
+    rows = []
+    for ssrc in np.unique(ssrcs).tolist():
+        try:
+            stats = StreamStats(batch[ssrcs == ssrc])
+        except Exception as exc:
+            rows.append(_failed(path, ssrc, exc))
+        else:
+            rows.append(_row(path, ssrc, stats))
+    return rows
+
+
+def summarize(paths, *, workers=None, chunksize=None):
+    """Score ``paths`` over ``workers`` processes.
+
+    Returns the table as a dict of columns. Without a ``chunksize``,
+    each worker gets about four chunks, which keeps the pool busy
+    without paying for a round trip per file.
+    """
+    workers = workers or os.cpu_count()
+    if workers == 1:
+        results = map(analyze, paths)
+    else:
+        chunksize = chunksize or max(1, len(paths) // (workers * 4))
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(analyze, paths,
+                                        chunksize=chunksize))
+
+    rows = [row for file_rows in results for row in file_rows]
+    return {column: [row[idx] for row in rows]
+            for idx, column in enumerate(COLUMNS)}
+
+
+def write_csv(table, output):
+    writer = csv.writer(output)
+    writer.writerow(COLUMNS)
+    writer.writerows(zip(*(table[column] for column in COLUMNS)))
+
+
+def write_parquet(table, path):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError('Parquet output needs pyarrow installed')
+    pyarrow.parquet.write_table(pyarrow.table(table), path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='aiortp-analyze',
+                                     description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='+',
+                        help='capture files or directories of them')
+    parser.add_argument('-o', '--output', default='-',
+                        help='where to write the table, default stdout')
+    parser.add_argument('-f', '--format', choices=('csv', 'parquet'),
+                        default='csv')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='worker processes, default one per CPU')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='files handed to a worker at a time')
+    parser.add_argument('--pattern', action='append', dest='patterns',
+                        help='file name patterns to look for in '
+                        'directories, default {}'.format(' '.join(PATTERNS)))
+    args = parser.parse_args(argv)
+
+    paths = find_captures(args.paths, args.patterns or PATTERNS)
+    start = time.perf_counter()
+    table = summarize(paths, workers=args.workers, chunksize=args.chunksize)
+    elapsed = time.perf_counter() - start
+
+    if args.format == 'parquet':
+        if args.output == '-':
+            parser.error('parquet output needs --output')
+        write_parquet(table, args.output)
+    elif args.output == '-':
+        write_csv(table, sys.stdout)
+    else:
+        with open(args.output, 'w', newline='') as output:
+            write_csv(table, output)
+
+    failed = sum(error != '' for error in table['error'])
+    print('Analysed {} calls ({} streams, {} failed) in {:.2f}s, '
+          '{:.1f} calls/s'.format(len(paths), len(table['path']), failed,
+                                  elapsed, len(paths) / max(elapsed, 1e-9)),
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+import hashlib
+import mmap
+import os
+import tempfile
+
+import sndfile
+
+from .codecs import get_codec
+
+
+def encode_file(filename, codec=0):
+    """Decode an audio file and encode it for the given payload type."""
+    encode = get_codec(codec).encode
+    audio = sndfile.open(filename)
+    try:
+        frames = audio.read_frames('h')
+    finally:
+        audio.close()
+    return encode(frames.tobytes())
+
+
+class PromptCache:
+    """Process-wide cache of encoded prompts.
+
+    Entries are keyed by path, modification time and codec, so editing a
+    file invalidates it. The least recently used entries are evicted once
+    ``max_bytes`` is exceeded. Sources only ever hold views of the cached
+    media, so playing a prompt to many calls shares one copy.
+
+    With ``directory``, encoded prompts are also written to disk and
+    memory-mapped, so a cold start skips the decoder too.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, *, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, filename, codec=0):
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_mtime_ns, codec)
+
+        media = self._entries.get(key)
+        if media is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return media
+
+        self.misses += 1
+        media = self._load(filename, key)
+        if len(media) <= self.max_bytes:
+            self._entries[key] = media
+            self.size += len(media)
+            self._evict()
+        return media
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            _, media = self._entries.popitem(last=False)
+            self.size -= len(media)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def _load(self, filename, key):
+        if not self.directory:
+            return encode_file(filename, key[2])
+
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        path = os.path.join(self.directory, '{}.{}'.format(digest, key[2]))
+        if not os.path.exists(path):
+            media = encode_file(filename, key[2])
+            fd, tmppath = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, 'wb') as tmpfile:
+                tmpfile.write(media)
+            os.replace(tmppath, path)
+
+        with open(path, 'rb') as cached:
+            if not os.fstat(cached.fileno()).st_size:
+                return b''
+            return mmap.mmap(cached.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+PROMPT_CACHE = PromptCache()
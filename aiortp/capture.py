@@ -0,0 +1,329 @@
+"""Record RTP streams to pcap or rtpdump files and read them back.
+
+``CaptureWriter`` collects datagrams on the event loop and hands them
+to a dedicated writer thread in batches, so disk latency never stalls
+packet handling and memory use stays bounded however long the capture
+runs. ``read_capture`` memory-maps a capture and returns an
+``RTPBatch`` whose payloads are views into the mapping.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import ipaddress
+import logging
+import mmap
+import struct
+
+import numpy as np
+
+from .packet import RTPBatch, rtphdr
+from .rtcp import is_rtcp
+
+
+LOG = logging.getLogger(__name__)
+
+PCAP = 'pcap'
+RTPDUMP = 'rtpdump'
+
+PCAP_MAGIC = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+SNAPLEN = 65535
+
+RTPDUMP_MAGIC = b'#!rtpplay1.0 '
+
+IPPROTO_UDP = 17
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+
+pcap_header = struct.Struct('IHHiIII')
+pcap_record = struct.Struct('IIII')
+ipv4_header = struct.Struct('!BBHHHBBH4s4s')
+ipv6_header = struct.Struct('!IHBB16s16s')
+udp_header = struct.Struct('!HHHH')
+rtpdump_header = struct.Struct('!IIIHH')
+rtpdump_record = struct.Struct('!HHI')
+
+
+def _checksum(header):
+    total = sum(struct.unpack('!{}H'.format(len(header) // 2), header))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def _address(addr):
+    return ipaddress.ip_address(addr[0]).packed, addr[1]
+
+
+def _udp_datagram(data, src, dst):
+    """Wrap ``data`` in the IP and UDP headers a raw pcap record needs."""
+    (src_ip, src_port), (dst_ip, dst_port) = _address(src), _address(dst)
+    length = udp_header.size + len(data)
+    udp = udp_header.pack(src_port, dst_port, length, 0)
+    if len(src_ip) == 4:
+        ip = ipv4_header.pack(0x45, 0, ipv4_header.size + length, 0, 0x4000,
+                              64, IPPROTO_UDP, 0, src_ip, dst_ip)
+        ip = ip[:10] + struct.pack('!H', _checksum(ip)) + ip[12:]
+    else:
+        ip = ipv6_header.pack(6 << 28, length, IPPROTO_UDP, 64, src_ip,
+                              dst_ip)
+    return ip + udp + data
+
+
+def _encode_pcap(records, state):
+    chunks = []
+    if not state:
+        state['started'] = True
+        chunks.append(pcap_header.pack(PCAP_MAGIC, 2, 4, 0, 0, SNAPLEN,
+                                       LINKTYPE_RAW))
+    for frametime, data, src, dst in records:
+        datagram = _udp_datagram(data, src, dst)
+        seconds = int(frametime)
+        chunks.append(pcap_record.pack(
+            seconds, int((frametime - seconds) * 1e6), len(datagram),
+            len(datagram)))
+        chunks.append(datagram)
+    return chunks
+
+
+def _encode_rtpdump(records, state):
+    chunks = []
+    if not state:
+        frametime, _, src, _ = records[0]
+        state['start'] = frametime
+        seconds = int(frametime)
+        address = ipaddress.ip_address(src[0])
+        chunks.append(RTPDUMP_MAGIC + '{}/{}\n'.format(
+            src[0], src[1]).encode())
+        chunks.append(rtpdump_header.pack(
+            seconds, int((frametime - seconds) * 1e6),
+            int(address) if address.version == 4 else 0, src[1], 0))
+    start = state['start']
+    for frametime, data, _, _ in records:
+        offset = max(0, int((frametime - start) * 1000))
+        chunks.append(rtpdump_record.pack(rtpdump_record.size + len(data),
+                                          len(data), offset & 0xffffffff))
+        chunks.append(data)
+    return chunks
+
+
+_ENCODERS = {PCAP: _encode_pcap, RTPDUMP: _encode_rtpdump}
+
+
+class CaptureWriter:
+    """Stream datagrams to a capture file off the event loop.
+
+    Datagrams are copied on ``write`` and passed to the writer thread
+    every ``batch_size`` packets or ``flush_interval`` seconds. When
+    more than ``max_pending`` batches are waiting on the disk, new
+    batches are dropped and counted in ``dropped`` rather than held in
+    memory.
+
+    rtpdump files record a single source address, taken from the first
+    packet.
+    """
+
+    def __init__(self, path, *, format=PCAP, batch_size=256,
+                 flush_interval=1.0, max_pending=64, loop=None):
+        if format not in _ENCODERS:
+            raise ValueError('Unknown capture format: {}'.format(format))
+
+        self.path = path
+        self.format = format
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self.closed = False
+        self._loop = loop or asyncio.get_event_loop()
+        self._encode = _ENCODERS[format]
+        self._state = {}
+        self._records = []
+        self._pending = 0
+        self._file = None
+        self._last = None
+        self._handle = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='aiortp-capture')
+
+    def write(self, frametime, data, src, dst):
+        if self.closed:
+            return
+        self._records.append((frametime, bytes(data), src, dst))
+        if len(self._records) >= self.batch_size:
+            self.flush()
+        elif self._handle is None:
+            self._handle = self._loop.call_later(self.flush_interval,
+                                                 self.flush)
+
+    def flush(self):
+        """Hand the collected datagrams to the writer thread.
+
+        Returns a future resolved once they, and everything written
+        before them, are on disk.
+        """
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+
+        records, self._records = self._records, []
+        if records:
+            if self._pending >= self.max_pending:
+                self.dropped += len(records)
+            else:
+                self._pending += 1
+                self._last = self._submit(self._write, records)
+        if self._last is None:
+            self._last = self._submit(lambda: None)
+        return self._last
+
+    def _submit(self, func, *args):
+        future = asyncio.wrap_future(self._executor.submit(func, *args),
+                                     loop=self._loop)
+        future.add_done_callback(self._written)
+        return future
+
+    def _written(self, future):
+        if not future.cancelled() and future.exception():
+            LOG.error('Failed to write capture %s', self.path,
+                      exc_info=future.exception())
+
+    def _write(self, records):
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'wb')
+            self._file.write(b''.join(self._encode(records, self._state)))
+            self.written += len(records)
+        finally:
+            self._loop.call_soon_threadsafe(self._done)
+
+    def _done(self):
+        self._pending -= 1
+
+    def _finish(self):
+        if self._file is not None:
+            self._file.close()
+        elif not self._state:
+            # Leave a valid, empty capture behind
+            with open(self.path, 'wb') as output:
+                if self.format == PCAP:
+                    output.write(b''.join(self._encode([], self._state)))
+
+    def close(self):
+        """Flush and close the file; returns an awaitable future."""
+        if self.closed:
+            return self._last
+        self.flush()
+        self.closed = True
+        self._last = self._submit(self._finish)
+        self._executor.shutdown(wait=False)
+        return self._last
+
+
+def _link_offset(linktype, data, offset):
+    """Offset of the UDP payload in a link-layer frame, or ``None``."""
+    if linktype == LINKTYPE_ETHERNET:
+        if data[offset + 12:offset + 14] == b'\x81\x00':
+            offset += 4
+        ethertype = struct.unpack_from('!H', data, offset + 12)[0]
+        if ethertype not in (ETHERTYPE_IPV4, ETHERTYPE_IPV6):
+            return None
+        offset += 14
+    elif linktype not in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        raise ValueError('Unsupported pcap link type: {}'.format(linktype))
+
+    version = data[offset] >> 4
+    if version == 4:
+        if data[offset + 9] != IPPROTO_UDP:
+            return None
+        offset += (data[offset] & 0xf) * 4
+    elif version == 6:
+        if data[offset + 6] != IPPROTO_UDP:
+            return None
+        offset += ipv6_header.size
+    else:
+        return None
+    return offset + udp_header.size
+
+
+def _pcap_records(data):
+    magic = struct.unpack_from('<I', data)[0]
+    if magic in (PCAP_MAGIC, PCAP_MAGIC_NS):
+        order = '<'
+    else:
+        order = '>'
+        magic = struct.unpack_from('>I', data)[0]
+        if magic not in (PCAP_MAGIC, PCAP_MAGIC_NS):
+            raise ValueError('Not a pcap file')
+    scale = 1e-9 if magic == PCAP_MAGIC_NS else 1e-6
+    header = struct.Struct(order + pcap_header.format)
+    record = struct.Struct(order + pcap_record.format)
+    linktype = header.unpack_from(data)[6] & 0xffff
+
+    offset = header.size
+    while offset + record.size <= len(data):
+        seconds, fraction, length, _ = record.unpack_from(data, offset)
+        offset += record.size
+        end = offset + length
+        if end > len(data):
+            break
+        start = _link_offset(linktype, data, offset)
+        if start is not None and start < end:
+            yield seconds + fraction * scale, start, end
+        offset = end
+
+
+def _rtpdump_records(data):
+    offset = data.find(b'\n') + 1
+    seconds, useconds = rtpdump_header.unpack_from(data, offset)[:2]
+    start = seconds + useconds * 1e-6
+    offset += rtpdump_header.size
+    while offset + rtpdump_record.size <= len(data):
+        length, size, ms = rtpdump_record.unpack_from(data, offset)
+        if length < rtpdump_record.size:
+            break
+        # A zero plen marks an RTCP record
+        if size:
+            body = offset + rtpdump_record.size
+            yield start + ms * 0.001, body, min(body + size, len(data))
+        offset += length
+
+
+def read_capture(path, *, ssrc=None):
+    """Read the RTP packets in a pcap or rtpdump file as an ``RTPBatch``.
+
+    The file is memory-mapped; payloads are views into the mapping, which
+    stays open while any of them is alive. RTCP and non-UDP packets are
+    skipped, as are packets from other sources when ``ssrc`` is given.
+    """
+    with open(path, 'rb') as capture:
+        try:
+            data = mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            return RTPBatch.parse_many([])
+
+    if data[:len(RTPDUMP_MAGIC)] == RTPDUMP_MAGIC:
+        records = _rtpdump_records(data)
+    elif len(data) >= pcap_header.size:
+        records = _pcap_records(data)
+    else:
+        raise ValueError('{} is not a pcap or rtpdump file'.format(path))
+
+    view = memoryview(data)
+    frametimes, datagrams = [], []
+    for frametime, start, end in records:
+        datagram = view[start:end]
+        if len(datagram) < rtphdr.size or is_rtcp(datagram):
+            continue
+        frametimes.append(frametime)
+        datagrams.append(datagram)
+
+    batch = RTPBatch.parse_many(datagrams, np.array(frametimes))
+    if ssrc is not None:
+        batch = batch[batch.headers['ssrc'] == ssrc]
+    return batch
@@ -0,0 +1,83 @@
+from collections import deque
+
+
+UNBOUNDED = 'unbounded'
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+LATEST = 'latest'
+
+POLICIES = (UNBOUNDED, DROP_OLDEST, DROP_NEWEST, LATEST)
+
+
+class PacketQueue:
+    """Packet delivery queue with a configurable overflow policy.
+
+    ``drop-oldest`` and ``drop-newest`` bound the queue to ``maxsize``
+    entries, discarding from the head or rejecting the incoming packet
+    respectively. ``latest`` only ever holds the most recent packet.
+    Discarded packets are counted in ``dropped``.
+    """
+
+    def __init__(self, policy=DROP_OLDEST, maxsize=1000, *, loop):
+        if policy not in POLICIES:
+            raise ValueError('Unknown delivery policy: {}'.format(policy))
+        if policy == LATEST:
+            maxsize = 1
+        elif policy == UNBOUNDED:
+            maxsize = None
+        elif maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+
+        self.policy = policy
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = deque()
+        self._getters = deque()
+        self._loop = loop
+
+    def __len__(self):
+        return len(self._items)
+
+    def qsize(self):
+        return len(self._items)
+
+    def put_nowait(self, item):
+        if self.maxsize and len(self._items) >= self.maxsize:
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return
+            self._items.popleft()
+
+        self._items.append(item)
+        self._wakeup_next()
+
+    async def _wait(self):
+        while not self._items:
+            waiter = self._loop.create_future()
+            self._getters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                waiter.cancel()
+                if self._items and not waiter.cancelled():
+                    self._wakeup_next()
+                raise
+
+    def _wakeup_next(self):
+        while self._getters:
+            waiter = self._getters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    async def get(self):
+        await self._wait()
+        return self._items.popleft()
+
+    async def get_batch(self, max_items=None):
+        """Wait for at least one packet, then drain up to ``max_items``."""
+        await self._wait()
+        count = len(self._items)
+        if max_items:
+            count = min(count, max_items)
+        return [self._items.popleft() for _ in range(count)]
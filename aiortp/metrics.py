@@ -0,0 +1,109 @@
+import bisect
+import typing
+
+
+class Histogram:
+    """Fixed-bucket histogram, cumulative in the Prometheus sense."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def cumulative(self):
+        """Return ``(upper_bound, count)`` pairs, ending with ``inf``."""
+        total = 0
+        bounds = self.buckets + (float('inf'),)
+        result = []
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+
+class Metric(typing.NamedTuple):
+    name: str
+    kind: str
+    help: str
+    value: typing.Any
+    labels: typing.Tuple[typing.Tuple[str, str], ...] = ()
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join('{}="{}"'.format(name, _escape(value))
+                                    for name, value in labels))
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value)
+
+
+def snapshot(metrics):
+    """Flatten metrics into a dict keyed by name and labels.
+
+    Histograms become dicts of ``count``, ``sum``, ``max`` and cumulative
+    ``buckets``.
+    """
+    result = {}
+    for metric in metrics:
+        value = metric.value
+        if metric.kind == HISTOGRAM:
+            value = {'count': value.count, 'sum': value.sum,
+                     'max': value.max, 'buckets': value.cumulative()}
+        result[metric.name + _labels(metric.labels)] = value
+    return result
+
+
+def prometheus(metrics):
+    """Render metrics in the Prometheus text exposition format."""
+    families = {}
+    for metric in metrics:
+        families.setdefault(metric.name, []).append(metric)
+
+    lines = []
+    for name, family in families.items():
+        lines.append('# HELP {} {}'.format(name, family[0].help))
+        lines.append('# TYPE {} {}'.format(name, family[0].kind))
+        for metric in family:
+            if metric.kind != HISTOGRAM:
+                lines.append('{}{} {}'.format(name, _labels(metric.labels),
+                                              _number(metric.value)))
+                continue
+
+            for bound, count in metric.value.cumulative():
+                labels = metric.labels + (('le', _number(bound)),)
+                lines.append('{}_bucket{} {}'.format(name, _labels(labels),
+                                                     count))
+            labels = _labels(metric.labels)
+            lines.append('{}_sum{} {}'.format(name, labels,
+                                              _number(metric.value.sum)))
+            lines.append('{}_count{} {}'.format(name, labels,
+                                                metric.value.count))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,252 @@
+"""Batched datagram I/O through Linux's sendmmsg(2) and recvmmsg(2).
+
+Everything here degrades to plain per-datagram calls when the platform
+does not provide the syscalls.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import socket
+import struct
+
+
+LOG = logging.getLogger(__name__)
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(iovec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', msghdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+def _load_libc():
+    try:
+        return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except OSError:  # pragma: no cover
+        return None
+
+
+_libc = _load_libc()
+_sendmmsg = getattr(_libc, 'sendmmsg', None)
+if _sendmmsg:
+    _sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr),
+                          ctypes.c_uint, ctypes.c_int]
+    _sendmmsg.restype = ctypes.c_int
+
+_recvmmsg = getattr(_libc, 'recvmmsg', None)
+if _recvmmsg:
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr),
+                          ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    _recvmmsg.restype = ctypes.c_int
+
+HAVE_SENDMMSG = _sendmmsg is not None
+HAVE_RECVMMSG = _recvmmsg is not None
+
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0x40)
+SOCKADDR_SIZE = 128
+
+
+def sockaddr(addr):
+    """Encode a numeric ``(host, port)`` as a ``struct sockaddr`` buffer."""
+    host, port = addr[:2]
+    if ':' in host:
+        raw = (struct.pack('=H', socket.AF_INET6) + struct.pack('!HI', port, 0)
+               + socket.inet_pton(socket.AF_INET6, host)
+               + struct.pack('=I', 0))
+    else:
+        raw = (struct.pack('=H', socket.AF_INET) + struct.pack('!H', port)
+               + socket.inet_aton(host) + bytes(8))
+    return ctypes.create_string_buffer(raw, len(raw))
+
+
+def parse_sockaddr(raw):
+    family, = struct.unpack_from('=H', raw)
+    port, = struct.unpack_from('!H', raw, 2)
+    if family == socket.AF_INET6:
+        return socket.inet_ntop(socket.AF_INET6, raw[8:24]), port
+    return socket.inet_ntoa(raw[4:8]), port
+
+
+def _buffer_address(data):
+    """Return the address and size of ``data``, and the object owning it.
+
+    ctypes can't address read-only buffers other than ``bytes``, such as
+    views of a cached prompt, so those are copied. Keep the owner alive
+    while the address is in use.
+    """
+    if not isinstance(data, bytes):
+        view = memoryview(data)
+        if not view.readonly:
+            return ctypes.addressof(
+                (ctypes.c_char * view.nbytes).from_buffer(view)), \
+                view.nbytes, data
+        data = view.tobytes()
+    return (ctypes.cast(ctypes.c_char_p(data), ctypes.c_void_p).value,
+            len(data), data)
+
+
+class BatchSender:
+    """Collect datagrams during a tick and flush them per socket.
+
+    Datagrams for the same socket go out in one ``sendmmsg`` call. Any
+    datagram that can't be written directly, because the transport
+    already has data buffered, the platform lacks ``sendmmsg``, or the
+    kernel refuses part of the batch, goes through ``transport.sendto``
+    instead. Ordering per transport is preserved.
+
+    Transports that share a socket expose it as ``endpoint`` and their
+    destination as ``sockaddr``, so all their datagrams can be batched
+    together.
+    """
+
+    def __init__(self, max_batch=1024):
+        self.max_batch = max_batch
+        self.syscalls = 0
+        self.datagrams = 0
+        self._pending = {}
+        self._msgs = (mmsghdr * max_batch)()
+        self._iovs = (iovec * max_batch)()
+        for msg, iov in zip(self._msgs, self._iovs):
+            msg.msg_hdr.msg_iov = ctypes.pointer(iov)
+            msg.msg_hdr.msg_iovlen = 1
+
+    def add(self, transport, data):
+        key = getattr(transport, 'endpoint', transport)
+        try:
+            self._pending[key].append((transport, data))
+        except KeyError:
+            self._pending[key] = [(transport, data)]
+
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        for key, datagrams in pending.items():
+            sent = 0
+            sock = key.get_extra_info('socket')
+            if (HAVE_SENDMMSG and sock is not None
+                    and not key.get_write_buffer_size()):
+                sent = self._sendmmsg(sock.fileno(), datagrams)
+
+            for transport, data in datagrams[sent:]:
+                self.syscalls += 1
+                transport.sendto(data)
+            self.datagrams += len(datagrams)
+
+    def _sendmmsg(self, fd, datagrams):
+        total = 0
+        while total < len(datagrams):
+            chunk = datagrams[total:total + self.max_batch]
+            owners = []
+            for msg, iov, (transport, data) in zip(self._msgs, self._iovs,
+                                                   chunk):
+                iov.iov_base, iov.iov_len, owner = _buffer_address(data)
+                owners.append(owner)
+                name = getattr(transport, 'sockaddr', None)
+                if name is None:
+                    msg.msg_hdr.msg_name = None
+                    msg.msg_hdr.msg_namelen = 0
+                else:
+                    msg.msg_hdr.msg_name = ctypes.addressof(name)
+                    msg.msg_hdr.msg_namelen = len(name)
+
+            self.syscalls += 1
+            sent = _sendmmsg(fd, self._msgs, len(chunk), 0)
+            if sent < 0:
+                err = ctypes.get_errno()
+                if err not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    LOG.debug('sendmmsg failed: %s', os.strerror(err))
+                break
+
+            total += sent
+            if sent < len(chunk):
+                break
+        return total
+
+
+class BatchReceiver:
+    """Drain up to ``max_batch`` datagrams from a socket per call.
+
+    Uses ``recvmmsg`` into a preallocated buffer pool when available,
+    otherwise loops over ``recvfrom``.
+    """
+
+    def __init__(self, sock, max_batch=64, bufsize=2048):
+        self.sock = sock
+        self.max_batch = max_batch
+        self.bufsize = bufsize
+        self.syscalls = 0
+        self.datagrams = 0
+
+        self._pool = bytearray(max_batch * bufsize)
+        self._names = ctypes.create_string_buffer(max_batch * SOCKADDR_SIZE)
+        self._msgs = (mmsghdr * max_batch)()
+        self._iovs = (iovec * max_batch)()
+
+        self._view = memoryview(self._pool)
+        self._pool_ref = (ctypes.c_char * len(self._pool)).from_buffer(
+            self._pool)
+        pool = ctypes.addressof(self._pool_ref)
+        names = ctypes.addressof(self._names)
+        for idx, (msg, iov) in enumerate(zip(self._msgs, self._iovs)):
+            iov.iov_base = pool + idx * bufsize
+            iov.iov_len = bufsize
+            msg.msg_hdr.msg_iov = ctypes.pointer(iov)
+            msg.msg_hdr.msg_iovlen = 1
+            msg.msg_hdr.msg_name = names + idx * SOCKADDR_SIZE
+
+    def receive(self):
+        """Return a list of ``(data, addr)`` pairs, possibly empty."""
+        if not HAVE_RECVMMSG:
+            return self._receive_fallback()
+
+        for msg in self._msgs:
+            msg.msg_hdr.msg_namelen = SOCKADDR_SIZE
+
+        self.syscalls += 1
+        count = _recvmmsg(self.sock.fileno(), self._msgs, self.max_batch,
+                          MSG_DONTWAIT, None)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                raise OSError(err, os.strerror(err))
+            return []
+
+        view = self._view
+        result = []
+        for idx in range(count):
+            msg = self._msgs[idx]
+            offset = idx * self.bufsize
+            data = bytes(view[offset:offset + msg.msg_len])
+            name = ctypes.string_at(msg.msg_hdr.msg_name,
+                                    msg.msg_hdr.msg_namelen)
+            result.append((data, parse_sockaddr(name)))
+
+        self.datagrams += count
+        return result
+
+    def _receive_fallback(self):
+        result = []
+        for _ in range(self.max_batch):
+            self.syscalls += 1
+            try:
+                data, addr = self.sock.recvfrom(self.bufsize)
+            except (BlockingIOError, InterruptedError):
+                break
+            result.append((data, addr[:2]))
+        self.datagrams += len(result)
+        return result
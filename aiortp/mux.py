@@ -0,0 +1,203 @@
+import logging
+import socket
+import struct
+
+from .mmsg import BatchReceiver, sockaddr
+from .packet import rtphdr
+from .rtcp import is_rtcp
+
+
+LOG = logging.getLogger(__name__)
+
+LATCH_AFTER = 4
+
+# An RTCP packet's sender SSRC follows a 4 byte header
+RTCP_MIN_SIZE = 8
+
+
+class SharedTransport:
+    """Datagram transport for one stream multiplexed on a shared socket."""
+
+    def __init__(self, endpoint, remote_addr, protocol):
+        self.endpoint = endpoint
+        self.remote_addr = remote_addr
+        self.protocol = protocol
+        self.sockaddr = sockaddr(remote_addr)
+        self.ssrcs = set()
+        self._closed = False
+
+    def sendto(self, data, addr=None):
+        self.endpoint.sendto(data, addr or self.remote_addr)
+
+    def get_extra_info(self, name, default=None):
+        if name == 'peername':
+            return self.remote_addr
+        return self.endpoint.get_extra_info(name, default)
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def is_closing(self):
+        return self._closed
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.endpoint.unregister(self)
+        self.protocol.connection_lost(None)
+
+
+class SharedEndpoint:
+    """A UDP socket serving many streams.
+
+    Incoming datagrams are drained in batches with ``recvmmsg`` and routed
+    to the stream registered for their source address. SSRCs are learned
+    only from a stream's negotiated address. When a known SSRC arrives
+    from elsewhere (NAT rebinding, for instance), the stream latches on
+    to the new address after ``latch_after`` packets in a row from it,
+    with nothing from the old address in between, and sends there from
+    then on. Datagrams from unknown or not yet latched sources are
+    counted in ``unmatched``, malformed ones in ``invalid``.
+    """
+
+    def __init__(self, local_addr, *, loop, max_batch=64, bufsize=2048,
+                 latch_after=LATCH_AFTER, on_close=None):
+        family = socket.AF_INET6 if ':' in local_addr[0] else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.sock.bind(local_addr)
+
+        self.latch_after = latch_after
+        self.unmatched = 0
+        self.invalid = 0
+        self.send_errors = 0
+        self._receiver = BatchReceiver(self.sock, max_batch, bufsize)
+        self._by_addr = {}
+        self._by_ssrc = {}
+        self._latching = {}
+        self._on_close = on_close
+        self._loop = loop
+        self._loop.add_reader(self.sock.fileno(), self._drain)
+
+    def __len__(self):
+        return len(self._by_addr)
+
+    def get_extra_info(self, name, default=None):
+        if name == 'socket':
+            return self.sock
+        if name == 'sockname':
+            return self.sock.getsockname()
+        return default
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def register(self, remote_addr, protocol):
+        transport = SharedTransport(self, tuple(remote_addr), protocol)
+        previous = self._by_addr.get(transport.remote_addr)
+        if previous:
+            # Replace without letting the endpoint close underneath us
+            self._forget(previous)
+            previous._closed = True
+            previous.protocol.connection_lost(None)
+
+        self._by_addr[transport.remote_addr] = transport
+        protocol.connection_made(transport)
+        return transport
+
+    def _forget(self, transport):
+        if self._by_addr.get(transport.remote_addr) is transport:
+            del self._by_addr[transport.remote_addr]
+        for ssrc in transport.ssrcs:
+            if self._by_ssrc.get(ssrc) is transport:
+                del self._by_ssrc[ssrc]
+            self._latching.pop(ssrc, None)
+        transport.ssrcs.clear()
+
+    def _learn(self, transport, ssrc):
+        owner = self._by_ssrc.get(ssrc)
+        if owner is not None:
+            owner.ssrcs.discard(ssrc)
+        self._by_ssrc[ssrc] = transport
+        transport.ssrcs.add(ssrc)
+
+    def _latch(self, transport, ssrc, addr):
+        """Count a packet from ``addr``; move ``transport`` there once
+        ``latch_after`` have arrived in a row."""
+        previous = self._latching.get(ssrc)
+        count = previous[1] + 1 if previous and previous[0] == addr else 1
+        if count < self.latch_after:
+            self._latching[ssrc] = addr, count
+            return False
+
+        del self._latching[ssrc]
+        LOG.info('Stream for %s latched on to %s', transport.remote_addr,
+                 addr)
+        if self._by_addr.get(transport.remote_addr) is transport:
+            del self._by_addr[transport.remote_addr]
+        transport.remote_addr = addr
+        transport.sockaddr = sockaddr(addr)
+        self._by_addr[addr] = transport
+        return True
+
+    def unregister(self, transport):
+        self._forget(transport)
+        if not self._by_addr:
+            self.close()
+
+    def sendto(self, data, addr):
+        try:
+            self.sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            self.send_errors += 1
+        except OSError as exc:
+            self.send_errors += 1
+            transport = self._by_addr.get(addr)
+            if transport:
+                transport.protocol.error_received(exc)
+
+    def _drain(self):
+        try:
+            datagrams = self._receiver.receive()
+        except OSError as exc:
+            LOG.warning('Shared endpoint receive failed: %s', exc)
+            return
+
+        for data, addr in datagrams:
+            rtcp = is_rtcp(data)
+            if (len(data) < (RTCP_MIN_SIZE if rtcp else rtphdr.size)
+                    or data[0] >> 6 != 2):
+                self.invalid += 1
+                continue
+
+            ssrc = data[4:8] if rtcp else data[8:12]
+            transport = self._by_addr.get(addr)
+            if transport:
+                if ssrc not in transport.ssrcs:
+                    self._learn(transport, ssrc)
+                if self._latching:
+                    # The peer is still heard where it was negotiated
+                    self._latching.pop(ssrc, None)
+            else:
+                transport = self._by_ssrc.get(ssrc)
+                if not transport or not self._latch(transport, ssrc, addr):
+                    self.unmatched += 1
+                    continue
+
+            try:
+                transport.protocol.datagram_received(data, addr)
+            except (ValueError, struct.error) as exc:
+                self.invalid += 1
+                LOG.debug('Dropped a malformed datagram from %s: %s', addr,
+                          exc)
+            except Exception:
+                LOG.exception('Failed to handle a datagram from %s', addr)
+
+    def close(self):
+        if self.sock.fileno() < 0:
+            return
+        self._loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        if self._on_close:
+            self._on_close(self)
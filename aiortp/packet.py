@@ -1,11 +1,41 @@
 # cython: linetrace=True
+from collections.abc import Sequence
+import itertools
 import struct
 import typing
 
+import numpy as np
+
 
 rtphdr = struct.Struct('!HHII')
+rtp_seq_timestamp = struct.Struct('!HI')
 rtpevent = struct.Struct('!BBH')
 
+# Wire layout of the fixed RTP header, and the unpacked, native-endian
+# record layout used for batches of packets.
+rtphdr_wire = np.dtype([('flags', '>u2'), ('seq', '>u2'),
+                        ('timestamp', '>u4'), ('ssrc', '>u4')])
+rtpbatch = np.dtype([
+    ('frametime', 'f8'),
+    ('version', 'u1'),
+    ('padding', 'u1'),
+    ('ext', 'u1'),
+    ('csrc_items', 'u1'),
+    ('marker', 'u1'),
+    ('p_type', 'u1'),
+    ('seq', 'u2'),
+    ('timestamp', 'u4'),
+    ('ssrc', 'u4'),
+])
+
+
+def _as_buffer(payload):
+    # Payloads are usually bytes-like already; structured payloads such
+    # as RTPEvent need serializing first.
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        return payload
+    return bytes(payload)
+
 
 class RTP(typing.NamedTuple):
     version: int = 2
@@ -35,19 +65,64 @@ class RTP(typing.NamedTuple):
             payload=data[rtphdr.size:]
         )
 
+    def _flags(self):
+        return ((self.version & 0x3) << 14
+                | (self.padding & 0x1) << 13
+                | (self.ext & 0x1) << 12
+                | (self.csrc_items & 0xF) << 8
+                | (self.marker & 0x1) << 7
+                | (self.p_type & 0x7f))
+
     def __bytes__(self):
-        header = rtphdr.pack(
-            (self.version & 0x3) << 14
-            | (self.padding & 0x1) << 13
-            | (self.ext & 0x1) << 12
-            | (self.csrc_items & 0xF) << 8
-            | (self.marker & 0x1) << 7
-            | (self.p_type & 0x7f),
-            self.seq,
-            self.timestamp,
-            self.ssrc
-        )
-        return b''.join([header, bytes(self.payload)])
+        header = rtphdr.pack(self._flags(), self.seq, self.timestamp,
+                             self.ssrc)
+        return b''.join([header, _as_buffer(self.payload)])
+
+    def pack_into(self, buffer, offset=0):
+        """Serialize into ``buffer`` at ``offset``, returning the length.
+
+        ``buffer`` must be a writable buffer with room for the packet.
+        """
+        payload = _as_buffer(self.payload)
+        end = offset + rtphdr.size + len(payload)
+        if end > len(buffer):
+            raise ValueError('buffer too small for packet')
+        rtphdr.pack_into(buffer, offset, self._flags(), self.seq,
+                         self.timestamp, self.ssrc)
+        buffer[offset + rtphdr.size:end] = payload
+        return end - offset
+
+
+class RTPTemplate:
+    """Reusable send buffer for one stream's packets.
+
+    The constant header fields are written once. ``render`` patches in
+    the marker, sequence number and timestamp, copies the payload after
+    the header and returns a view of the finished datagram, which is
+    only valid until the next ``render``.
+    """
+
+    __slots__ = ('p_type', 'buffer', '_view')
+
+    def __init__(self, p_type, ssrc, *, size=1500):
+        self.p_type = p_type & 0x7f
+        self.buffer = bytearray(max(size, rtphdr.size))
+        rtphdr.pack_into(self.buffer, 0, RTP(p_type=p_type)._flags(), 0, 0,
+                         ssrc)
+        self._view = memoryview(self.buffer)
+
+    def render(self, seq, timestamp, payload, marker=False):
+        end = rtphdr.size + len(payload)
+        if end > len(self.buffer):
+            buffer = bytearray(end)
+            buffer[:rtphdr.size] = self.buffer[:rtphdr.size]
+            self.buffer, self._view = buffer, memoryview(buffer)
+
+        buffer = self.buffer
+        buffer[1] = self.p_type | 0x80 if marker else self.p_type
+        rtp_seq_timestamp.pack_into(buffer, 2, seq, timestamp)
+        buffer[rtphdr.size:end] = payload
+        return self._view[:end]
 
 
 class RTPEvent(typing.NamedTuple):
@@ -76,3 +151,98 @@ class RTPEvent(typing.NamedTuple):
             | (self.volume & 0x3f),
             self.duration
         )
+
+
+class PacketData(typing.NamedTuple):
+    frametime: float
+    packet: RTP
+
+
+class RTPBatch(Sequence):
+    """A batch of RTP packets stored as a structured NumPy array.
+
+    Headers live in ``headers``, a record array of ``rtpbatch``, while
+    ``payloads`` holds one buffer per packet. Indexing with an integer
+    returns a ``PacketData``; slices and masks return a new batch.
+    """
+
+    def __init__(self, headers, payloads):
+        if len(headers) != len(payloads):
+            raise ValueError('headers and payloads differ in length')
+        self.headers = headers
+        self.payloads = payloads
+
+    @classmethod
+    def parse_many(cls, buffers, frametimes=None):
+        """Decode many RTP datagrams at once.
+
+        Payloads are zero-copy ``memoryview`` slices of the input buffers.
+        """
+        views = [memoryview(buf) for buf in buffers]
+        if any(view.nbytes < rtphdr.size for view in views):
+            raise ValueError('buffer too short for an RTP header')
+
+        raw = b''.join(view[:rtphdr.size] for view in views)
+        wire = np.frombuffer(raw, dtype=rtphdr_wire)
+        flags = wire['flags']
+
+        headers = np.zeros(len(views), dtype=rtpbatch)
+        headers['version'] = (flags >> 14) & 0x3
+        headers['padding'] = (flags >> 13) & 0x1
+        headers['ext'] = (flags >> 12) & 0x1
+        headers['csrc_items'] = (flags >> 8) & 0xF
+        headers['marker'] = (flags >> 7) & 0x1
+        headers['p_type'] = flags & 0x7f
+        headers['seq'] = wire['seq']
+        headers['timestamp'] = wire['timestamp']
+        headers['ssrc'] = wire['ssrc']
+        if frametimes is not None:
+            headers['frametime'] = frametimes
+
+        return cls(headers, [view[rtphdr.size:] for view in views])
+
+    @classmethod
+    def from_packets(cls, packets):
+        """Build a batch from an iterable of ``PacketData``."""
+        packets = list(packets)
+        headers = np.zeros(len(packets), dtype=rtpbatch)
+        for idx, (frametime, packet) in enumerate(packets):
+            headers[idx] = (frametime, packet.version, packet.padding,
+                            packet.ext, packet.csrc_items, packet.marker,
+                            packet.p_type, packet.seq, packet.timestamp,
+                            packet.ssrc)
+        return cls(headers, [packet.payload for _, packet in packets])
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            header = self.headers[index]
+            return PacketData(
+                frametime=float(header['frametime']),
+                packet=RTP(
+                    version=int(header['version']),
+                    padding=int(header['padding']),
+                    ext=int(header['ext']),
+                    csrc_items=int(header['csrc_items']),
+                    marker=int(header['marker']),
+                    p_type=int(header['p_type']),
+                    seq=int(header['seq']),
+                    timestamp=int(header['timestamp']),
+                    ssrc=int(header['ssrc']),
+                    payload=self.payloads[index]
+                )
+            )
+
+        if isinstance(index, slice):
+            return type(self)(self.headers[index], self.payloads[index])
+
+        index = np.asarray(index)
+        if index.dtype == bool:
+            payloads = list(itertools.compress(self.payloads, index.tolist()))
+            index = np.flatnonzero(index)
+        else:
+            payloads = [self.payloads[i] for i in index.tolist()]
+        # take() is much faster than fancy indexing on packed records
+        return type(self)(self.headers.take(index), payloads)
+
+    def __len__(self):
+        return len(self.headers)
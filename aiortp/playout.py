@@ -0,0 +1,220 @@
+import asyncio
+import math
+import typing
+
+import numpy as np
+
+from .codecs import CODECS
+from .stats import LiveStats, RTP_MAX_SEQ
+
+
+SILENCE = 'silence'
+REPEAT = 'repeat'
+
+
+class Frame(typing.NamedTuple):
+    seq: typing.Optional[int]
+    timestamp: typing.Optional[int]
+    payload: typing.Optional[bytes]
+    concealed: bool
+
+
+class PlayoutBuffer:
+    """Adaptive playout buffer for received media.
+
+    Packets are reordered by extended sequence number and released one
+    per ``ptime``. A frame that hasn't arrived by its turn is concealed,
+    with silence, a repeat of the previous frame, or ``None`` if
+    ``conceal`` is unset, and counted as lost. Frames with no sequence
+    number are filler, played while the buffer (re)fills.
+
+    The target delay is ``ptime`` plus four times the measured jitter,
+    clamped to ``[min_delay, max_delay]`` milliseconds. The buffer grows
+    towards it by rebuffering after an underrun and shrinks by
+    discarding a frame per tick while it runs too deep.
+    """
+
+    def __init__(self, ptime=20, *, stats=None, min_delay=40, max_delay=400,
+                 conceal=SILENCE, loop):
+        if conceal not in (None, SILENCE, REPEAT):
+            raise ValueError('Unknown concealment: {}'.format(conceal))
+        if not 0 < min_delay <= max_delay:
+            raise ValueError('Need 0 < min_delay <= max_delay')
+
+        self.ptime = ptime
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.conceal = conceal
+        self.played = 0
+        self.lost = 0
+        self.late = 0
+        self.duplicates = 0
+        self.underruns = 0
+        self.discarded = 0
+
+        # Measure jitter ourselves unless the caller already does
+        self.stats = stats
+        self._update_stats = stats is None
+        if stats is None:
+            self.stats = LiveStats()
+
+        self._capacity = math.ceil(max_delay / ptime)
+        self._packets = {}
+        self._next = None
+        self._highest = None
+        self._last = None
+        self._last_seq = None
+        self._silence = {}
+        self._buffering = True
+        self._closed = False
+        self._waiter = None
+        self._loop = loop
+
+    def __len__(self):
+        return len(self._packets)
+
+    @property
+    def target_delay(self):
+        """Target playout delay in milliseconds."""
+        jitter = self.stats.jitter / self.stats.clock_rate * 1000
+        return min(max(self.ptime + 4 * jitter, self.min_delay),
+                   self.max_delay)
+
+    @property
+    def target_depth(self):
+        return math.ceil(self.target_delay / self.ptime)
+
+    @property
+    def depth(self):
+        """Frames between the playout point and the newest packet."""
+        if self._next is None:
+            return 0
+        return max(0, self._highest - self._next + 1)
+
+    def _extend(self, seq):
+        delta = (seq - self._highest) & RTP_MAX_SEQ
+        if delta < 0x8000:
+            return self._highest + delta
+        return self._highest - (0x10000 - delta)
+
+    def push(self, frametime, packet):
+        if self._closed:
+            return
+        if self._update_stats:
+            self.stats.update(frametime, packet)
+
+        if self._next is None:
+            seq = self._next = self._highest = packet.seq
+        else:
+            seq = self._extend(packet.seq)
+            if seq < self._next:
+                self.late += 1
+                return
+            if seq in self._packets:
+                self.duplicates += 1
+                return
+            if seq - self._next >= self._capacity:
+                self._skip_to(seq - self._capacity + 1)
+            self._highest = max(self._highest, seq)
+
+        self._packets[seq] = packet
+        self._wakeup()
+
+    def _skip_to(self, seq):
+        self.discarded += seq - self._next
+        for stale in range(self._next, seq):
+            self._packets.pop(stale, None)
+        self._next = seq
+
+    def _wakeup(self):
+        if self._waiter and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def close(self):
+        self._closed = True
+        self._wakeup()
+
+    def _fill(self, seq):
+        last = self._last
+        if seq is None or last is None:
+            timestamp = None
+        else:
+            samples = self.stats.clock_rate * self.ptime // 1000
+            timestamp = (last.timestamp + samples * (seq - self._last_seq)) \
+                & 0xFFFFFFFF
+            seq &= RTP_MAX_SEQ
+
+        payload = None
+        if last is not None and self.conceal == REPEAT:
+            payload = last.payload
+        elif last is not None and self.conceal == SILENCE:
+            payload = self._silence_for(last)
+        return Frame(seq, timestamp, payload, True)
+
+    def _silence_for(self, packet):
+        key = packet.p_type, len(packet.payload)
+        try:
+            return self._silence[key]
+        except KeyError:
+            pass
+
+        codec = CODECS.get(packet.p_type)
+        if codec:
+            # G.711 carries one byte per sample
+            silence = codec.encode(np.zeros(len(packet.payload),
+                                            dtype=np.int16))
+        else:
+            silence = bytes(len(packet.payload))
+        self._silence[key] = silence
+        return silence
+
+    def tick(self):
+        """Release the next frame, or ``None`` once closed and drained."""
+        depth = self.depth
+        if not depth:
+            if self._closed:
+                return None
+            if not self._buffering:
+                self.underruns += 1
+                self._buffering = True
+            return self._fill(None)
+
+        if self._buffering:
+            if depth < self.target_depth and not self._closed:
+                return self._fill(None)
+            self._buffering = False
+        elif depth > self.target_depth + 1:
+            self._skip_to(self._next + 1)
+
+        seq = self._next
+        self._next += 1
+        packet = self._packets.pop(seq, None)
+        if packet is None:
+            self.lost += 1
+            return self._fill(seq)
+
+        self.played += 1
+        self._last, self._last_seq = packet, seq
+        return Frame(packet.seq, packet.timestamp, packet.payload, False)
+
+    async def frames(self):
+        """Yield a ``Frame`` every ``ptime`` until the buffer is closed."""
+        while self._next is None and not self._closed:
+            self._waiter = self._loop.create_future()
+            await self._waiter
+
+        interval = self.ptime / 1000
+        deadline = self._loop.time()
+        while True:
+            frame = self.tick()
+            if frame is None:
+                return
+            yield frame
+
+            deadline += interval
+            delay = deadline - self._loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay > self.max_delay / 1000:
+                # The consumer fell far behind; don't burst to catch up
+                deadline = self._loop.time()
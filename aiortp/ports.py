@@ -0,0 +1,160 @@
+"""Even RTP ports from a range, handed out as pre-bound sockets.
+
+``PortAllocator`` keeps a small pool of sockets that are already bound
+and tuned, so setting up a call takes a socket off a deque instead of
+creating and binding one. Released ports sit out a quarantine period
+before they are reused, so stray packets for the last call on a port
+don't land in the next one. Each even RTP port is bound together with
+the odd RTCP port after it, so the pair is always available together.
+"""
+import collections
+import errno
+import logging
+import socket
+import time
+
+
+LOG = logging.getLogger(__name__)
+
+PORT_RANGE = (16384, 32768)
+
+DSCP_EF = 46
+
+
+class PortAllocator:
+    """Allocate even/odd UDP port pairs in ``[start, stop)`` on ``host``.
+
+    Up to ``pool_size`` socket pairs are bound ahead of time, with
+    ``SO_RCVBUF``/``SO_SNDBUF`` set to ``rcvbuf``/``sndbuf`` and the
+    DSCP field of outgoing packets to ``dscp`` when given. Ports that
+    another process already holds are skipped and retried later.
+    """
+
+    def __init__(self, host='0.0.0.0', port_range=PORT_RANGE, *,
+                 pool_size=8, quarantine=2.0, rcvbuf=None, sndbuf=None,
+                 dscp=None, clock=time.monotonic):
+        start, stop = port_range
+        self.host = host
+        self.pool_size = pool_size
+        self.quarantine = quarantine
+        self.rcvbuf = rcvbuf
+        self.sndbuf = sndbuf
+        self.dscp = dscp
+        self.in_use = 0
+        self.family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        self._clock = clock
+        self._free = collections.deque(range(start + start % 2, stop - 1, 2))
+        self._pool = collections.deque()
+        self._quarantined = collections.deque()
+        self._refill = None
+
+    @property
+    def pooled(self):
+        return len(self._pool)
+
+    @property
+    def quarantined(self):
+        return len(self._quarantined)
+
+    def _release_quarantined(self):
+        quarantined = self._quarantined
+        now = self._clock()
+        while quarantined and quarantined[0][0] <= now:
+            self._free.append(quarantined.popleft()[1])
+
+    def _socket(self):
+        sock = socket.socket(self.family, socket.SOCK_DGRAM)
+        try:
+            sock.setblocking(False)
+            if self.rcvbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                self.rcvbuf)
+            if self.sndbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF,
+                                self.sndbuf)
+            if self.dscp is not None:
+                if self.family == socket.AF_INET6:
+                    sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_TCLASS,
+                                    self.dscp << 2)
+                else:
+                    sock.setsockopt(socket.IPPROTO_IP, socket.IP_TOS,
+                                    self.dscp << 2)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _bind_pair(self, port):
+        socks = []
+        try:
+            for pair_port in (port, port + 1):
+                sock = self._socket()
+                socks.append(sock)
+                sock.bind((self.host, pair_port))
+        except OSError:
+            for sock in socks:
+                sock.close()
+            raise
+        return tuple(socks)
+
+    def _bind(self):
+        """Bind the next free RTP/RTCP port pair, or return ``None``."""
+        self._release_quarantined()
+        for _ in range(len(self._free)):
+            port = self._free.popleft()
+            try:
+                return self._bind_pair(port)
+            except OSError as exc:
+                if exc.errno != errno.EADDRINUSE:
+                    self._free.appendleft(port)
+                    raise
+                # Someone else has one of them; try again once it comes
+                # round
+                self._free.append(port)
+        return None
+
+    def fill(self):
+        """Bind pairs until the pool is full or the range runs out."""
+        self._refill = None
+        while len(self._pool) < self.pool_size:
+            pair = self._bind()
+            if pair is None:
+                break
+            self._pool.append(pair)
+
+    def acquire(self, *, loop=None):
+        """Take a bound ``(rtp, rtcp)`` socket pair.
+
+        With a ``loop``, the pool is topped up on it afterwards, off the
+        caller's path.
+        """
+        if self._pool:
+            pair = self._pool.popleft()
+        else:
+            pair = self._bind()
+            if pair is None:
+                raise OSError(errno.EADDRNOTAVAIL,
+                              'No free ports in range on {}'.format(
+                                  self.host))
+        self.in_use += 1
+
+        if loop is None:
+            self.fill()
+        elif self._refill is None:
+            self._refill = loop.call_soon(self.fill)
+        return pair
+
+    def release(self, port):
+        """Return the pair at RTP ``port`` once its sockets are closed."""
+        self.in_use -= 1
+        self._quarantined.append((self._clock() + self.quarantine, port))
+
+    def close(self):
+        if self._refill:
+            self._refill.cancel()
+            self._refill = None
+        while self._pool:
+            rtp, rtcp = self._pool.popleft()
+            self._free.appendleft(rtp.getsockname()[1])
+            rtp.close()
+            rtcp.close()
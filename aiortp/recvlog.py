@@ -0,0 +1,150 @@
+from collections.abc import Sequence
+
+import numpy as np
+
+from .packet import rtpbatch, RTPBatch
+
+
+MAX_PAYLOAD_SIZE = 1500
+
+
+class _ArenaView(Sequence):
+    """Lazy sequence of payload memoryviews into a receive log arena."""
+
+    def __init__(self, arena, offsets, lengths):
+        self._arena = memoryview(arena)
+        self._offsets = offsets
+        self._lengths = lengths
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return _ArenaView(self._arena, self._offsets[index],
+                              self._lengths[index])
+        offset = int(self._offsets[index])
+        return self._arena[offset:offset + int(self._lengths[index])]
+
+    def __len__(self):
+        return len(self._offsets)
+
+
+class ReceiveLog:
+    """Columnar record of received RTP packets.
+
+    Header fields and arrival times are kept in a preallocated structured
+    array and payloads in a single contiguous arena, so no per-packet
+    Python objects are retained.
+
+    Without ``maxlen`` the log grows by doubling. With ``maxlen`` it becomes
+    a ring holding the most recent ``maxlen`` packets, each payload stored
+    in a fixed slot of ``payload_size`` bytes. A longer payload, such as
+    a 60 ms G.711 frame, doubles the slots up to ``max_payload_size``;
+    beyond that payloads are truncated and counted in ``truncated``.
+    Memory use in ring mode is otherwise constant.
+    """
+
+    def __init__(self, maxlen=None, *, capacity=256, payload_size=320,
+                 max_payload_size=MAX_PAYLOAD_SIZE):
+        self.maxlen = maxlen
+        self.payload_size = payload_size
+        self.max_payload_size = max_payload_size
+        self.truncated = 0
+        self.total = 0
+        self._size = maxlen or capacity
+        self._headers = np.zeros(self._size, dtype=rtpbatch)
+        self._offsets = np.zeros(self._size, dtype=np.int64)
+        self._lengths = np.zeros(self._size, dtype=np.int32)
+        self._arena = bytearray(self._size * payload_size)
+        self._tail = 0
+
+    def __len__(self):
+        if self.maxlen:
+            return min(self.total, self.maxlen)
+        return self.total
+
+    def __iter__(self):
+        return iter(self.batch())
+
+    @property
+    def dropped(self):
+        """Number of packets overwritten in ring mode."""
+        return self.total - len(self)
+
+    def _grow(self):
+        self._size *= 2
+        self._headers = np.resize(self._headers, self._size)
+        self._offsets = np.resize(self._offsets, self._size)
+        self._lengths = np.resize(self._lengths, self._size)
+
+    def _resize_slots(self, size):
+        slot = self.payload_size
+        while slot < size:
+            slot *= 2
+        slot = min(slot, self.max_payload_size)
+
+        # A fresh arena, so views handed out by batch() stay valid
+        arena = bytearray(self.maxlen * slot)
+        old = self.payload_size
+        for idx in range(min(self.total, self.maxlen)):
+            arena[idx * slot:idx * slot + old] = \
+                self._arena[idx * old:(idx + 1) * old]
+        # New offsets too, as earlier batches hold views of the old ones
+        self._offsets = np.arange(self.maxlen, dtype=np.int64) * slot
+        self._arena = arena
+        self.payload_size = slot
+
+    def _store(self, payload):
+        size = len(payload)
+        if self.maxlen:
+            if size > self.payload_size:
+                if self.payload_size < self.max_payload_size:
+                    self._resize_slots(size)
+                if size > self.payload_size:
+                    self.truncated += 1
+                    size = self.payload_size
+            offset = (self.total % self.maxlen) * self.payload_size
+        else:
+            offset = self._tail
+            if offset + size > len(self._arena):
+                # Copy into a fresh arena rather than resizing in place,
+                # so views handed out by batch() stay valid.
+                arena = bytearray(max(2 * len(self._arena), offset + size))
+                arena[:offset] = self._arena[:offset]
+                self._arena = arena
+            self._tail += size
+
+        self._arena[offset:offset + size] = payload[:size]
+        return offset, size
+
+    def append(self, frametime, packet):
+        if self.maxlen:
+            idx = self.total % self.maxlen
+        else:
+            idx = self.total
+            if idx == self._size:
+                self._grow()
+
+        self._headers[idx] = (frametime, packet.version, packet.padding,
+                              packet.ext, packet.csrc_items, packet.marker,
+                              packet.p_type, packet.seq, packet.timestamp,
+                              packet.ssrc)
+        self._offsets[idx], self._lengths[idx] = self._store(
+            bytes(packet.payload))
+        self.total += 1
+
+    def batch(self):
+        """Return the logged packets, oldest first, as an ``RTPBatch``.
+
+        Payloads are views into the arena. In ring mode, they will be
+        overwritten as new packets arrive.
+        """
+        count = len(self)
+        if self.maxlen and self.total > self.maxlen:
+            start = self.total % self.maxlen
+            order = np.r_[start:self.maxlen, 0:start]
+            headers = self._headers[order]
+            offsets, lengths = self._offsets[order], self._lengths[order]
+        else:
+            headers = self._headers[:count]
+            offsets, lengths = self._offsets[:count], self._lengths[:count]
+
+        return RTPBatch(headers, _ArenaView(self._arena, offsets, lengths))
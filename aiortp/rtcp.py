@@ -0,0 +1,422 @@
+"""RTCP (RFC 3550 section 6) reports for RTP streams.
+
+Reports are built from the running counters the scheduler and
+``LiveStats`` already keep, so sending one costs O(1) whatever the
+length of the call.
+"""
+import asyncio
+import logging
+import math
+import os
+import random
+import socket
+import struct
+import time
+import typing
+
+
+LOG = logging.getLogger(__name__)
+
+SR = 200
+RR = 201
+SDES = 202
+BYE = 203
+
+SDES_CNAME = 1
+
+RTCP_PORT = 'port'
+RTCP_MUX = 'mux'
+
+# Seconds between the NTP (1900) and Unix (1970) epochs
+NTP_OFFSET = 2208988800
+
+RTCP_MIN_TIME = 5.0
+RTCP_BANDWIDTH_FRACTION = 0.05
+RTCP_SENDER_FRACTION = 0.25
+COMPENSATION = math.e - 1.5
+
+rtcphdr = struct.Struct('!BBH')
+sender_info = struct.Struct('!IIIII')
+report_block = struct.Struct('!IIIIII')
+ssrc_struct = struct.Struct('!I')
+
+
+def is_rtcp(data):
+    """Tell RTCP from RTP on a muxed port (RFC 5761 section 4)."""
+    return len(data) > 1 and 192 <= data[1] <= 223
+
+
+def ntp_time(now=None):
+    """Return the current time as a 64-bit NTP timestamp."""
+    if now is None:
+        now = time.time()
+    return int((now + NTP_OFFSET) * (1 << 32)) & 0xFFFFFFFFFFFFFFFF
+
+
+def _header(count, packet_type, body):
+    padding = -len(body) % 4
+    return rtcphdr.pack(0x80 | count, packet_type,
+                        (len(body) + padding) // 4) + body + bytes(padding)
+
+
+class ReportBlock(typing.NamedTuple):
+    ssrc: int
+    fraction_lost: int
+    lost: int
+    highest_seq: int
+    jitter: int
+    lsr: int
+    dlsr: int
+
+    @classmethod
+    def parse(cls, data, offset=0):
+        ssrc, loss, highest_seq, jitter, lsr, dlsr = \
+            report_block.unpack_from(data, offset)
+        lost = loss & 0xFFFFFF
+        if lost & 0x800000:
+            lost -= 0x1000000
+        return cls(ssrc, loss >> 24, lost, highest_seq, jitter, lsr, dlsr)
+
+    def __bytes__(self):
+        lost = max(-0x800000, min(self.lost, 0x7FFFFF)) & 0xFFFFFF
+        return report_block.pack(self.ssrc, self.fraction_lost << 24 | lost,
+                                 self.highest_seq, self.jitter, self.lsr,
+                                 self.dlsr)
+
+
+class SenderReport(typing.NamedTuple):
+    ssrc: int
+    ntp_timestamp: int
+    rtp_timestamp: int
+    packets: int
+    octets: int
+    reports: typing.Tuple[ReportBlock, ...] = ()
+
+    def __bytes__(self):
+        body = b''.join([
+            ssrc_struct.pack(self.ssrc),
+            sender_info.pack(self.ntp_timestamp >> 32,
+                             self.ntp_timestamp & 0xFFFFFFFF,
+                             self.rtp_timestamp, self.packets, self.octets),
+        ] + [bytes(block) for block in self.reports])
+        return _header(len(self.reports), SR, body)
+
+
+class ReceiverReport(typing.NamedTuple):
+    ssrc: int
+    reports: typing.Tuple[ReportBlock, ...] = ()
+
+    def __bytes__(self):
+        body = b''.join([ssrc_struct.pack(self.ssrc)]
+                        + [bytes(block) for block in self.reports])
+        return _header(len(self.reports), RR, body)
+
+
+class SourceDescription(typing.NamedTuple):
+    # ((ssrc, ((item_type, value), ...)), ...)
+    chunks: typing.Tuple[typing.Tuple[int, typing.Tuple], ...]
+
+    def cname(self, ssrc):
+        for chunk_ssrc, items in self.chunks:
+            if chunk_ssrc == ssrc:
+                return dict(items).get(SDES_CNAME)
+        return None
+
+    def __bytes__(self):
+        body = []
+        for ssrc, items in self.chunks:
+            chunk = [ssrc_struct.pack(ssrc)]
+            for item_type, value in items:
+                chunk.append(bytes([item_type, len(value)]) + value)
+            chunk = b''.join(chunk) + b'\x00'
+            body.append(chunk + bytes(-len(chunk) % 4))
+        return _header(len(self.chunks), SDES, b''.join(body))
+
+
+class Bye(typing.NamedTuple):
+    ssrcs: typing.Tuple[int, ...]
+    reason: bytes = b''
+
+    def __bytes__(self):
+        body = b''.join(ssrc_struct.pack(ssrc) for ssrc in self.ssrcs)
+        if self.reason:
+            body += bytes([len(self.reason)]) + self.reason
+        return _header(len(self.ssrcs), BYE, body)
+
+
+def _parse_sdes(count, body):
+    chunks = []
+    offset = 0
+    for _ in range(count):
+        ssrc, = ssrc_struct.unpack_from(body, offset)
+        offset += 4
+        items = []
+        while offset < len(body) and body[offset]:
+            item_type, length = body[offset], body[offset + 1]
+            items.append((item_type, bytes(body[offset + 2:
+                                                offset + 2 + length])))
+            offset += 2 + length
+        # Skip the terminating null and pad to the next word
+        offset = (offset + 4) & ~3
+        chunks.append((ssrc, tuple(items)))
+    return SourceDescription(tuple(chunks))
+
+
+def _parse_bye(count, body):
+    ssrcs = struct.unpack_from('!{}I'.format(count), body)
+    reason = b''
+    if len(body) > 4 * count:
+        length = body[4 * count]
+        reason = bytes(body[4 * count + 1:4 * count + 1 + length])
+    return Bye(ssrcs, reason)
+
+
+def parse(data):
+    """Parse a compound RTCP packet into a list of reports.
+
+    Unknown packet types, such as APP, are skipped.
+    """
+    packets = []
+    offset = 0
+    data = memoryview(data)
+    while offset + rtcphdr.size <= len(data):
+        first, packet_type, length = rtcphdr.unpack_from(data, offset)
+        if first >> 6 != 2:
+            raise ValueError('Not an RTCP version 2 packet')
+        end = offset + 4 * (length + 1)
+        if end > len(data):
+            raise ValueError('Truncated RTCP packet')
+
+        count = first & 0x1F
+        body = data[offset + rtcphdr.size:end]
+        if first & 0x20:
+            body = body[:len(body) - body[-1]]
+
+        if packet_type == SR:
+            ssrc, = ssrc_struct.unpack_from(body)
+            ntp_high, ntp_low, rtp_timestamp, packet_count, octets = \
+                sender_info.unpack_from(body, 4)
+            reports = tuple(ReportBlock.parse(body, 24 + 24 * idx)
+                            for idx in range(count))
+            packets.append(SenderReport(ssrc, ntp_high << 32 | ntp_low,
+                                        rtp_timestamp, packet_count, octets,
+                                        reports))
+        elif packet_type == RR:
+            ssrc, = ssrc_struct.unpack_from(body)
+            reports = tuple(ReportBlock.parse(body, 4 + 24 * idx)
+                            for idx in range(count))
+            packets.append(ReceiverReport(ssrc, reports))
+        elif packet_type == SDES:
+            packets.append(_parse_sdes(count, body))
+        elif packet_type == BYE:
+            packets.append(_parse_bye(count, body))
+        offset = end
+    return packets
+
+
+def rtcp_interval(members, senders, rtcp_bw, we_sent, avg_rtcp_size,
+                  initial, *, rng=random.random):
+    """Seconds until the next report, per RFC 3550 appendix A.7.
+
+    ``rtcp_bw`` is the RTCP share of the session bandwidth in octets per
+    second. The result is randomized over [0.5, 1.5] of the nominal
+    interval, so reports from many streams don't synchronize.
+    """
+    min_time = RTCP_MIN_TIME / 2 if initial else RTCP_MIN_TIME
+    count = members
+    if senders <= members * RTCP_SENDER_FRACTION:
+        if we_sent:
+            rtcp_bw *= RTCP_SENDER_FRACTION
+            count = senders
+        else:
+            rtcp_bw *= 1 - RTCP_SENDER_FRACTION
+            count -= senders
+
+    interval = max(avg_rtcp_size * count / rtcp_bw, min_time)
+    return interval * (rng() + 0.5) / COMPENSATION
+
+
+class RTCPSession(asyncio.DatagramProtocol):
+    """RTCP for one ``RTPStream``.
+
+    Sends a sender or receiver report with our CNAME on the RFC 3550
+    schedule, and tracks what the peer reports back: its loss and jitter
+    as seen from the far end (``remote_report``) and the round-trip time
+    (``rtt``, in seconds). With ``transport`` unset, reports go out over
+    the stream's own RTP transport (RTCP mux).
+    """
+
+    def __init__(self, stream, *, cname=None, bandwidth=64000, loop):
+        self.stream = stream
+        self.cname = (cname or '{}@{}'.format(
+            os.getpid(), socket.gethostname())).encode()
+        self.rtcp_bw = bandwidth * RTCP_BANDWIDTH_FRACTION / 8
+        self.transport = None
+        self.ssrc = random.getrandbits(32)
+
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+        self.remote_ssrc = None
+        self.remote_cname = None
+        self.remote_report = None
+        self.rtt = None
+        self.bye = None
+
+        self._avg_rtcp_size = 128.0
+        self._initial = True
+        self._we_sent = False
+        self._remote_sent = False
+        self._last_packets = 0
+        self._lsr = 0
+        self._lsr_time = None
+        self._expected_prior = 0
+        self._received_prior = 0
+        self._handle = None
+        self._loop = loop
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def start(self):
+        self._schedule()
+
+    def _schedule(self):
+        members = 2 if self.remote_ssrc is not None else 1
+        senders = self._we_sent + self._remote_sent
+        interval = rtcp_interval(members, senders, self.rtcp_bw,
+                                 self._we_sent, self._avg_rtcp_size,
+                                 self._initial)
+        self._initial = False
+        self._handle = self._loop.call_later(interval, self._send_report)
+
+    def _sendto(self, data):
+        transport = self.transport or getattr(self.stream, 'transport', None)
+        if transport is None or transport.is_closing():
+            return False
+        transport.sendto(data)
+        self.sent += 1
+        self._avg_rtcp_size += (len(data) + 28 - self._avg_rtcp_size) / 16
+        return True
+
+    def _send_report(self):
+        try:
+            self._sendto(self.build_report())
+        except Exception:
+            LOG.exception('Failed to send RTCP report')
+        self._schedule()
+
+    def _entry(self):
+        transport = getattr(self.stream, 'transport', None)
+        return self.stream.scheduler._entries.get(transport)
+
+    def _rtp_time(self, entry):
+        """The RTP timestamp for now, extrapolated from the last packet
+        sent (RFC 3550 section 6.4.1)."""
+        fmt = getattr(self.stream, 'format', None)
+        clock_rate = (fmt and fmt.rate) or 8000
+        elapsed = max(0.0, self._loop.time() - entry.sent_at)
+        return entry.timestamp + int(elapsed * clock_rate)
+
+    def report_blocks(self, now=None):
+        protocol = getattr(self.stream, 'protocol', None)
+        if protocol is None or not protocol.stats.received:
+            return ()
+
+        stats = protocol.stats
+        expected, received = stats.expected, stats.received
+        expected_interval = expected - self._expected_prior
+        lost_interval = expected_interval - (received - self._received_prior)
+        self._expected_prior, self._received_prior = expected, received
+        fraction = 0
+        if expected_interval and lost_interval > 0:
+            fraction = (lost_interval << 8) // expected_interval
+
+        dlsr = 0
+        if self._lsr_time is not None:
+            now = time.time() if now is None else now
+            dlsr = int((now - self._lsr_time) * 65536) & 0xFFFFFFFF
+        return (ReportBlock(
+            ssrc=stats.ssrc, fraction_lost=min(fraction, 255),
+            lost=expected - received,
+            highest_seq=stats.highest_seq & 0xFFFFFFFF,
+            jitter=int(stats.jitter), lsr=self._lsr, dlsr=dlsr),)
+
+    def build_report(self, now=None):
+        """Build a compound SR or RR plus SDES from the running counters."""
+        now = time.time() if now is None else now
+        reports = self.report_blocks(now)
+
+        entry = self._entry()
+        packets = entry.packets if entry else 0
+        self._we_sent = packets != self._last_packets
+        self._last_packets = packets
+        if entry:
+            self.ssrc = getattr(entry.source, 'ssrc', self.ssrc)
+
+        if entry and packets:
+            octets = entry.bytes - 12 * packets
+            report = SenderReport(
+                self.ssrc, ntp_time(now), self._rtp_time(entry) & 0xFFFFFFFF,
+                packets & 0xFFFFFFFF, octets & 0xFFFFFFFF, reports)
+        else:
+            report = ReceiverReport(self.ssrc, reports)
+
+        sdes = SourceDescription(((self.ssrc, ((SDES_CNAME, self.cname),)),))
+        return bytes(report) + bytes(sdes)
+
+    def datagram_received(self, data, addr):
+        try:
+            packets = parse(data)
+        except (ValueError, struct.error, IndexError) as exc:
+            self.errors += 1
+            LOG.debug('Bad RTCP packet from %s: %s', addr, exc)
+            return
+
+        now = time.time()
+        self.received += 1
+        self._avg_rtcp_size += (len(data) + 28 - self._avg_rtcp_size) / 16
+        for packet in packets:
+            if isinstance(packet, SenderReport):
+                self.remote_ssrc = packet.ssrc
+                self._remote_sent = True
+                self._lsr = (packet.ntp_timestamp >> 16) & 0xFFFFFFFF
+                self._lsr_time = now
+            elif isinstance(packet, ReceiverReport):
+                self.remote_ssrc = packet.ssrc
+            elif isinstance(packet, SourceDescription):
+                if self.remote_ssrc is not None:
+                    self.remote_cname = packet.cname(self.remote_ssrc)
+                continue
+            elif isinstance(packet, Bye):
+                self.bye = packet
+                continue
+
+            for block in packet.reports:
+                if block.ssrc == self.ssrc:
+                    self._remote_report(block, now)
+
+    def _remote_report(self, block, now):
+        self.remote_report = block
+        if block.lsr:
+            # All in units of 1/65536 seconds, modulo 2**32
+            arrival = (ntp_time(now) >> 16) & 0xFFFFFFFF
+            rtt = (arrival - block.lsr - block.dlsr) & 0xFFFFFFFF
+            self.rtt = rtt / 65536
+
+    def error_received(self, exc):
+        self.errors += 1
+        LOG.warning('RTCP error received: %s', exc)
+
+    def close(self, reason=b''):
+        """Send a BYE and stop reporting."""
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        try:
+            self._sendto(bytes(ReceiverReport(self.ssrc))
+                         + bytes(Bye((self.ssrc,), reason)))
+        except Exception:
+            LOG.exception('Failed to send RTCP BYE')
+        if self.transport:
+            self.transport.close()
@@ -1,30 +1,54 @@
 import asyncio
-from collections import deque
 import time
 import logging
-import typing
-import re
 
 import aiotimer
 
-from .packet import RTP
+from .capture import CaptureWriter, PCAP
+from .codecs import CODECS
+from .delivery import DROP_OLDEST, PacketQueue
+from .metrics import COUNTER, GAUGE, Histogram, HISTOGRAM, Metric
+from .mmsg import BatchSender
+from .mux import SharedEndpoint
+from .packet import PacketData, RTP
+from .playout import PlayoutBuffer, SILENCE
+from .ports import PORT_RANGE, PortAllocator
+from .recvlog import ReceiveLog
+from .rtcp import is_rtcp, RTCP_MUX, RTCP_PORT, RTCPSession
+from .sdp import DEFAULT_FORMATS, negotiate, SDP
+from .sources import DTMF
+from .stats import LiveStats
+from .wheel import TimingWheel
 
 
 LOG = logging.getLogger(__name__)
 
+OVERRUN_BURST = 'burst'
+OVERRUN_SKIP = 'skip'
+OVERRUN_SMEAR = 'smear'
 
-class PacketData(typing.NamedTuple):
-    frametime: float
-    packet: typing.Dict[str, typing.Any]
+LATENESS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+TICK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 50)
+MAX_DATAGRAM = 1500
 
 
 class RTPProtocol(asyncio.DatagramProtocol):
-    def __init__(self, stream, *, loop):
+    def __init__(self, stream, *, log_size=None, delivery=DROP_OLDEST,
+                 queue_size=1000, loop):
         self.stream = stream
-        self.packets = deque()
+        self.packets = ReceiveLog(log_size)
+        self.stats = LiveStats()
         self.ready = loop.create_future()
         self.transport = None
-        self.packet_queue = asyncio.Queue()
+        self.packet_queue = None
+        self.playout = None
+        self.rtcp = None
+        self.capture = None
+        self.received = 0
+        self.received_bytes = 0
+        self.errors = 0
+        if delivery:
+            self.packet_queue = PacketQueue(delivery, queue_size, loop=loop)
         self._loop = loop
 
     def connection_made(self, transport):
@@ -32,109 +56,562 @@ class RTPProtocol(asyncio.DatagramProtocol):
         self.ready.set_result(self.transport)
 
     def datagram_received(self, data, addr):
+        if self.rtcp is not None and is_rtcp(data):
+            self.rtcp.datagram_received(data, addr)
+            return
+
+        self.received += 1
+        self.received_bytes += len(data)
         packet = PacketData(frametime=time.time(),
                             packet=RTP.parse(data))
-        self.packets.append(packet)
+        if self.capture is not None:
+            self.capture.write(packet.frametime, data, addr,
+                               self.transport.get_extra_info('sockname'))
+        self.packets.append(packet.frametime, packet.packet)
+        self.stats.update(packet.frametime, packet.packet)
+        if self.playout is not None:
+            self.playout.push(packet.frametime, packet.packet)
+        if self.packet_queue is None:
+            return
         try:
             self.packet_queue.put_nowait(packet)
         except Exception:
             LOG.exception('Failed to queue packet')
 
+    @property
+    def dropped(self):
+        if self.packet_queue is None:
+            return 0
+        return self.packet_queue.dropped
+
+    def connection_lost(self, exc):
+        if self.playout is not None:
+            self.playout.close()
+
     def error_received(self, exc):
-        print("Error received:", exc)
+        self.errors += 1
+        LOG.warning('Error received: %s', exc)
+
+    def collect(self, labels=()):
+        yield Metric('aiortp_stream_packets_received_total', COUNTER,
+                     'RTP packets received', self.received, labels)
+        yield Metric('aiortp_stream_bytes_received_total', COUNTER,
+                     'RTP bytes received', self.received_bytes, labels)
+        yield Metric('aiortp_stream_errors_total', COUNTER,
+                     'Socket errors reported', self.errors, labels)
+        yield Metric('aiortp_stream_jitter_ms', GAUGE,
+                     'RFC 3550 interarrival jitter',
+                     self.stats.jitter / self.stats.clock_rate * 1000, labels)
+        if self.packets.maxlen:
+            yield Metric('aiortp_stream_payloads_truncated_total', COUNTER,
+                         'Payloads too long for the receive log',
+                         self.packets.truncated, labels)
+        if self.packet_queue is not None:
+            yield Metric('aiortp_stream_queue_depth', GAUGE,
+                         'Packets waiting for delivery',
+                         self.packet_queue.qsize(), labels)
+            yield Metric('aiortp_stream_queue_dropped_total', COUNTER,
+                         'Packets dropped by the delivery queue',
+                         self.packet_queue.dropped, labels)
+
+
+def _resolve(source, exc=None):
+    """Wake whoever awaits ``source`` playing out."""
+    future = getattr(source, 'future', None)
+    if future and not future.done():
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(None)
+
+
+class _Entry:
+    __slots__ = ('transport', 'source', 'render', 'ticks', 'period',
+                 'cancelled', 'buffer', 'started', 'frames', 'packets',
+                 'bytes', 'skew', 'capture', 'sent_at', 'timestamp')
+
+    def __init__(self, transport, source, ticks, period):
+        self.transport = transport
+        self.source = source
+        # Sources with a render method hand over finished datagrams
+        self.render = getattr(source, 'render', None)
+        self.ticks = ticks
+        self.period = period
+        self.cancelled = False
+        # Reusable per-stream send buffer
+        self.buffer = bytearray(MAX_DATAGRAM)
+        self.started = None
+        self.frames = 0
+        self.packets = 0
+        self.bytes = 0
+        # How far each send trails the stream's own ptime grid, in ms
+        self.skew = Histogram(LATENESS_BUCKETS)
+        # Called with each sent datagram while the stream is recorded
+        self.capture = None
+        # Loop time and RTP timestamp of the last packet sent, for RTCP
+        self.sent_at = None
+        self.timestamp = 0
+
+    def serialize(self, packet):
+        try:
+            size = packet.pack_into(self.buffer)
+        except ValueError:
+            self.buffer = bytearray(len(bytes(packet)))
+            size = packet.pack_into(self.buffer)
+        return memoryview(self.buffer)[:size]
+
+    def collect(self, labels=()):
+        yield Metric('aiortp_stream_packets_sent_total', COUNTER,
+                     'RTP packets sent', self.packets, labels)
+        yield Metric('aiortp_stream_bytes_sent_total', COUNTER,
+                     'RTP bytes sent', self.bytes, labels)
+        yield Metric('aiortp_stream_send_skew_ms', HISTOGRAM,
+                     'Send time behind the stream\'s ptime grid', self.skew,
+                     labels)
 
 
 class RTPTimer(aiotimer.Protocol):
-    def __init__(self, streams, *, loop=None):
+    def __init__(self, scheduler, *, loop=None):
         self._loop = loop or asyncio.get_event_loop()
-        self.streams = streams
+        self.scheduler = scheduler
+        self.backlog = 0
+        self._epoch = None
+        self._ticks = 0
+
+    def timer_started(self, timer):
+        self._epoch = self._loop.time()
 
     def timer_ticked(self):
-        for transport, source in self.streams.items():
+        scheduler = self.scheduler
+        now = self._loop.time()
+        ideal = self._epoch + self._ticks * scheduler.interval * 0.001
+        scheduler.lateness.observe(max(0.0, now - ideal) * 1000)
+        scheduler.ticks += 1
+        self._ticks += 1
+
+        ticks = 1
+        if self.backlog:
+            extra = min(self.backlog, scheduler.smear_rate)
+            self.backlog -= extra
+            ticks += extra
+
+        for _ in range(ticks):
+            self._advance(now)
+        scheduler.tick_duration.observe((self._loop.time() - now) * 1000)
+
+    def _flush(self):
+        if self.scheduler.sender:
+            self.scheduler.sender.flush()
+
+    def _advance(self, now, send=True):
+        scheduler = self.scheduler
+        wheel = scheduler.wheel
+        sender = scheduler.sender
+        packets = sent_bytes = 0
+        for entry in wheel.advance():
+            if entry.cancelled:
+                continue
+
+            source = entry.source
             try:
-                packet = next(source)
+                if not send:
+                    getattr(source, 'skip', source.__next__)()
+                elif entry.render:
+                    data = entry.render()
+                else:
+                    data = entry.serialize(next(source))
+                if send:
+                    if sender:
+                        sender.add(entry.transport, data)
+                    else:
+                        entry.transport.sendto(data)
+                    if entry.capture is not None:
+                        entry.capture(data)
             except StopIteration:
-                assert self._loop == asyncio.get_event_loop()
-                source.future.set_result(None)
+                scheduler.finished(entry)
+                continue
+            except Exception as exc:
+                # The wheel has already handed over the whole slot, so one
+                # broken stream mustn't stop the rest being rescheduled
+                LOG.exception('Stream on %r failed', entry.transport)
+                scheduler.finished(entry, exc)
                 continue
 
-            transport.sendto(bytes(packet))
-
-        self.streams = {k: v for k, v in self.streams.items()
-                        if not v.stopped}
+            if entry.started is None:
+                entry.started = now
+            if send:
+                skew = now - entry.started - entry.frames * entry.period
+                entry.skew.observe(max(0.0, skew) * 1000)
+                entry.packets += 1
+                entry.bytes += len(data)
+                entry.sent_at = now
+                entry.timestamp = int.from_bytes(data[4:8], 'big')
+                packets += 1
+                sent_bytes += len(data)
+            entry.frames += 1
+            wheel.schedule(entry, entry.ticks)
+
+        scheduler.packets_sent += packets
+        scheduler.bytes_sent += sent_bytes
+        # Entries and sources reuse their buffers, so flush before they can
+        # fire again
+        self._flush()
 
     def timer_overrun(self, overruns):
-        raise RuntimeError("Timer overrun, everything is broken")
+        scheduler = self.scheduler
+        interval = scheduler.interval * 0.001
+        # The timer re-arms as a one-shot and reports a single overrun
+        # however long the stall, so count the missed ticks off the
+        # ideal grid instead
+        due = int((self._loop.time() - self._epoch) / interval) + 1
+        overruns = max(overruns, due - self._ticks)
+        self._ticks += overruns
+        scheduler.overruns += 1
+        scheduler.missed_ticks += overruns
+
+        policy = scheduler.overrun
+        catchup = min(overruns, scheduler.max_catchup)
+        if policy == OVERRUN_SKIP:
+            catchup = 0
+
+        now = self._loop.time()
+        for _ in range(overruns - catchup):
+            self._advance(now, send=False)
+        if policy == OVERRUN_SMEAR:
+            self.backlog += catchup
+        else:
+            for _ in range(catchup):
+                self._advance(now)
+
+        # The timer re-arms one interval from now. The missed ticks are
+        # accounted for above, so this only shifts the grid's phase to put
+        # the next tick on it
+        self._epoch = self._loop.time() - (self._ticks - 1) * interval
+        return True
 
 
 class RTPScheduler:
-    def __init__(self, *, interval=20):
+    """Paces the sources of many streams off a single timer.
+
+    When the timer overruns, the missed ticks are handled according to
+    ``overrun``: ``burst`` sends the missed frames immediately, ``skip``
+    drops them while still advancing each source's timestamp, and
+    ``smear`` spreads them over the following ticks, ``smear_rate`` extra
+    ticks at a time. At most ``max_catchup`` missed ticks are ever sent;
+    anything beyond that is skipped.
+
+    With ``batch_send``, the datagrams due in a tick are collected and
+    flushed per socket with ``sendmmsg`` where available.
+
+    Streams created without a local port get one from a per-host
+    ``PortAllocator`` over ``port_range``, built with ``port_options``.
+    """
+
+    def __init__(self, *, interval=10, overrun=OVERRUN_BURST, smear_rate=1,
+                 max_catchup=50, batch_send=False, port_range=PORT_RANGE,
+                 port_options=None):
+        if overrun not in (OVERRUN_BURST, OVERRUN_SKIP, OVERRUN_SMEAR):
+            raise ValueError('Unknown overrun policy: {}'.format(overrun))
+
         self.interval = interval
+        self.overrun = overrun
+        self.smear_rate = smear_rate
+        self.max_catchup = max_catchup
+        self.overruns = 0
+        self.missed_ticks = 0
+        self.ticks = 0
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.lateness = Histogram(LATENESS_BUCKETS)
+        self.tick_duration = Histogram(TICK_BUCKETS)
+        self.sender = BatchSender() if batch_send else None
+        self.endpoints = {}
+        self.port_range = port_range
+        self.port_options = dict(port_options or {})
+        self.allocators = {}
         self.streams = {}
+        self.wheel = TimingWheel()
+        self._entries = {}
         self._timer = None
         self._protocol = None
 
-    def create_new_stream(self, local_addr, *, ptime=20, loop=None):
-        return RTPStream(self, local_addr, ptime=ptime, loop=loop)
-
-    def add(self, transport, source):
+    def create_new_stream(self, local_addr, *, ptime=20, log_size=None,
+                          delivery=DROP_OLDEST, queue_size=1000, shared=False,
+                          rtcp=None, formats=DEFAULT_FORMATS, loop=None):
+        return RTPStream(self, local_addr, ptime=ptime, log_size=log_size,
+                         delivery=delivery, queue_size=queue_size,
+                         shared=shared, rtcp=rtcp, formats=formats,
+                         loop=loop)
+
+    def allocator(self, host):
+        """Return the port allocator for ``host``."""
+        allocator = self.allocators.get(host)
+        if not allocator:
+            allocator = PortAllocator(host, self.port_range,
+                                      **self.port_options)
+            self.allocators[host] = allocator
+        return allocator
+
+    def shared_endpoint(self, local_addr, *, loop=None):
+        """Return the socket shared by all streams on ``local_addr``."""
+        local_addr = tuple(local_addr)
+        endpoint = self.endpoints.get(local_addr)
+        if not endpoint:
+            endpoint = SharedEndpoint(
+                local_addr, loop=loop or asyncio.get_event_loop(),
+                on_close=lambda _: self.endpoints.pop(local_addr, None))
+            self.endpoints[local_addr] = endpoint
+        return endpoint
+
+    def add(self, transport, source, *, ptime=20, capture=None):
+        ticks, remainder = divmod(ptime, self.interval)
+        if remainder or not ticks:
+            raise ValueError('ptime {} is not a multiple of the scheduler '
+                             'interval {}'.format(ptime, self.interval))
+
+        self.unregister(transport)
+        entry = _Entry(transport, source, ticks, ptime * 0.001)
+        entry.capture = capture
         self.streams[transport] = source
+        self._entries[transport] = entry
+        self.wheel.schedule(entry, 1)
 
         if not self._timer:
-            self._timer, self._protocol = aiotimer.create_timer(
-                lambda: RTPTimer(self.streams),
+            self._protocol = RTPTimer(self)
+            self._timer, _ = aiotimer.create_timer(
+                lambda: self._protocol,
                 interval=self.interval * 0.001
             )
 
+    def finished(self, entry, exc=None):
+        if self._entries.get(entry.transport) is entry:
+            del self._entries[entry.transport]
+            del self.streams[entry.transport]
+        entry.cancelled = True
+        _resolve(entry.source, exc)
+
     def unregister(self, transport):
+        entry = self._entries.pop(transport, None)
+        if entry:
+            entry.cancelled = True
         source = self.streams.pop(transport, None)
         if source:
             source.stop()
+            # The timer won't see the source again to end it
+            _resolve(source)
+
+    def collect(self):
+        yield Metric('aiortp_scheduler_streams', GAUGE,
+                     'Streams being played', len(self.streams))
+        yield Metric('aiortp_scheduler_ticks_total', COUNTER,
+                     'Timer ticks handled', self.ticks)
+        yield Metric('aiortp_scheduler_overruns_total', COUNTER,
+                     'Timer overruns', self.overruns)
+        yield Metric('aiortp_scheduler_missed_ticks_total', COUNTER,
+                     'Ticks missed by timer overruns', self.missed_ticks)
+        yield Metric('aiortp_scheduler_packets_sent_total', COUNTER,
+                     'RTP packets sent', self.packets_sent)
+        yield Metric('aiortp_scheduler_bytes_sent_total', COUNTER,
+                     'RTP bytes sent', self.bytes_sent)
+        yield Metric('aiortp_scheduler_tick_duration_ms', HISTOGRAM,
+                     'Time spent handling a tick', self.tick_duration)
+        yield Metric('aiortp_scheduler_tick_lateness_ms', HISTOGRAM,
+                     'Tick start behind the ideal interval grid',
+                     self.lateness)
+        for host, allocator in self.allocators.items():
+            labels = (('host', host),)
+            yield Metric('aiortp_ports_in_use', GAUGE, 'Allocated RTP ports',
+                         allocator.in_use, labels)
+            yield Metric('aiortp_ports_pooled', GAUGE,
+                         'Pre-bound sockets ready to hand out',
+                         allocator.pooled, labels)
+            yield Metric('aiortp_ports_quarantined', GAUGE,
+                         'Released ports waiting to be reused',
+                         allocator.quarantined, labels)
 
     def stop(self):
         old_streams = self.streams
         self.streams = {}
+        for entry in self._entries.values():
+            entry.cancelled = True
+        self._entries = {}
 
         for source in old_streams.values():
             source.stop()
+            _resolve(source)
 
 
 class RTPStream:
-    def __init__(self, scheduler, local_addr, *, ptime=20, loop=None):
+    """One RTP session.
+
+    With ``rtcp`` set to ``'port'`` RTCP runs on the port after the RTP
+    port; with ``'mux'`` it shares the RTP port (RFC 5761). ``record``
+    streams the packets to a capture file.
+
+    With a ``local_addr`` of ``(host, None)``, the port comes from the
+    scheduler's allocator and goes back to it on ``close``.
+
+    ``formats`` are offered by ``describe``. ``negotiate`` settles on
+    one of them, recorded in ``format`` (and ``codec``, when aiortp can
+    encode it), along with ``telephone_event`` and the ``ptime`` the
+    remote asked for. ``schedule`` sends sources with the negotiated
+    payload types and rejects audio encoded with another codec.
+    """
+
+    def __init__(self, scheduler, local_addr, *, ptime=20, log_size=None,
+                 delivery=DROP_OLDEST, queue_size=1000, shared=False,
+                 rtcp=None, formats=DEFAULT_FORMATS, loop=None):
+        if rtcp not in (None, RTCP_PORT, RTCP_MUX):
+            raise ValueError('Unknown RTCP mode: {}'.format(rtcp))
+
+        self._loop = loop or asyncio.get_event_loop()
+        self._allocator = self._sock = self._rtcp_sock = None
+        if local_addr[1] is None:
+            if shared:
+                raise ValueError('Shared streams need a fixed local port')
+            self._allocator = scheduler.allocator(local_addr[0])
+            self._sock, self._rtcp_sock = self._allocator.acquire(
+                loop=self._loop)
+            local_addr = self._sock.getsockname()[:2]
+
         self.scheduler = scheduler
         self.local_addr = local_addr
         self.remote_addr = None
+        self.transport = None
         self.stream = None
         self.ptime = ptime
-        self._loop = loop or asyncio.get_event_loop()
+        self.log_size = log_size
+        self.delivery = delivery
+        self.queue_size = queue_size
+        self.shared = shared
+        self.formats = tuple(formats)
+        self.format = None
+        self.codec = None
+        self.telephone_event = None
+        self.rtcp_mode = rtcp
+        self.rtcp = None
+        self.capture = None
+        self.capture_sent = False
+        self._description = None
 
     def describe(self):
-        from .sdp import SDP
-        return SDP(self.local_addr, self.ptime)
+        key = (tuple(self.local_addr), self.ptime, self.formats)
+        if self._description is None or self._description[0] != key:
+            self._description = key, SDP.offer(self.local_addr, self.ptime,
+                                               self.formats)
+        return self._description[1]
 
     async def negotiate(self, sdp):
         # TODO: add state-tracking
-        _sdp = str(sdp)
-        m_header = re.search(r'm=audio (\d+) RTP/AVP', _sdp)
-        c_header = re.search(r'c=IN IP4 ([\d.]+)', _sdp)
-        self.remote_addr = c_header.group(1), int(m_header.group(1))
-        self.transport = await self._create_endpoint()
+        if not isinstance(sdp, SDP):
+            sdp = SDP.parse(str(sdp))
+        result = negotiate(self.describe(), sdp)
+        if self.transport and result.remote_addr != self.remote_addr:
+            # The peer moved; reconnect from the same port once the old
+            # socket has really closed
+            self.transport.close()
+            self.transport = None
+            await asyncio.sleep(0)
+        self.remote_addr = result.remote_addr
+        self.format = result.format
+        self.codec = next((codec for codec in CODECS.values()
+                           if result.format.named(codec.name)), None)
+        self.telephone_event = result.telephone_event
+        if result.ptime % self.scheduler.interval == 0:
+            self.ptime = result.ptime
+        else:
+            LOG.warning('Ignoring ptime %s, not a multiple of the scheduler '
+                        'interval', result.ptime)
+        if not self.transport or self.transport.is_closing():
+            self.transport = await self._create_endpoint()
+        if self.rtcp_mode and not self.rtcp:
+            await self._start_rtcp()
+
+    async def _start_rtcp(self):
+        self.rtcp = RTCPSession(self, loop=self._loop)
+        if self.rtcp_mode == RTCP_MUX:
+            self.protocol.rtcp = self.rtcp
+        elif self._rtcp_sock:
+            # The allocator bound the RTCP port along with the RTP one
+            sock, self._rtcp_sock = self._rtcp_sock, None
+            sock.connect((self.remote_addr[0], self.remote_addr[1] + 1))
+            await self._loop.create_datagram_endpoint(lambda: self.rtcp,
+                                                      sock=sock)
+        else:
+            host, port = self.transport.get_extra_info('sockname')[:2]
+            await self._loop.create_datagram_endpoint(
+                lambda: self.rtcp, local_addr=(host, port + 1),
+                remote_addr=(self.remote_addr[0], self.remote_addr[1] + 1))
+        self.rtcp.start()
+
+    def _create_protocol(self):
+        protocol = RTPProtocol(self, log_size=self.log_size,
+                               delivery=self.delivery,
+                               queue_size=self.queue_size,
+                               loop=self._loop)
+        if self.rtcp_mode == RTCP_MUX:
+            protocol.rtcp = self.rtcp
+        protocol.capture = self.capture
+        return protocol
 
     async def _create_endpoint(self):
         assert self.remote_addr
-        transport, self.protocol = await self._loop.create_datagram_endpoint(
-            lambda: RTPProtocol(self, loop=self._loop),
-            local_addr=self.local_addr,
-            remote_addr=self.remote_addr
-        )
+        if self.shared:
+            self.protocol = self._create_protocol()
+            endpoint = self.scheduler.shared_endpoint(self.local_addr,
+                                                      loop=self._loop)
+            transport = endpoint.register(self.remote_addr, self.protocol)
+        elif self._sock:
+            sock, self._sock = self._sock, None
+            sock.connect(self.remote_addr)
+            transport, self.protocol = (
+                await self._loop.create_datagram_endpoint(
+                    self._create_protocol, sock=sock))
+        else:
+            transport, self.protocol = (
+                await self._loop.create_datagram_endpoint(
+                    self._create_protocol,
+                    local_addr=self.local_addr,
+                    remote_addr=self.remote_addr
+                ))
         await self.protocol.ready
         return transport
 
+    def _apply_format(self, source):
+        """Send ``source`` with the negotiated payload type.
+
+        Audio must already be encoded with the negotiated codec, since
+        the payload can't be re-encoded on the fly.
+        """
+        payload_type = getattr(source, 'format', None)
+        if self.format is None or payload_type is None:
+            return
+
+        if isinstance(source, DTMF):
+            negotiated = self.telephone_event
+            if negotiated is None:
+                raise ValueError('telephone-event was not negotiated')
+        else:
+            negotiated = self.format
+            codec = CODECS.get(payload_type)
+            if codec is None or not negotiated.named(codec.name):
+                raise ValueError('Source is encoded as {}, but {} was '
+                                 'negotiated'.format(
+                                     codec.name if codec else payload_type,
+                                     negotiated.name))
+
+        if payload_type != negotiated.payload_type:
+            source.format = negotiated.payload_type
+            source._template = None
+
     async def schedule(self, source):
+        self._apply_format(source)
         source.future = self._loop.create_future()
 
-        self.transport = await self._create_endpoint()
-        self.scheduler.add(self.transport, source)
+        if not self.transport or self.transport.is_closing():
+            self.transport = await self._create_endpoint()
+        self.scheduler.add(self.transport, source, ptime=self.ptime,
+                           capture=self._capture_sent())
 
         assert source.future
         await source.future
@@ -142,6 +619,90 @@ class RTPStream:
     def stop(self):
         self.scheduler.unregister(self.transport)
 
-    async def packets(self):
+    def record(self, path, *, format=PCAP, sent=False, **options):
+        """Write received packets, and with ``sent`` also sent ones, to
+        a pcap or rtpdump file at ``path``.
+
+        Returns the ``CaptureWriter``; options are passed on to it.
+        """
+        if self.capture:
+            self.capture.close()
+        self.capture = CaptureWriter(path, format=format, loop=self._loop,
+                                     **options)
+        self.capture_sent = sent
+
+        protocol = getattr(self, 'protocol', None)
+        if protocol:
+            protocol.capture = self.capture
+        entry = self.scheduler._entries.get(self.transport)
+        if entry:
+            entry.capture = self._capture_sent()
+        return self.capture
+
+    def _capture_sent(self):
+        if not self.capture_sent:
+            return None
+        capture, transport = self.capture, self.transport
+        local = transport.get_extra_info('sockname')
+        remote = transport.get_extra_info('peername') or self.remote_addr
+        return lambda data: capture.write(time.time(), data, local, remote)
+
+    def close(self):
+        """Stop playback, say BYE over RTCP and release the sockets.
+
+        Returns the capture's close future when recording, else None.
+        """
+        self.stop()
+        if self.rtcp:
+            self.rtcp.close()
+        if self.transport:
+            self.transport.close()
+        for sock in (self._sock, self._rtcp_sock):
+            if sock:
+                sock.close()
+        self._sock = self._rtcp_sock = None
+        if self._allocator:
+            self._allocator.release(self.local_addr[1])
+            self._allocator = None
+        if self.capture:
+            return self.capture.close()
+
+    def collect(self):
+        """Receive metrics and, while playing, send metrics."""
+        addr = self.local_addr
+        transport = self.transport
+        if transport:
+            addr = transport.get_extra_info('sockname') or addr
+        labels = (('stream', '{}:{}'.format(*addr[:2])),)
+
+        protocol = getattr(self, 'protocol', None)
+        if protocol:
+            yield from protocol.collect(labels)
+        entry = self.scheduler._entries.get(transport)
+        if entry:
+            yield from entry.collect(labels)
+
+    async def packets(self, *, batch=None):
+        """Yield received packets, or lists of up to ``batch`` packets."""
+        queue = self.protocol.packet_queue
+        if queue is None:
+            raise RuntimeError('Packet delivery is disabled on this stream')
+
         while True:
-            yield await self.protocol.packet_queue.get()
+            if batch:
+                yield await queue.get_batch(batch)
+            else:
+                yield await queue.get()
+
+    def frames(self, *, min_delay=40, max_delay=400, conceal=SILENCE):
+        """Yield received media through an adaptive playout buffer.
+
+        A ``Frame`` is released every ``ptime``, reordered and with gaps
+        concealed; see ``PlayoutBuffer``.
+        """
+        protocol = self.protocol
+        if protocol.playout is None:
+            protocol.playout = PlayoutBuffer(
+                self.ptime, stats=protocol.stats, min_delay=min_delay,
+                max_delay=max_delay, conceal=conceal, loop=self._loop)
+        return protocol.playout.frames()
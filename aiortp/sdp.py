@@ -1,25 +1,306 @@
+"""Session descriptions (RFC 4566) and offer/answer (RFC 3264).
+
+``SDP.parse`` reads a description in a single pass over its lines,
+without regular expressions. ``SDP`` renders itself once and caches
+the text. ``negotiate`` picks the codec, telephone-event format, ptime
+and remote address for an audio session from a local offer and the
+remote description.
+"""
+import typing
+
+
+STATIC_FORMATS = {
+    0: ('PCMU', 8000, 1),
+    3: ('GSM', 8000, 1),
+    4: ('G723', 8000, 1),
+    8: ('PCMA', 8000, 1),
+    9: ('G722', 8000, 1),
+    13: ('CN', 8000, 1),
+    18: ('G729', 8000, 1),
+}
+
+TELEPHONE_EVENT = 'telephone-event'
+COMFORT_NOISE = 'CN'
+
+DIRECTIONS = frozenset(('sendrecv', 'sendonly', 'recvonly', 'inactive'))
+
+
+class Format(typing.NamedTuple):
+    """A media format; ``encoding`` is ``None`` without an rtpmap."""
+    payload_type: int
+    encoding: typing.Optional[str] = None
+    clock_rate: typing.Optional[int] = None
+    channels: typing.Optional[int] = None
+    fmtp: typing.Optional[str] = None
+
+    @property
+    def name(self):
+        if self.encoding is None:
+            return STATIC_FORMATS.get(self.payload_type, (None,))[0]
+        return self.encoding
+
+    @property
+    def rate(self):
+        if self.clock_rate is None:
+            return STATIC_FORMATS.get(self.payload_type, (None, None))[1]
+        return self.clock_rate
+
+    def named(self, name):
+        """Whether the encoding is ``name``, ignoring case."""
+        return self.name is not None and self.name.lower() == name.lower()
+
+    def matches(self, other):
+        name, other_name = self.name, other.name
+        return (name is not None and other_name is not None
+                and name.lower() == other_name.lower()
+                and self.rate == other.rate)
+
+    def rtpmap(self):
+        rtpmap = '{}/{}'.format(self.encoding, self.clock_rate)
+        if self.channels:
+            rtpmap += '/{}'.format(self.channels)
+        return rtpmap
+
+
+PCMU = Format(0, 'PCMU', 8000, 1)
+PCMA = Format(8, 'PCMA', 8000, 1)
+DTMF = Format(101, TELEPHONE_EVENT, 8000, fmtp='0-15')
+CN = Format(13)
+
+DEFAULT_FORMATS = (PCMU, DTMF, CN)
+
+
+class Media(typing.NamedTuple):
+    kind: str
+    port: int
+    proto: str
+    formats: typing.Tuple[Format, ...]
+    connection: typing.Optional[str] = None
+    ptime: typing.Optional[int] = None
+    direction: typing.Optional[str] = None
+    attributes: typing.Tuple[typing.Tuple[str, str], ...] = ()
+
+
+def _address_type(address):
+    return 'IP6' if ':' in address else 'IP4'
+
+
+def _connection(value):
+    # c=IN IP4 203.0.113.1/127: drop the TTL or address count
+    return value.split()[2].split('/')[0]
+
+
+class _MediaBuilder:
+    __slots__ = ('kind', 'port', 'proto', 'payload_types', 'rtpmaps',
+                 'fmtps', 'connection', 'ptime', 'direction', 'attributes')
+
+    def __init__(self, value):
+        kind, port, self.proto, *payload_types = value.split()
+        self.kind = kind
+        self.port = int(port.split('/')[0])
+        self.payload_types = [int(pt) for pt in payload_types
+                              if pt.isdigit()]
+        self.rtpmaps = {}
+        self.fmtps = {}
+        self.connection = self.ptime = self.direction = None
+        self.attributes = []
+
+    def build(self):
+        formats = []
+        for payload_type in self.payload_types:
+            encoding = clock_rate = channels = None
+            rtpmap = self.rtpmaps.get(payload_type)
+            if rtpmap:
+                encoding, clock_rate, *rest = rtpmap.split('/') + ['', '']
+                clock_rate = int(clock_rate) if clock_rate else None
+                channels = int(rest[0]) if rest[0] else None
+            formats.append(Format(payload_type, encoding, clock_rate,
+                                  channels, self.fmtps.get(payload_type)))
+        return Media(self.kind, self.port, self.proto, tuple(formats),
+                     self.connection, self.ptime, self.direction,
+                     tuple(self.attributes))
+
+
 class SDP:
-    def __init__(self, local_addr, ptime):
-        self.local_addr = local_addr
+    """A session description.
+
+    Build one with ``SDP.offer`` or ``SDP.parse``. ``str()`` renders it,
+    once; treat the instance as immutable.
+    """
+
+    def __init__(self, media=(), *, origin=None, name='-', info=None,
+                 connection=None, timing='0 0', ptime=None, direction=None,
+                 attributes=()):
+        self.media = tuple(media)
+        self.origin = origin
+        self.name = name
+        self.info = info
+        self.connection = connection
+        self.timing = timing
         self.ptime = ptime
+        self.direction = direction
+        self.attributes = tuple(attributes)
+        self._text = None
+
+    @classmethod
+    def offer(cls, local_addr, ptime, formats=DEFAULT_FORMATS):
+        """Describe a single sendrecv audio stream on ``local_addr``."""
+        host, port = local_addr[:2]
+        origin = 'user1 53655765 2353687637 IN {} {}'.format(
+            _address_type(host), host)
+        media = Media('audio', port, 'RTP/AVP', tuple(formats),
+                      connection=host, ptime=ptime, direction='sendrecv')
+        return cls([media], origin=origin, info='aiortp media stream')
+
+    @classmethod
+    def parse(cls, text):
+        session = cls()
+        media = None
+        builders = []
+        attributes = []
+
+        for line in text.splitlines():
+            kind, _, value = line.partition('=')
+            if len(kind) != 1:
+                continue
+            target = media or session
+
+            if kind == 'a':
+                name, _, arg = value.partition(':')
+                if name == 'rtpmap' or name == 'fmtp':
+                    if media is None:
+                        continue
+                    payload_type, _, arg = arg.partition(' ')
+                    if not payload_type.isdigit():
+                        continue
+                    table = media.rtpmaps if name == 'rtpmap' else \
+                        media.fmtps
+                    table[int(payload_type)] = arg.strip()
+                elif name == 'ptime':
+                    target.ptime = int(float(arg))
+                elif name in DIRECTIONS:
+                    target.direction = name
+                elif media is not None:
+                    media.attributes.append((name, arg))
+                else:
+                    attributes.append((name, arg))
+            elif kind == 'm':
+                media = _MediaBuilder(value)
+                builders.append(media)
+            elif kind == 'c':
+                target.connection = _connection(value)
+            elif kind == 'o':
+                session.origin = value
+            elif kind == 's':
+                session.name = value
+            elif kind == 'i' and media is None:
+                session.info = value
+            elif kind == 't':
+                session.timing = value
+
+        session.media = tuple(builder.build() for builder in builders)
+        session.attributes = tuple(attributes)
+        return session
+
+    def audio(self):
+        """The first audio media description, or ``None``."""
+        for media in self.media:
+            if media.kind == 'audio':
+                return media
+        return None
+
+    def address(self, media):
+        """Where ``media`` is received: its own ``c=`` or the session's."""
+        return media.connection or self.connection, media.port
 
-        local_addr_desc = 'IN IP4 {}'.format(self.local_addr[0])
-        self.payload = '\r\n'.join([
-            'v=0',
-            'o=- 6666 2 IN IP4 {local_addr_desc}',
-            's=SIP Call',
-            'c=IN IP4 {local_addr_desc}',
-            't=0 0',
-            'm=audio 12100 {local_port} 0 101',
-            'a=sendrecv',
-            'a=rtpmap:0 PCMU/8000',
-            'a=ptime:{ptime}',
-            'a=rtpmap:101 telephone-event/8000',
-            'a=fmtp:101 0-11,16',
-            '',
-        ]).format(local_addr_desc=local_addr_desc,
-                  local_port=self.local_addr[1],
-                  ptime=self.ptime)
+    def _render(self):
+        lines = ['v=0']
+        if self.origin:
+            lines.append('o=' + self.origin)
+        lines.append('s=' + self.name)
+        if self.connection:
+            lines.append('c=IN {} {}'.format(
+                _address_type(self.connection), self.connection))
+        lines.append('t=' + self.timing)
+        if self.info:
+            lines.append('i=' + self.info)
+        lines.extend('a={}:{}'.format(*attr) if attr[1] else 'a=' + attr[0]
+                     for attr in self.attributes)
+        if self.ptime:
+            lines.append('a=ptime:{}'.format(self.ptime))
+        if self.direction:
+            lines.append('a=' + self.direction)
+
+        for media in self.media:
+            lines.append('m={} {} {} {}'.format(
+                media.kind, media.port, media.proto,
+                ' '.join(str(fmt.payload_type) for fmt in media.formats)))
+            if media.connection:
+                lines.append('c=IN {} {}'.format(
+                    _address_type(media.connection), media.connection))
+            for fmt in media.formats:
+                if fmt.encoding:
+                    lines.append('a=rtpmap:{} {}'.format(
+                        fmt.payload_type, fmt.rtpmap()))
+                if fmt.fmtp:
+                    lines.append('a=fmtp:{} {}'.format(
+                        fmt.payload_type, fmt.fmtp))
+            lines.extend('a={}:{}'.format(*attr) if attr[1] else
+                         'a=' + attr[0] for attr in media.attributes)
+            if media.ptime:
+                lines.append('a=ptime:{}'.format(media.ptime))
+            if media.direction:
+                lines.append('a=' + media.direction)
+
+        lines.append('')
+        return '\r\n'.join(lines)
 
     def __str__(self):
-        return self.payload
+        if self._text is None:
+            self._text = self._render()
+        return self._text
+
+
+class Negotiated(typing.NamedTuple):
+    remote_addr: typing.Tuple[str, int]
+    format: Format
+    telephone_event: typing.Optional[Format]
+    ptime: int
+
+
+def negotiate(local, remote):
+    """Settle an audio session between ``local`` and ``remote`` SDPs.
+
+    The codec is the first of the remote's formats, in its order of
+    preference, that the local side also lists. Telephone events are
+    used when both sides list them at the codec's clock rate. The remote
+    ``ptime`` wins, since it is what the remote wants to receive.
+    """
+    ours, theirs = local.audio(), remote.audio()
+    if theirs is None:
+        raise ValueError('SDP has no audio media')
+    if ours is None:
+        raise ValueError('Local SDP has no audio media')
+
+    host, port = remote.address(theirs)
+    if host is None:
+        raise ValueError('SDP has no connection address')
+
+    chosen = telephone_event = None
+    for fmt in theirs.formats:
+        if fmt.named(TELEPHONE_EVENT) or fmt.named(COMFORT_NOISE):
+            continue
+        if any(fmt.matches(local_fmt) for local_fmt in ours.formats):
+            chosen = fmt
+            break
+    if chosen is None:
+        raise ValueError('No common codec in SDP')
+
+    if any(fmt.named(TELEPHONE_EVENT) for fmt in ours.formats):
+        for fmt in theirs.formats:
+            if fmt.named(TELEPHONE_EVENT) and fmt.rate == chosen.rate:
+                telephone_event = fmt
+                break
+
+    ptime = theirs.ptime or remote.ptime or ours.ptime or local.ptime
+    return Negotiated((host, port), chosen, telephone_event, ptime)
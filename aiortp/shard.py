@@ -0,0 +1,278 @@
+"""Spread streams over several worker processes.
+
+Each worker runs its own event loop, timer, scheduler and sockets, so
+stream capacity grows with the number of cores. The parent only holds
+a ``ShardedScheduler`` facade and talks to the workers over pipes.
+Sources are built inside the worker from a picklable factory, usually
+a source class, and its arguments.
+"""
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import time
+
+from .scheduler import RTPScheduler
+from .sdp import DEFAULT_FORMATS, SDP
+
+
+LOG = logging.getLogger(__name__)
+
+LEAST_LOADED = 'load'
+BY_PORT = 'port'
+
+
+class _Worker:
+    def __init__(self, conn, scheduler, loop):
+        self.conn = conn
+        self.scheduler = scheduler
+        self.streams = {}
+        self.playing = {}
+        self.closed = loop.create_future()
+        self._loop = loop
+
+    def receive(self):
+        try:
+            while self.conn.poll():
+                command, request, *args = self.conn.recv()
+                self._loop.create_task(self._run(command, request, args))
+        except (EOFError, OSError):
+            # The parent went away
+            if not self.closed.done():
+                self.closed.set_result(None)
+
+    async def _run(self, command, request, args):
+        try:
+            result = await getattr(self, 'do_' + command)(*args)
+        except asyncio.CancelledError:
+            self._reply(request, None, None)
+        except Exception as exc:
+            self._reply(request, None, exc)
+        else:
+            self._reply(request, result, None)
+
+    def _reply(self, request, result, error):
+        try:
+            self.conn.send((request, result, error))
+        except pickle.PicklingError:
+            self.conn.send((request, None, RuntimeError(repr(error))))
+        except (BrokenPipeError, EOFError):
+            pass
+
+    async def do_open(self, stream_id, local_addr, options, sdp):
+        stream = self.scheduler.create_new_stream(local_addr, loop=self._loop,
+                                                  **options)
+        self.streams[stream_id] = stream
+        await stream.negotiate(sdp)
+        return stream.ptime
+
+    async def do_schedule(self, stream_id, factory, args, kwargs):
+        stream = self.streams[stream_id]
+        source = factory(*args, loop=self._loop, **kwargs)
+        task = self._loop.create_task(stream.schedule(source))
+        self.playing[stream_id] = task
+        try:
+            await task
+        finally:
+            if self.playing.get(stream_id) is task:
+                del self.playing[stream_id]
+
+    async def do_stop(self, stream_id):
+        stream = self.streams.pop(stream_id, None)
+        task = self.playing.pop(stream_id, None)
+        if task:
+            task.cancel()
+        if stream:
+            stream.close()
+
+    async def do_stats(self, stream_id):
+        return self.streams[stream_id].protocol.stats.snapshot()
+
+    async def do_load(self):
+        return {
+            'pid': os.getpid(),
+            'streams': len(self.streams),
+            'playing': len(self.scheduler.streams),
+            'overruns': self.scheduler.overruns,
+            'missed_ticks': self.scheduler.missed_ticks,
+            'cpu_time': time.process_time(),
+        }
+
+    async def do_close(self):
+        for stream_id in list(self.streams):
+            await self.do_stop(stream_id)
+        self.scheduler.stop()
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+
+def _worker_main(conn, options):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    worker = _Worker(conn, RTPScheduler(**options), loop)
+    loop.add_reader(conn.fileno(), worker.receive)
+    try:
+        loop.run_until_complete(worker.closed)
+        # Let the close reply go out
+        loop.run_until_complete(asyncio.sleep(0))
+    finally:
+        loop.remove_reader(conn.fileno())
+        conn.close()
+        loop.close()
+
+
+class _Shard:
+    def __init__(self, index, context, options, loop):
+        self.index = index
+        self.streams = 0
+        self.closing = False
+        self._pending = {}
+        self._requests = itertools.count()
+        self._loop = loop
+
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child, options),
+            name='aiortp-shard-{}'.format(index), daemon=True)
+        self.process.start()
+        child.close()
+        loop.add_reader(self.conn.fileno(), self._receive)
+
+    def request(self, command, *args):
+        future = self._loop.create_future()
+        if self.conn.closed:
+            future.set_exception(ConnectionError('Shard is closed'))
+            return future
+
+        request = next(self._requests)
+        self._pending[request] = future
+        self.conn.send((command, request) + args)
+        return future
+
+    def _receive(self):
+        try:
+            while self.conn.poll():
+                request, result, error = self.conn.recv()
+                future = self._pending.pop(request, None)
+                if not future or future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+        except (EOFError, OSError):
+            if not self.closing:
+                LOG.warning('Shard %d exited', self.index)
+            self._disconnect()
+
+    def _disconnect(self):
+        if not self.conn.closed:
+            self._loop.remove_reader(self.conn.fileno())
+            self.conn.close()
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError('Shard exited'))
+
+
+class ShardedStream:
+    """Parent-side handle for a stream living in a worker."""
+
+    def __init__(self, shard, stream_id, local_addr, ptime, options):
+        self.shard = shard
+        self.stream_id = stream_id
+        self.local_addr = local_addr
+        self.ptime = ptime
+        self._options = options
+        self._stopped = False
+
+    def describe(self):
+        return SDP.offer(self.local_addr, self.ptime,
+                         self._options.get('formats', DEFAULT_FORMATS))
+
+    async def negotiate(self, sdp):
+        options = dict(self._options, ptime=self.ptime)
+        # The worker settles the ptime; keep describe() in step with it
+        self.ptime = await self.shard.request(
+            'open', self.stream_id, self.local_addr, options, str(sdp))
+
+    async def schedule(self, factory, *args, **kwargs):
+        """Play ``factory(*args, **kwargs)`` in the worker until it ends.
+
+        The worker passes its own ``loop`` to the factory.
+        """
+        await self.shard.request('schedule', self.stream_id, factory, args,
+                                 kwargs)
+
+    async def stats(self):
+        return await self.shard.request('stats', self.stream_id)
+
+    def stop(self):
+        if not self._stopped:
+            self._stopped = True
+            self.shard.streams -= 1
+        return self.shard.request('stop', self.stream_id)
+
+
+class ShardedScheduler:
+    """``RTPScheduler`` facade over ``workers`` processes.
+
+    New streams go to the worker with the fewest streams, or with
+    ``placement='port'`` to one picked from the local port, so an RTP
+    and RTCP port pair always shares a worker; that needs streams
+    created with an explicit local port. Keyword options are
+    passed on to each worker's ``RTPScheduler``.
+    """
+
+    def __init__(self, workers=None, *, placement=LEAST_LOADED,
+                 context='spawn', loop=None, **options):
+        if placement not in (LEAST_LOADED, BY_PORT):
+            raise ValueError('Unknown placement: {}'.format(placement))
+
+        self.placement = placement
+        self._loop = loop or asyncio.get_event_loop()
+        self._streams = itertools.count()
+        context = multiprocessing.get_context(context)
+        self.shards = [_Shard(index, context, options, self._loop)
+                       for index in range(workers or os.cpu_count())]
+
+    def _place(self, local_addr):
+        if self.placement == BY_PORT:
+            if not local_addr[1]:
+                raise ValueError('Placement by port needs an explicit '
+                                 'local port, not {!r}'.format(
+                                     local_addr[1]))
+            return self.shards[local_addr[1] // 2 % len(self.shards)]
+        return min(self.shards, key=lambda shard: shard.streams)
+
+    def create_new_stream(self, local_addr, *, ptime=20, shard=None,
+                          **options):
+        shard = self.shards[shard] if shard is not None else \
+            self._place(local_addr)
+        shard.streams += 1
+        return ShardedStream(shard, next(self._streams), tuple(local_addr),
+                             ptime, options)
+
+    async def load(self):
+        """Per-worker stream counts, timer overruns and CPU time."""
+        return await asyncio.gather(*(shard.request('load')
+                                      for shard in self.shards))
+
+    async def close(self, timeout=5):
+        for shard in self.shards:
+            if shard.conn.closed:
+                continue
+            shard.closing = True
+            try:
+                await asyncio.wait_for(shard.request('close'), timeout)
+            except (ConnectionError, asyncio.TimeoutError):
+                pass
+            shard._disconnect()
+
+        for shard in self.shards:
+            await self._loop.run_in_executor(None, shard.process.join,
+                                             timeout)
+            if shard.process.is_alive():
+                shard.process.terminate()
@@ -1,65 +1,218 @@
-import audioop
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import math
 
-import numpy as np
 import sndfile
 
+from .cache import encode_file, PROMPT_CACHE
+from .codecs import get_codec
 from .dtmf import DTMF_MAP
-from .packet import RTP, RTPEvent
+from .packet import RTP, RTPEvent, RTPTemplate
+from .tones import tone_loop
 
 
-class AudioFile:
-    def __init__(self, filename, timeframe, *, loop=None, future=None):
-        audio = sndfile.open(filename)
-        frames = audio.read_frames('h')
-        self.media = audioop.lin2ulaw(frames.tobytes(), frames.itemsize)
+class _BufferSource:
+    """Base for sources that play out an in-memory encoded buffer.
 
-        self._loop = loop
-        self._future = future
+    Playback keeps an offset into a ``memoryview`` of the media, so each
+    frame is a zero-copy slice.
+    """
 
-        self.format = 0
-        self.timeframe = timeframe
+    _template = None
 
-        self.stopped = False
-        self.timestamp = 20
-        self.seq = 49709
-        self.ssrc = 167411976
-        self.marked = False
+    def _load(self, media):
+        self.media = memoryview(media)
+        self.offset = 0
 
     def __iter__(self):
         return self
 
-    def __next__(self):
-        if not self.media:
+    def _advance(self):
+        if self.offset >= len(self.media):
             self.stopped = True
 
         if self.stopped:
             raise StopIteration()
 
-        self.media, chunk = self.media[self.timeframe:], self.media[:self.timeframe]
-        result = RTP(marker=self.marked, p_type=self.format, seq=self.seq,
-                     timestamp=self.timestamp, ssrc=self.ssrc, payload=chunk)
+        chunk = self.media[self.offset:self.offset + self.timeframe]
+        self.offset += self.timeframe
         self.timestamp += self.timeframe
-        self.seq += 1
+        return chunk
+
+    def __next__(self):
+        timestamp = self.timestamp
+        chunk = self._advance()
+        result = RTP(marker=self.marked, p_type=self.format, seq=self.seq,
+                     timestamp=timestamp, ssrc=self.ssrc, payload=chunk)
+        self.seq = (self.seq + 1) & 0xffff
         return result
 
+    def render(self):
+        """Return the next packet as a datagram ready to send.
+
+        The datagram is a view of a buffer reused for every packet.
+        """
+        timestamp = self.timestamp
+        chunk = self._advance()
+        if self._template is None:
+            self._template = RTPTemplate(self.format, self.ssrc)
+        data = self._template.render(self.seq, timestamp, chunk, self.marked)
+        self.seq = (self.seq + 1) & 0xffff
+        return data
+
+    def skip(self):
+        self._advance()
+
     def stop(self):
         if self._loop and self._future:
             self._future.cancel()
         self.stopped = True
 
 
-class Tone:
-    def __init__(self, frequency, duration, timeframe, *,
-                 loop=None, future=None, sample_rate=8000, amplitude=10000):
-        sample_times = np.arange(sample_rate * duration) / sample_rate
-        wave = amplitude * np.sin(2 * np.pi * frequency * sample_times)
-        samples = np.array(wave, dtype=np.int16)
-        self.media = audioop.lin2ulaw(samples.tobytes(), 2)
+class AudioFile(_BufferSource):
+    def __init__(self, filename, timeframe, *, codec=0, cache=PROMPT_CACHE,
+                 loop=None, future=None):
+        self.format = codec
+        if cache is None:
+            self._load(encode_file(filename, self.format))
+        else:
+            self._load(cache.get(filename, self.format))
 
         self._loop = loop
         self._future = future
 
-        self.format = 0
+        self.timeframe = timeframe
+
+        self.stopped = False
+        self.timestamp = 20
+        self.seq = 49709
+        self.ssrc = 167411976
+        self.marked = False
+
+
+# Shared by every streaming source; reads are short and IO bound
+_READER = ThreadPoolExecutor(max_workers=4)
+
+
+class StreamingAudioFile(_BufferSource):
+    """Play an audio file without loading all of it.
+
+    The file is decoded and encoded in blocks of ``block_frames`` RTP
+    frames. While one block plays, the next is read on a worker thread,
+    so at most ``readahead + 1`` blocks are ever held in memory. If a
+    read hasn't finished by the time its block is due, a frame of
+    silence goes out instead and is counted in ``underruns``; the event
+    loop never waits on the disk.
+    """
+
+    def __init__(self, filename, timeframe, *, codec=0, block_frames=50,
+                 readahead=1, loop=None, future=None):
+        self._encode = get_codec(codec).encode
+        self._audio = sndfile.open(filename)
+        self._remaining = self._audio.frames
+        self._block_size = block_frames * timeframe
+        self._readahead = readahead
+        self._blocks = deque()
+        self._pending = None
+        self._silence = self._encode(bytes(2 * timeframe))
+        self.underruns = 0
+        self._load(b'')
+
+        self._loop = loop
+        self._future = future
+
+        self.format = codec
+        self.timeframe = timeframe
+
+        self.stopped = False
+        self.timestamp = 20
+        self.seq = 49709
+        self.ssrc = 167411976
+        self.marked = False
+        self._prefetch()
+
+    def _read(self, count):
+        frames = self._audio.read_frames('h', count)
+        return self._encode(frames.tobytes())
+
+    def _take(self):
+        count = min(self._block_size, self._remaining)
+        self._remaining -= count
+        return count
+
+    def _prefetch(self):
+        if self._pending and self._pending.done():
+            self._blocks.append(self._pending.result())
+            self._pending = None
+
+        if (not self._pending and self._remaining
+                and len(self._blocks) < self._readahead):
+            self._pending = _READER.submit(self._read, self._take())
+
+    def _next_block(self):
+        if self._blocks:
+            return self._blocks.popleft()
+        if self._pending:
+            if not self._pending.done():
+                self.underruns += 1
+                return self._silence
+            block, self._pending = self._pending.result(), None
+            return block
+        if self._remaining:
+            return self._read(self._take())
+        return b''
+
+    def _advance(self):
+        if not self.stopped and self.offset >= len(self.media):
+            self._load(self._next_block())
+            if not self.media:
+                self.stopped = True
+                self._close()
+
+        chunk = super()._advance()
+        self._prefetch()
+        return chunk
+
+    def stop(self):
+        super().stop()
+        self._close()
+
+    def _close(self):
+        if self._audio:
+            audio, self._audio = self._audio, None
+            self._blocks.clear()
+            if self._pending:
+                self._pending.add_done_callback(lambda _: audio.close())
+            else:
+                audio.close()
+
+
+class Tone(_BufferSource):
+    """Play a tone from a cached, seamlessly repeating loop.
+
+    ``frequency`` may be a single frequency or a sequence of them for
+    dual-tone signals, and ``cadence`` an on/off pattern in milliseconds.
+    With a ``duration`` of ``None`` the tone plays until stopped.
+    """
+
+    def __init__(self, frequency, duration, timeframe, *, codec=0,
+                 cadence=None, loop=None, future=None, sample_rate=8000,
+                 amplitude=10000):
+        if isinstance(frequency, (tuple, list)):
+            frequencies = tuple(frequency)
+        else:
+            frequencies = (frequency,)
+        self._load(tone_loop(frequencies, amplitude, sample_rate, codec,
+                             tuple(cadence) if cadence else None))
+
+        self.remaining = None
+        if duration is not None:
+            self.remaining = math.ceil(sample_rate * duration)
+
+        self._loop = loop
+        self._future = future
+
+        self.format = codec
         self.timeframe = timeframe
         self.stopped = False
         self.timestamp = 0
@@ -67,28 +220,34 @@ class Tone:
         self.ssrc = 3491926
         self.marked = False
 
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        if not self.media:
+    def _advance(self):
+        if self.remaining is not None and self.remaining <= 0:
             self.stopped = True
 
         if self.stopped:
             raise StopIteration()
 
-        chunk = self.media[:self.timeframe]
-        self.media = self.media[self.timeframe:]
+        size = self.timeframe
+        if self.remaining is not None:
+            size = min(size, self.remaining)
+            self.remaining -= size
+
+        end = self.offset + size
+        if end <= len(self.media):
+            chunk = self.media[self.offset:end]
+            self.offset = end % len(self.media)
+        else:
+            # Wrapping around the loop; only this frame needs a copy
+            parts = []
+            while size:
+                part = self.media[self.offset:self.offset + size]
+                parts.append(part)
+                size -= len(part)
+                self.offset = (self.offset + len(part)) % len(self.media)
+            chunk = b''.join(parts)
 
-        result = RTP(marker=self.marked, p_type=self.format, seq=self.seq,
-                     timestamp=self.timestamp, ssrc=self.ssrc, payload=chunk)
         self.timestamp += self.timeframe
-        return result
-
-    def stop(self):
-        if self._loop and self._future:
-            self._future.cancel()
-        self.stopped = True
+        return chunk
 
 
 class DTMF:
@@ -110,11 +269,12 @@ class DTMF:
         self.seq = 49710
         self.ssrc = 167411978
         self.marked = True
+        self._template = None
 
     def __iter__(self):
         return self
 
-    def __next__(self):
+    def _advance(self):
         if self.stopped:
             raise StopIteration()
 
@@ -139,8 +299,23 @@ class DTMF:
         )
 
         self.cur_length += 20
-        return RTP(marker=self.marked, p_type=self.format, seq=self.seq,
-                   timestamp=self.timestamp, ssrc=self.ssrc, payload=event)
+        return event
+
+    def __next__(self):
+        event = self._advance()
+        result = RTP(marker=self.marked, p_type=self.format, seq=self.seq,
+                     timestamp=self.timestamp, ssrc=self.ssrc, payload=event)
+        self.seq = (self.seq + 1) & 0xffff
+        return result
+
+    def render(self):
+        event = self._advance()
+        if self._template is None:
+            self._template = RTPTemplate(self.format, self.ssrc, size=64)
+        data = self._template.render(self.seq, self.timestamp, bytes(event),
+                                     self.marked)
+        self.seq = (self.seq + 1) & 0xffff
+        return data
 
     def stop(self):
         if self._loop and self._future:
@@ -1,129 +1,189 @@
 from collections.abc import Sequence
 import datetime
-import itertools
 import math
+import typing
 
 import numpy as np
 
+from .codecs import CODECS
 from .dtmf import DTMF_MAP  # noqa
+from .packet import RTPBatch
+from .recvlog import ReceiveLog
 
 
 RTP_MAX_SEQ = 65535
+LOOKAHEAD = 10
+# RFC 3550 appendix A.1
+MIN_SEQUENTIAL = 2
+MAX_DROPOUT = 3000
+MAX_MISORDER = 100
 RTP_PAYLOADS = {0: 'PCMU', 3: 'GSM', 4: 'G723', 8: 'PCMA', 9: 'G722',
                 10: 'L16', 11: 'L16', 13: 'CN', 18: 'G729'}
 
 
-def _calc_jitter(deltas):
+def _calc_jitter(deltas, chunk=256):
     # J_n = J_{n-1} + \frac{|D| - J_{n-1}}{16}
     #
     # Where: J is jitter, D is the difference between the packet time
     # delta and the RTP timestamp delta n is the current packet in the
     # sequence
-    jitter = np.empty(deltas.size)
-    last = 0
+    #
+    # Within a chunk of C deltas the filter has the closed form
+    #
+    #   J_i = a^{i+1} J_{-1} + b a^i \sum_{k<=i} a^{-k} D_k
+    #
+    # with a = 15/16 and b = 1/16. The chunk is short enough that a^{-k}
+    # stays well inside float range, so only the carry between chunks is
+    # left to a Python loop.
+    deltas = np.asarray(deltas, dtype=float)
+    size = deltas.size
+    rows = -(-size // chunk)
+    padded = np.zeros(rows * chunk)
+    padded[:size] = deltas
+    padded = padded.reshape(rows, chunk)
+
+    decay = (15 / 16) ** np.arange(chunk)
+    jitter = np.cumsum(padded / decay, axis=1) * (decay / 16)
+
+    carry = 0.0
+    decay *= 15 / 16
+    for row in jitter:
+        row += carry * decay
+        carry = row[-1]
+
+    return jitter.ravel()[:size]
+
+
+def unwrap_seq(seqs):
+    """Extend 16-bit sequence numbers so they increase across wraparound.
+
+    Each step between consecutive packets is taken as the shortest signed
+    distance modulo 2**16, so reordering up to half the sequence space is
+    tolerated.
+    """
+    seqs = np.asarray(seqs, dtype=np.uint16)
+    ext = np.empty(seqs.size, dtype=np.int64)
+    if seqs.size:
+        ext[0] = seqs[0]
+        np.cumsum(np.diff(seqs).view(np.int16), out=ext[1:])
+        ext[1:] += seqs[0]
+    return ext
+
+
+def _late_arrivals(ext, previous, window=LOOKAHEAD):
+    """Count the missing sequence numbers that arrive shortly after a gap.
+
+    For every gap, the next ``window - 1`` packets are searched for
+    distinct sequence numbers that fall inside the gap.
+    """
+    gaps = np.flatnonzero(ext - previous > 1)
+    if not gaps.size:
+        return 0
+
+    idx = gaps[:, None] + np.arange(1, window)
+    valid = idx < ext.size
+    ahead = ext[np.minimum(idx, ext.size - 1)]
 
-    for idx, diff in enumerate(deltas):
-        jitter[idx] = last = last + (diff - last) / 16
+    in_gap = (valid & (ahead > previous[gaps, None])
+              & (ahead < ext[gaps, None]))
+    sentinel = np.iinfo(np.int64).min
+    ahead = np.sort(np.where(in_gap, ahead, sentinel), axis=1)
 
-    return jitter
+    distinct = ahead != sentinel
+    distinct[:, 1:] &= ahead[:, 1:] != ahead[:, :-1]
+    return int(np.count_nonzero(distinct))
 
 
 class JitterBuffer(Sequence):
     def __init__(self, packets):
-        # Initialize with the first expected sequence number
-        stream = [i.packet.seq for i in packets]
-        expected_seq = first = stream[0]
-        lost_packets = 0
-        duplicates = 0
-        duplicate_mask = []
-
-        def lookahead(gap, position, window=10):
-            '''Look ahead in the stream to spot any late packets'''
-            loss = 0
-            lookahead_buf = stream[position:position + window]
-            for i in gap:
-                if i not in lookahead_buf:
-                    loss += 1
-            return loss
-
-        for position, current_seq in enumerate(stream):
-            if current_seq == expected_seq:
-                # This packet is not a duplicate and should be
-                # included in the non-duplicated stream
-                duplicate_mask.append(True)
-                # set the next expected sequence number
-                expected_seq += 1
-            elif current_seq == expected_seq - 1:
-                # Current seqence number is the same as the previous, therefore
-                # duplicated
-                duplicates += 1  # count the duplicate
-                duplicate_mask.append(False)  # add it to the filter
-            elif current_seq > expected_seq:
-                # missing sequence numbers detected; Check ahead before
-                # counting as loss
-                gap = range(expected_seq, current_seq)
-                lost_packets += lookahead(gap, position)
-                expected_seq = current_seq + 1
-                duplicate_mask.append(True)
-            elif current_seq <= first:
-                # sequence number is less than the current we must have
-                # rolled over during loss
-                gap = list(range(expected_seq, RTP_MAX_SEQ + 1))\
-                    + list(range(0, current_seq))
-                lost_packets += lookahead(gap, position)
-                expected_seq = current_seq + 1
-                duplicate_mask.append(True)
-
-            if expected_seq > RTP_MAX_SEQ:
-                # If we're about to roll over, reset to zero
-                expected_seq = 0
+        if isinstance(packets, ReceiveLog):
+            packets = packets.batch()
+        elif not isinstance(packets, RTPBatch):
+            packets = RTPBatch.from_packets(packets)
+
+        ext = unwrap_seq(packets.headers['seq'])
+
+        # The highest sequence number seen before each packet. A packet
+        # moving past it is kept, one repeating it is a duplicate, and
+        # anything older arrived late and is dropped.
+        previous = np.empty_like(ext)
+        previous[0] = ext[0] - 1
+        previous[1:] = np.maximum.accumulate(ext)[:-1]
+        keep = ext > previous
+
+        # Gaps count as loss unless the packet shows up in the lookahead
+        gap_total = int(np.sum(ext[keep] - previous[keep] - 1))
+        lost_packets = gap_total - _late_arrivals(ext, previous)
+        duplicates = int(np.count_nonzero(ext == previous))
 
         self.duplicates = duplicates / len(packets)
         self.lost = lost_packets
         self.loss = lost_packets / len(packets)
-        self._data = list(itertools.compress(packets, duplicate_mask))
+        self.batch = packets if keep.all() else packets[keep]
 
     def __getitem__(self, index):
-        return self._data[index]
+        return self.batch[index]
 
     def __len__(self):
-        return len(self._data)
+        return len(self.batch)
+
+
+def _pick_codec(p_types):
+    # The most common payload type we can decode
+    known = np.isin(p_types, list(CODECS))
+    if not known.any():
+        return None
+    values, counts = np.unique(p_types[known], return_counts=True)
+    return CODECS[int(values[np.argmax(counts)])]
 
 
 class StreamStats:
-    def __init__(self, packets):
+    def __init__(self, packets, *, codec=None, clock_rate=None):
         self.packets = JitterBuffer(packets)
 
-        codecs = set(pkt.packet.p_type for pkt in self.packets)
+        headers = self.packets.batch.headers
+
+        codecs = np.unique(headers['p_type']).tolist()
         self.codecs = [RTP_PAYLOADS.get(codec, str(codec)) for codec in codecs]
 
-        timestamps = np.fromiter(
-            (pkt.packet.timestamp for pkt in self.packets),
-            np.float
-        )
+        if codec is None:
+            codec = _pick_codec(headers['p_type'])
+        elif isinstance(codec, int):
+            codec = CODECS[codec]
+        self.codec = codec
 
-        frametimes = np.fromiter(
-            (pkt.frametime for pkt in self.packets),
-            np.float
-        )
+        frametimes = headers['frametime']
 
         timedelta = frametimes[-1] - frametimes[0]
         self.deltas = np.diff(frametimes) * 1000
         self.duration = datetime.timedelta(seconds=timedelta)
-        self.sample_rate = 8000
+        if clock_rate is None:
+            clock_rate = codec.sample_rate if codec else 8000
+        self.sample_rate = clock_rate
 
-        period = 1 / self.sample_rate
-        rtpdeltas = np.diff(timestamps) * period * 1000
+        # Signed 32-bit steps, so a timestamp wrapping mid-call is harmless
+        steps = np.diff(headers['timestamp'].astype(np.uint32)).view(np.int32)
+        rtpdeltas = steps * (1000 / clock_rate)
         deltas = np.abs(self.deltas - rtpdeltas)
 
         self.jitter = _calc_jitter(deltas)
 
-        raw_audio = b''.join(x.packet.payload for x in self.packets)
-        self.audio = np.fromstring(raw_audio, dtype=np.int8).astype(float)
+        raw_audio = b''.join(self.packets.batch.payloads)
+        self.audio = np.frombuffer(raw_audio, dtype=np.int8).astype(float)
 
         rms = np.linalg.norm(self.audio) / np.sqrt(self.audio.size)
         self.rms = math.log10(rms) * 20
 
+        # Decoded linear audio and its RMS level in dBFS
+        self.pcm = self.level = None
+        if codec:
+            mask = headers['p_type'] == codec.payload_type
+            payloads = self.packets.batch[mask].payloads
+            self.pcm = codec.decode(b''.join(payloads))
+            if self.pcm.size:
+                level = np.sqrt(np.mean(self.pcm.astype(float) ** 2))
+                self.level = 20 * math.log10(max(level, 1) / 32768)
+
         # self.rtpevents = list(iter_rtpevents(self.packets))
         # if self.rtpevents:
         #     self.digits = list(iter_dtmf(self.rtpevents))
@@ -139,3 +199,194 @@ class StreamStats:
     @property
     def loss(self):
         return self.packets.loss
+
+
+class LiveSnapshot(typing.NamedTuple):
+    received: int
+    duplicates: int
+    reordered: int
+    expected: int
+    lost: int
+    loss: float
+    jitter: float
+    min_delta: float
+    mean_delta: float
+    max_delta: float
+    level: typing.Optional[float]
+    duration: datetime.timedelta
+
+
+class LiveStats:
+    """Online stream quality accumulator.
+
+    ``update`` is O(1) per packet and nothing about individual packets is
+    retained, so a snapshot can be read at any point during a call.
+    Sequence tracking follows RFC 3550 appendix A.1: a new SSRC is only
+    counted after ``MIN_SEQUENTIAL`` packets in sequence, and a jump of
+    more than ``MAX_DROPOUT`` ahead or ``MAX_MISORDER`` behind is ignored
+    unless the next packet confirms it, which restarts the counts. A new
+    SSRC starts every statistic afresh. Jitter follows appendix A.8.
+    Duplicates and reordering are detected within a window of the last
+    ``window`` sequence numbers.
+
+    The audio level needs every payload decoded, so it is only tracked
+    with ``track_level``.
+    """
+
+    def __init__(self, *, clock_rate=8000, window=128, track_level=False):
+        self.clock_rate = clock_rate
+        self.window = window
+        self.track_level = track_level
+        self.ssrc = None
+        self._mask = (1 << window) - 1
+        self._reset()
+
+    def _reset(self):
+        self.received = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.jitter = 0.0
+        self.min_delta = math.inf
+        self.max_delta = 0.0
+
+        self._seen = 0
+        self._base_seq = None
+        self._max_seq = None
+        self._probation = 0
+        self._probe = None
+        self._bad_seq = None
+        # Arrival of the first packet of a run that may restart the counts
+        self._run_start = None
+        self._first_arrival = None
+        self._last_arrival = None
+        self._last_timestamp = None
+        self._sum_squares = 0.0
+        self._samples = 0
+
+    def _new_source(self, ssrc):
+        self.ssrc = ssrc
+        self._reset()
+        self._probation = MIN_SEQUENTIAL
+
+    def _restart(self, seq, count):
+        """Count afresh from the ``count`` packets in sequence up to
+        ``seq`` (``init_seq``)."""
+        self._base_seq = seq - count + 1
+        self._max_seq = seq
+        self._seen = (1 << count) - 1 & self._mask
+        self._bad_seq = None
+        self._first_arrival = self._run_start
+        self.received = count - 1
+
+    def _update_seq(self, seq, frametime):
+        """Whether ``seq`` is counted, as ``update_seq`` decides."""
+        if self._probation:
+            if self._probe is not None and \
+                    seq == (self._probe + 1) & RTP_MAX_SEQ:
+                self._probation -= 1
+                if not self._probation:
+                    self._restart(seq, MIN_SEQUENTIAL)
+                    return True
+            else:
+                self._probation = MIN_SEQUENTIAL - 1
+                self._run_start = frametime
+            self._probe = seq
+            return False
+
+        udelta = (seq - self._max_seq) & RTP_MAX_SEQ
+        if udelta < MAX_DROPOUT:
+            if not udelta:
+                self.duplicates += 1
+                return False
+            if udelta < self.window:
+                self._seen = ((self._seen << udelta) | 1) & self._mask
+            else:
+                self._seen = 1
+            self._max_seq += udelta
+        elif udelta <= RTP_MAX_SEQ + 1 - MAX_MISORDER:
+            # A big jump; believe it once the next packet follows on
+            if seq != self._bad_seq:
+                self._bad_seq = (seq + 1) & RTP_MAX_SEQ
+                self._run_start = frametime
+                return False
+            self._restart(seq, 2)
+        else:
+            back = RTP_MAX_SEQ + 1 - udelta
+            bit = 1 << back if back < self.window else 0
+            if bit and self._seen & bit:
+                self.duplicates += 1
+                return False
+            self._seen |= bit
+            self._base_seq = min(self._base_seq, self._max_seq - back)
+            self.reordered += 1
+        return True
+
+    def update(self, frametime, packet):
+        if packet.ssrc != self.ssrc:
+            self._new_source(packet.ssrc)
+        probation = self._probation
+        if not self._update_seq(packet.seq, frametime) and not probation:
+            return
+
+        if self._last_arrival is not None:
+            delta = (frametime - self._last_arrival) * 1000
+            self.min_delta = min(self.min_delta, delta)
+            self.max_delta = max(self.max_delta, delta)
+
+        if self._last_timestamp is not None:
+            # Allow for the 32-bit RTP timestamp wrapping
+            step = (packet.timestamp - self._last_timestamp + 0x80000000) \
+                % 0x100000000 - 0x80000000
+            d = (frametime - self._last_arrival) * self.clock_rate - step
+            self.jitter += (abs(d) - self.jitter) / 16
+
+        if not self._probation:
+            self.received += 1
+        self._last_arrival = frametime
+        self._last_timestamp = packet.timestamp
+
+        if self.track_level:
+            codec = CODECS.get(packet.p_type)
+            if codec and packet.payload:
+                samples = codec.decode(packet.payload).astype(float)
+                self._sum_squares += float(np.dot(samples, samples))
+                self._samples += samples.size
+
+    @property
+    def highest_seq(self):
+        """Extended highest sequence number received, or ``None``."""
+        return self._max_seq
+
+    @property
+    def expected(self):
+        if self._max_seq is None:
+            return 0
+        return self._max_seq - self._base_seq + 1
+
+    def snapshot(self):
+        expected = self.expected
+        lost = max(0, expected - self.received)
+        deltas = self.received - 1
+        level = None
+        if self._samples:
+            rms = math.sqrt(self._sum_squares / self._samples)
+            level = 20 * math.log10(max(rms, 1) / 32768)
+
+        duration = 0.0
+        if self._first_arrival is not None:
+            duration = self._last_arrival - self._first_arrival
+
+        return LiveSnapshot(
+            received=self.received,
+            duplicates=self.duplicates,
+            reordered=self.reordered,
+            expected=expected,
+            lost=lost,
+            loss=lost / expected if expected else 0.0,
+            jitter=self.jitter / self.clock_rate * 1000,
+            min_delta=self.min_delta if deltas > 0 else 0.0,
+            mean_delta=duration * 1000 / deltas if deltas > 0 else 0.0,
+            max_delta=self.max_delta,
+            level=level,
+            duration=datetime.timedelta(seconds=duration),
+        )
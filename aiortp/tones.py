@@ -0,0 +1,73 @@
+from fractions import Fraction
+import functools
+import math
+
+import numpy as np
+
+from .codecs import get_codec
+
+
+# Shortest loop worth caching. Loops are at least this long so that
+# frames rarely straddle the wrap-around point.
+MIN_LOOP = 1600
+# Give up on exact periodicity for tones whose period is longer than this
+MAX_PERIOD = 10 * 8000
+
+# North American call progress tones: (frequencies, cadence in ms)
+DIAL = ((350, 440), None)
+RINGBACK = ((440, 480), (2000, 4000))
+BUSY = ((480, 620), (500, 500))
+REORDER = ((480, 620), (250, 250))
+
+DTMF_FREQUENCIES = {
+    '1': (697, 1209), '2': (697, 1336), '3': (697, 1477), 'A': (697, 1633),
+    '4': (770, 1209), '5': (770, 1336), '6': (770, 1477), 'B': (770, 1633),
+    '7': (852, 1209), '8': (852, 1336), '9': (852, 1477), 'C': (852, 1633),
+    '*': (941, 1209), '0': (941, 1336), '#': (941, 1477), 'D': (941, 1633),
+}
+
+
+def period(frequencies, sample_rate):
+    """Number of samples after which a sum of sines repeats exactly."""
+    values = [Fraction(freq).limit_denominator(1000) for freq in frequencies]
+    values.append(Fraction(sample_rate))
+    denominator = functools.reduce(
+        lambda a, b: a * b // math.gcd(a, b),
+        (value.denominator for value in values))
+    numerators = [int(value * denominator) for value in values]
+    return min(numerators[-1] // functools.reduce(math.gcd, numerators),
+               MAX_PERIOD)
+
+
+def synthesize(frequencies, samples, *, sample_rate=8000, amplitude=10000):
+    sample_times = np.arange(samples) / sample_rate
+    wave = sum(np.sin(2 * np.pi * freq * sample_times)
+               for freq in frequencies)
+    return np.array(amplitude / len(frequencies) * wave, dtype=np.int16)
+
+
+@functools.lru_cache(maxsize=128)
+def tone_loop(frequencies, amplitude=10000, sample_rate=8000, codec=0,
+              cadence=None):
+    """Return one encoded, seamlessly repeating loop of a tone.
+
+    ``cadence`` is a sequence of alternating on and off durations in
+    milliseconds; the loop then covers the whole cadence. Results are
+    cached, so every caller playing the same tone shares one buffer.
+    """
+    encode = get_codec(codec).encode
+    if not cadence:
+        length = period(frequencies, sample_rate)
+        length *= max(1, -(-MIN_LOOP // length))
+        return encode(synthesize(frequencies, length, sample_rate=sample_rate,
+                                 amplitude=amplitude))
+
+    segments = [sample_rate * duration // 1000 for duration in cadence]
+    samples = synthesize(frequencies, sum(segments), sample_rate=sample_rate,
+                         amplitude=amplitude)
+    position = 0
+    for idx, length in enumerate(segments):
+        if idx % 2:
+            samples[position:position + length] = 0
+        position += length
+    return encode(samples)
@@ -0,0 +1,36 @@
+class TimingWheel:
+    """A hashed timing wheel.
+
+    Items are scheduled a whole number of ticks into the future and
+    bucketed by their due tick modulo the number of slots. Advancing the
+    wheel only touches the bucket for the current tick, so as long as
+    delays stay below ``slots`` the cost of a tick is proportional to the
+    number of items that are due.
+    """
+
+    def __init__(self, slots=64):
+        self.tick = 0
+        self._slots = [[] for _ in range(slots)]
+
+    def __len__(self):
+        return sum(len(slot) for slot in self._slots)
+
+    def schedule(self, item, delay):
+        if delay < 1:
+            raise ValueError('delay must be at least one tick')
+        due = self.tick + delay
+        self._slots[due % len(self._slots)].append((due, item))
+
+    def advance(self):
+        """Move the wheel forward one tick and return the items due."""
+        self.tick += 1
+        idx = self.tick % len(self._slots)
+        slot = self._slots[idx]
+
+        due = [item for when, item in slot if when <= self.tick]
+        if len(due) == len(slot):
+            self._slots[idx] = []
+        else:
+            self._slots[idx] = [entry for entry in slot
+                                if entry[0] > self.tick]
+        return due
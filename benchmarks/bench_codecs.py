@@ -0,0 +1,52 @@
+"""Compare G.711 throughput of aiortp.codecs against audioop.
+
+    python benchmarks/bench_codecs.py --seconds 600
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from aiortp import codecs
+
+try:
+    import audioop
+except ImportError:  # pragma: no cover
+    audioop = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=600,
+                        help='length of audio to encode, at 8 kHz')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-32768, 32768, int(args.seconds * 8000),
+                           dtype=np.int16)
+    pcm = samples.tobytes()
+
+    cases = []
+    for codec, name in ((codecs.PCMU, 'ulaw'), (codecs.PCMA, 'alaw')):
+        encoded = codec.encode(pcm)
+        cases.append(('{} encode numpy'.format(name),
+                      lambda codec=codec: codec.encode(pcm)))
+        cases.append(('{} decode numpy'.format(name),
+                      lambda codec=codec, data=encoded: codec.decode(data)))
+        if audioop:
+            encode = getattr(audioop, 'lin2{}'.format(name))
+            decode = getattr(audioop, '{}2lin'.format(name))
+            cases.append(('{} encode audioop'.format(name),
+                          lambda encode=encode: encode(pcm, 2)))
+            cases.append(('{} decode audioop'.format(name),
+                          lambda decode=decode, data=encoded: decode(data, 2)))
+
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print('{:<20} {:8.2f} Msamples/s'.format(
+            name, samples.size / best / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Time JitterBuffer loss/duplicate analysis on synthetic captures.
+
+    python benchmarks/bench_jitterbuffer.py --packets 1000000
+
+The capture wraps the sequence space many times and includes bursty
+loss, duplicates and reordering. The previous pure-Python analysis is
+kept here as a reference and its results are checked against.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from aiortp.packet import RTPBatch, rtpbatch
+from aiortp.stats import JitterBuffer, RTP_MAX_SEQ
+
+
+def reference(stream, window=10):
+    expected = first = stream[0]
+    lost = duplicates = 0
+    mask = []
+
+    def lookahead(gap, position):
+        ahead = stream[position:position + window]
+        return sum(1 for seq in gap if seq not in ahead)
+
+    for position, current in enumerate(stream):
+        if current == expected:
+            mask.append(True)
+            expected += 1
+        elif current == expected - 1:
+            duplicates += 1
+            mask.append(False)
+        elif current > expected:
+            lost += lookahead(range(expected, current), position)
+            expected = current + 1
+            mask.append(True)
+        elif current <= first:
+            gap = (list(range(expected, RTP_MAX_SEQ + 1))
+                   + list(range(0, current)))
+            lost += lookahead(gap, position)
+            expected = current + 1
+            mask.append(True)
+        else:
+            mask.append(False)
+
+        if expected > RTP_MAX_SEQ:
+            expected = 0
+
+    return lost, duplicates, sum(mask)
+
+
+def capture(count, *, loss=0.01, burst=3, duplicate=0.005, reorder=0.005,
+            seed=0):
+    rng = np.random.default_rng(seed)
+    seqs = np.arange(count, dtype=np.int64)
+
+    # Bursty loss: drop runs starting at random points
+    starts = np.flatnonzero(rng.random(count) < loss / burst)
+    dropped = (starts[:, None] + np.arange(burst)).ravel()
+    seqs = np.delete(seqs, dropped[dropped < count])
+
+    # Swap adjacent packets, then repeat a few
+    swaps = np.flatnonzero(rng.random(seqs.size - 1) < reorder)
+    swaps = swaps[np.diff(swaps, prepend=-2) > 1]
+    seqs[swaps], seqs[swaps + 1] = seqs[swaps + 1], seqs[swaps].copy()
+    seqs = np.repeat(seqs, np.where(rng.random(seqs.size) < duplicate, 2, 1))
+
+    headers = np.zeros(seqs.size, dtype=rtpbatch)
+    headers['seq'] = seqs & 0xffff
+    headers['frametime'] = np.arange(seqs.size) * 0.02
+    return RTPBatch(headers, [b''] * seqs.size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packets', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-reference', action='store_true',
+                        help='skip the pure-Python reference')
+    args = parser.parse_args()
+
+    batch = capture(args.packets)
+    best = float('inf')
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        buffer = JitterBuffer(batch)
+        best = min(best, time.perf_counter() - start)
+
+    duplicates = round(buffer.duplicates * len(batch))
+    print('{} packets: {} kept, {} lost, {} duplicates'.format(
+        len(batch), len(buffer), buffer.lost, duplicates))
+    print('{:<10} {:8.3f} s {:10.2f} Mpackets/s'.format(
+        'numpy', best, len(batch) / best / 1e6))
+
+    if args.no_reference:
+        return
+
+    stream = batch.headers['seq'].tolist()
+    start = time.perf_counter()
+    expected = reference(stream)
+    elapsed = time.perf_counter() - start
+    print('{:<10} {:8.3f} s {:10.2f} Mpackets/s'.format(
+        'reference', elapsed, len(batch) / elapsed / 1e6))
+
+    if expected != (buffer.lost, duplicates, len(buffer)):
+        raise SystemExit('mismatch: reference gave {}'.format(expected))
+
+
+if __name__ == '__main__':
+    main()
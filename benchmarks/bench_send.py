@@ -0,0 +1,127 @@
+"""Compare per-transport sendto against batched sendmmsg transmission.
+
+Runs N streams over loopback into a single sink socket and reports
+send syscalls per second and CPU time per stream for both paths::
+
+    python benchmarks/bench_send.py --streams 2000 --duration 5
+
+With ``--shared`` every stream sends from one shared socket, which is
+where ``sendmmsg`` can actually batch across streams.
+"""
+import argparse
+import asyncio
+import time
+
+import aiortp
+from aiortp.mux import SharedEndpoint
+from aiortp.packet import RTP
+
+
+class SilenceSource:
+    def __init__(self, ssrc):
+        self.ssrc = ssrc
+        self.seq = 0
+        self.timestamp = 0
+        self.stopped = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        packet = RTP(seq=self.seq & 0xffff, timestamp=self.timestamp,
+                     ssrc=self.ssrc, payload=b'\xff' * 160)
+        self.seq += 1
+        self.timestamp += 160
+        return packet
+
+    def stop(self):
+        self.stopped = True
+
+
+class CountingTransport:
+    """Wrap a transport to count sendto calls on the unbatched path."""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+    def sendto(self, data, addr=None):
+        self.calls += 1
+        self.transport.sendto(data, addr)
+
+    def get_extra_info(self, name, default=None):
+        return self.transport.get_extra_info(name, default)
+
+    def get_write_buffer_size(self):
+        return self.transport.get_write_buffer_size()
+
+
+async def run(streams, duration, batch_send, shared):
+    loop = asyncio.get_event_loop()
+    sink, _ = await loop.create_datagram_endpoint(
+        asyncio.DatagramProtocol, local_addr=('127.0.0.1', 0))
+    sink_addr = sink.get_extra_info('sockname')
+
+    scheduler = aiortp.RTPScheduler(batch_send=batch_send)
+    endpoint = SharedEndpoint(('127.0.0.1', 0), loop=loop)
+    transports = []
+    for ssrc in range(streams):
+        if shared:
+            # Distinct destinations keep the demux happy; the sink only
+            # listens on one of them, the rest are silently dropped.
+            transport = endpoint.register((sink_addr[0], sink_addr[1] + ssrc),
+                                          asyncio.DatagramProtocol())
+        else:
+            transport, _ = await loop.create_datagram_endpoint(
+                asyncio.DatagramProtocol, remote_addr=sink_addr)
+        transport = CountingTransport(transport)
+        transports.append(transport)
+        scheduler.add(transport, SilenceSource(ssrc), ptime=20)
+
+    cpu, wall = time.process_time(), time.monotonic()
+    await asyncio.sleep(duration)
+    cpu, wall = time.process_time() - cpu, time.monotonic() - wall
+
+    scheduler._timer.close()
+    scheduler.stop()
+    for transport in transports:
+        transport.transport.close()
+    endpoint.close()
+    sink.close()
+
+    syscalls = sum(transport.calls for transport in transports)
+    if scheduler.sender:
+        syscalls = scheduler.sender.syscalls
+    return {
+        'syscalls/s': syscalls / wall,
+        'cpu %': 100 * cpu / wall,
+        'cpu us/stream/s': 1e6 * cpu / wall / streams,
+        'overruns': scheduler.overruns,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streams', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--shared', action='store_true',
+                        help='send every stream from one shared socket')
+    args = parser.parse_args()
+
+    for name, batch_send in (('sendto', False), ('sendmmsg', True)):
+        # aiotimer leaves its reader registered on close, so give each
+        # run a fresh loop
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        result = loop.run_until_complete(
+            run(args.streams, args.duration, batch_send, args.shared))
+        loop.close()
+        print('{:<10}'.format(name), '  '.join(
+            '{}={:.1f}'.format(key, value) for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
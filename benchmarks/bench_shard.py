@@ -0,0 +1,67 @@
+"""Measure how sharded stream capacity scales with worker processes.
+
+    python benchmarks/bench_shard.py --streams 500 --workers 1 2 4
+
+Every worker plays the same number of tone streams into a sink socket
+that is never read. For each worker count the benchmark reports the
+CPU each worker used and the ticks its timer missed; capacity scales
+linearly while per-worker load stays flat.
+"""
+import argparse
+import asyncio
+import socket
+
+from aiortp.shard import ShardedScheduler
+from aiortp.sources import Tone
+
+
+async def run(loop, workers, streams, seconds, sink_port):
+    sharded = ShardedScheduler(workers, loop=loop)
+    sdp = 'c=IN IP4 127.0.0.1\r\nm=audio {} RTP/AVP 0\r\n'.format(sink_port)
+    try:
+        handles = [sharded.create_new_stream(('127.0.0.1', 0))
+                   for _ in range(streams * workers)]
+        await asyncio.gather(*(stream.negotiate(sdp) for stream in handles))
+
+        before = await sharded.load()
+        await asyncio.gather(*(stream.schedule(Tone, 1000, seconds, 160)
+                               for stream in handles))
+        after = await sharded.load()
+    finally:
+        await sharded.close()
+
+    cpu = [(end['cpu_time'] - start['cpu_time']) / seconds
+           for start, end in zip(before, after)]
+    missed = sum(end['missed_ticks'] for end in after)
+    pps = len(handles) * 50
+    print('{:>3} workers {:>6} streams {:>8} pps  cpu/worker {:5.1f}% '
+          'max {:5.1f}%  missed ticks {}'.format(
+              workers, len(handles), pps, 100 * sum(cpu) / len(cpu),
+              100 * max(cpu), missed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streams', type=int, default=200,
+                        help='streams per worker')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    try:
+        for workers in args.workers:
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(run(loop, workers, args.streams,
+                                            args.seconds,
+                                            sink.getsockname()[1]))
+            finally:
+                loop.close()
+    finally:
+        sink.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""Reproducible loopback benchmarks for aiortp's hot paths.
+
+    python benchmarks/suite.py                       # run everything
+    python benchmarks/suite.py packet sources        # run some groups
+    python benchmarks/suite.py --save baseline.json
+    python benchmarks/suite.py --compare baseline.json --threshold 10
+
+Groups:
+
+``packet``
+    ``RTP.parse``, ``bytes(RTP)``, ``RTP.pack_into`` and
+    ``RTPBatch.parse_many`` throughput.
+``sources``
+    Frame generation by ``AudioFile``, ``Tone`` and ``DTMF``, as
+    ``RTP`` tuples and as rendered datagrams.
+``stats``
+    ``StreamStats`` over a large synthetic capture.
+``e2e``
+    N streams sent through ``RTPScheduler`` to N receiving ``RTPStream``
+    objects on loopback, each drained by a consumer, recording pps, CPU,
+    tick lateness and, after the run, resident memory per stream.
+
+``--compare`` exits non-zero when any metric is more than
+``--threshold`` percent worse than the saved baseline. Metrics ending in
+``_per_s`` are better when higher, everything else when lower.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+import aiortp
+from aiortp.packet import RTP, RTPBatch, rtpbatch
+from aiortp.stats import StreamStats
+
+
+def rate(func, count, *, repeat=3):
+    """Best-of-``repeat`` rate of ``count`` operations done by ``func``."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def bench_packet(args):
+    packet = RTP(seq=1234, timestamp=5678, ssrc=91011, payload=b'\xff' * 160)
+    data = bytes(packet)
+    buffer = bytearray(1500)
+    count = args.packets
+    datagrams = [data] * count
+
+    def parse():
+        for datagram in datagrams:
+            RTP.parse(datagram)
+
+    def serialize():
+        for _ in range(count):
+            bytes(packet)
+
+    def pack_into():
+        for _ in range(count):
+            packet.pack_into(buffer)
+
+    return {
+        'parse_per_s': rate(parse, count),
+        'bytes_per_s': rate(serialize, count),
+        'pack_into_per_s': rate(pack_into, count),
+        'parse_many_per_s': rate(lambda: RTPBatch.parse_many(datagrams),
+                                 count),
+    }
+
+
+def write_prompt(path, seconds):
+    samples = (1000 * np.sin(np.arange(8000 * seconds) / 10)).astype('<i2')
+    with wave.open(path, 'wb') as prompt:
+        prompt.setnchannels(1)
+        prompt.setsampwidth(2)
+        prompt.setframerate(8000)
+        prompt.writeframes(samples.tobytes())
+
+
+def drain(source):
+    frames = 0
+    for _ in source:
+        frames += 1
+    return frames
+
+
+def drain_rendered(source):
+    frames = 0
+    try:
+        while True:
+            source.render()
+            frames += 1
+    except StopIteration:
+        return frames
+
+
+def bench_sources(args):
+    seconds = args.frames // 50
+    with tempfile.TemporaryDirectory() as tmpdir:
+        prompt = os.path.join(tmpdir, 'prompt.wav')
+        write_prompt(prompt, seconds)
+        aiortp.AudioFile(prompt, 160)  # warm the prompt cache
+
+        return {
+            'audiofile_frames_per_s': rate(
+                lambda: drain(aiortp.AudioFile(prompt, 160)),
+                args.frames),
+            'streaming_audiofile_frames_per_s': rate(
+                lambda: drain(aiortp.StreamingAudioFile(prompt, 160)),
+                args.frames),
+            'tone_frames_per_s': rate(
+                lambda: drain(aiortp.Tone(1000, seconds, 160)), args.frames),
+            'tone_render_frames_per_s': rate(
+                lambda: drain_rendered(aiortp.Tone(1000, seconds, 160)),
+                args.frames),
+            'dtmf_frames_per_s': rate(
+                lambda: drain(aiortp.DTMF('1234567890' * (seconds // 2),
+                                          tone_length=200)),
+                args.frames),
+        }
+
+
+def synthetic_capture(count, seed=0):
+    rng = np.random.default_rng(seed)
+    keep = rng.random(count) > 0.01
+    seqs = np.arange(count)[keep]
+    headers = np.zeros(seqs.size, dtype=rtpbatch)
+    headers['version'] = 2
+    headers['seq'] = seqs & 0xffff
+    headers['timestamp'] = seqs * 160
+    headers['frametime'] = seqs * 0.02 + rng.normal(0, 0.002, seqs.size)
+    payload = memoryview(bytes(range(256)) * 160)
+    payloads = [payload[idx % 256:idx % 256 + 160] for idx in seqs.tolist()]
+    return RTPBatch(headers, payloads)
+
+
+def bench_stats(args):
+    capture = synthetic_capture(args.capture)
+    return {
+        'stream_stats_packets_per_s': rate(lambda: StreamStats(capture),
+                                           len(capture)),
+    }
+
+
+def rss():
+    """Resident memory in bytes, or 0 without ``/proc``."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except OSError:
+        return 0
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+async def _consume(stream):
+    async for _ in stream.packets(batch=64):
+        pass
+
+
+async def _e2e(streams, duration, batch_send):
+    loop = asyncio.get_event_loop()
+    scheduler = aiortp.RTPScheduler(batch_send=batch_send)
+
+    gc.collect()
+    memory = rss()
+    senders, receivers = [], []
+    for _ in range(streams):
+        sender, receiver = (
+            scheduler.create_new_stream(('127.0.0.1', None), loop=loop)
+            for _ in range(2))
+        await receiver.negotiate(sender.describe())
+        await sender.negotiate(receiver.describe())
+        senders.append(sender)
+        receivers.append(receiver)
+    consumers = [loop.create_task(_consume(receiver))
+                 for receiver in receivers]
+
+    for stream in senders:
+        source = aiortp.Tone(1000, duration + 1, 160, loop=loop)
+        scheduler.add(stream.transport, source)
+
+    gc.collect()
+    cpu, wall = time.process_time(), time.monotonic()
+    await asyncio.sleep(duration)
+    cpu, wall = time.process_time() - cpu, time.monotonic() - wall
+    received = sum(stream.protocol.received for stream in receivers)
+
+    # Sample once the receive logs and stats have filled up
+    gc.collect()
+    memory = rss() - memory
+
+    scheduler._timer.close()
+    scheduler.stop()
+    for consumer in consumers:
+        consumer.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+    for stream in senders + receivers:
+        stream.close()
+    for allocator in scheduler.allocators.values():
+        allocator.close()
+
+    return {
+        'sent_per_s': scheduler.packets_sent / wall,
+        'received_per_s': received / wall,
+        'cpu_percent': 100 * cpu / wall,
+        'tick_lateness_mean_ms': scheduler.lateness.mean,
+        'tick_lateness_max_ms': scheduler.lateness.max,
+        'tick_duration_mean_ms': scheduler.tick_duration.mean,
+        'memory_per_stream_bytes': memory / streams,
+    }
+
+
+def bench_e2e(args):
+    # aiotimer leaves its reader registered on close, so give the run a
+    # fresh loop
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(
+            _e2e(args.streams, args.duration, args.batch_send))
+    finally:
+        loop.close()
+
+
+GROUPS = {
+    'packet': bench_packet,
+    'sources': bench_sources,
+    'stats': bench_stats,
+    'e2e': bench_e2e,
+}
+
+
+def higher_is_better(metric):
+    return metric.endswith('_per_s')
+
+
+def compare(results, baseline, threshold):
+    """Print changes against ``baseline`` and return the regressions."""
+    regressions = []
+    for group, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(group, {}).get(metric)
+            if not old:
+                continue
+            change = 100 * (value - old) / abs(old)
+            worse = -change if higher_is_better(metric) else change
+            flag = ''
+            if worse > threshold:
+                flag = '  REGRESSION'
+                regressions.append('{}.{}'.format(group, metric))
+            print('{:<8} {:<36} {:>14.4g} {:>+8.1f}%{}'.format(
+                group, metric, value, change, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('groups', nargs='*', choices=[[]] + list(GROUPS),
+                        help='groups to run, default all')
+    parser.add_argument('--packets', type=int, default=100000)
+    parser.add_argument('--frames', type=int, default=50000)
+    parser.add_argument('--capture', type=int, default=500000)
+    parser.add_argument('--streams', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--batch-send', action='store_true')
+    parser.add_argument('--save', metavar='FILE',
+                        help='write results as JSON')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare against saved results')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='regression threshold in percent')
+    args = parser.parse_args()
+
+    results = {}
+    for group in args.groups or GROUPS:
+        results[group] = GROUPS[group](args)
+        if not args.compare:
+            for metric, value in results[group].items():
+                print('{:<8} {:<36} {:>14.4g}'.format(group, metric, value))
+
+    if args.save:
+        with open(args.save, 'w') as output:
+            json.dump({'python': sys.version, 'platform': platform.platform(),
+                       'results': results}, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as saved:
+            baseline = json.load(saved)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            sys.exit('Regressed: {}'.format(', '.join(regressions)))
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,11 @@ setup(
         'numpy',
         'sndfile',
     ],
+    entry_points={
+        'console_scripts': [
+            'aiortp-analyze=aiortp.analyze:main',
+        ],
+    },
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',
         'Intended Audience :: Developers',
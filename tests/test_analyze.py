@@ -0,0 +1,63 @@
+import csv
+import io
+
+from aiortp import analyze
+from aiortp.capture import CaptureWriter
+from aiortp.packet import RTP
+import pytest
+
+
+SRC = ('10.0.0.1', 4000)
+DST = ('10.0.0.2', 5000)
+
+
+async def write_call(path, ssrcs=(42,), skip=(), loop=None):
+    writer = CaptureWriter(path, loop=loop)
+    for seq in range(100):
+        if seq in skip:
+            continue
+        for ssrc in ssrcs:
+            packet = RTP(seq=seq, timestamp=seq * 160, ssrc=ssrc,
+                         payload=b'\x7f' * 160)
+            writer.write(1000 + seq * 0.02, bytes(packet), SRC, DST)
+    await writer.close()
+
+
+@pytest.fixture
+def captures(loop, tmpdir):
+    calls = tmpdir.mkdir('calls')
+    loop.run_until_complete(write_call(str(calls.join('a.pcap')), loop=loop))
+    loop.run_until_complete(write_call(
+        str(calls.mkdir('more').join('b.pcap')), ssrcs=(1, 2), skip=(10, 11),
+        loop=loop))
+    calls.join('broken.pcap').write('not a capture at all')
+    calls.join('notes.txt').write('ignored')
+    return calls
+
+
+def test_summarize(captures):
+    paths = analyze.find_captures([str(captures)])
+    assert [path.rsplit('/', 1)[1] for path in paths] == [
+        'a.pcap', 'broken.pcap', 'b.pcap']
+
+    table = analyze.summarize(paths, workers=2, chunksize=1)
+    assert table == analyze.summarize(paths, workers=1)
+
+    assert table['ssrc'] == [42, None, 1, 2]
+    assert table['loss'][:2] == [0, None]
+    assert table['loss'][2:] == [pytest.approx(2 / 98)] * 2
+    assert table['packets'] == [100, None, 98, 98]
+    assert table['codecs'][0] == 'PCMU'
+    assert table['error'][0] == ''
+    assert 'ValueError' in table['error'][1]
+
+
+def test_main_writes_csv(captures, tmpdir, capsys):
+    output = str(tmpdir.join('summary.csv'))
+    assert analyze.main([str(captures), '-o', output, '-j', '1']) == 1
+
+    with open(output) as summary:
+        rows = list(csv.DictReader(summary))
+    assert len(rows) == 4
+    assert rows[0]['duration'] == '1.98'
+    assert 'Analysed 3 calls (4 streams, 1 failed)' in capsys.readouterr().err
@@ -0,0 +1,72 @@
+import os
+import wave
+
+import aiortp
+from aiortp.cache import PromptCache
+import pytest
+
+
+def write_prompt(path, seconds=1, level=1000):
+    with wave.open(str(path), 'wb') as prompt:
+        prompt.setnchannels(1)
+        prompt.setsampwidth(2)
+        prompt.setframerate(8000)
+        prompt.writeframes(level.to_bytes(2, 'little') * 8000 * seconds)
+    return str(path)
+
+
+@pytest.fixture
+def prompt(tmpdir):
+    return write_prompt(tmpdir.join('prompt.wav'))
+
+
+def test_prompt_cache_hits(prompt):
+    cache = PromptCache()
+    first = cache.get(prompt)
+    second = cache.get(prompt)
+
+    assert first is second
+    assert len(first) == 8000
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_prompt_cache_invalidates_on_mtime(prompt):
+    cache = PromptCache()
+    cache.get(prompt)
+    os.utime(prompt, ns=(0, 0))
+    cache.get(prompt)
+
+    assert cache.misses == 2
+
+
+def test_prompt_cache_evicts_lru(tmpdir):
+    cache = PromptCache(max_bytes=20000)
+    prompts = [write_prompt(tmpdir.join('{}.wav'.format(idx)))
+               for idx in range(3)]
+    for path in prompts:
+        cache.get(path)
+
+    assert len(cache) == 2
+    assert cache.size == 16000
+    cache.get(prompts[0])
+    assert cache.misses == 4
+
+
+def test_prompt_cache_on_disk(prompt, tmpdir):
+    directory = tmpdir.mkdir('cache')
+    media = PromptCache(directory=str(directory)).get(prompt)
+    cold = PromptCache(directory=str(directory)).get(prompt)
+
+    assert len(directory.listdir()) == 1
+    assert bytes(cold) == bytes(media)
+
+
+def test_audio_files_share_cached_media(prompt):
+    cache = PromptCache()
+    first = aiortp.AudioFile(prompt, 160, cache=cache)
+    second = aiortp.AudioFile(prompt, 160, cache=cache)
+
+    assert first.media.obj is second.media.obj
+    assert len(list(first)) == 50
+    assert len(list(second)) == 50
+
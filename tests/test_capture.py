@@ -0,0 +1,113 @@
+import asyncio
+import socket
+import struct
+
+import aiortp
+from aiortp import capture
+from aiortp.capture import CaptureWriter, read_capture
+from aiortp.packet import RTP
+from aiortp.rtcp import ReceiverReport
+from aiortp.stats import StreamStats
+import pytest
+
+
+SRC = ('10.0.0.1', 4000)
+DST = ('10.0.0.2', 5000)
+
+
+def packets(count, start=65530):
+    for idx in range(count):
+        seq = (start + idx) & 0xffff
+        yield 1000 + idx * 0.02, RTP(seq=seq, timestamp=idx * 160, ssrc=42,
+                                     payload=bytes([idx % 256]) * 160)
+
+
+@pytest.mark.parametrize('fmt', [capture.PCAP, capture.RTPDUMP])
+async def test_round_trip(loop, tmpdir, fmt):
+    path = str(tmpdir.join('call.' + fmt))
+    writer = CaptureWriter(path, format=fmt, batch_size=7, loop=loop)
+    for frametime, packet in packets(50):
+        writer.write(frametime, bytes(packet), SRC, DST)
+    # RTCP is recorded but not read back as RTP
+    writer.write(1001.0, bytes(ReceiverReport(1)), SRC, DST)
+    await writer.close()
+    assert writer.written == 51
+
+    batch = read_capture(path)
+    assert len(batch) == 50
+    assert batch.headers['seq'][:7].tolist() == [
+        65530, 65531, 65532, 65533, 65534, 65535, 0]
+    assert batch.headers['frametime'][49] == pytest.approx(1000.98,
+                                                           abs=1e-3)
+    assert bytes(batch[3].packet.payload) == bytes([3]) * 160
+
+    stats = StreamStats(batch)
+    assert stats.loss == 0
+
+
+def test_pcap_records_are_valid_ipv4(tmpdir):
+    datagram = capture._udp_datagram(b'abcd', SRC, DST)
+    assert len(datagram) == 20 + 8 + 4
+    assert capture._checksum(datagram[:20]) == 0
+    assert struct.unpack('!HHH', datagram[20:26]) == (4000, 5000, 12)
+
+
+async def test_empty_capture(loop, tmpdir):
+    path = str(tmpdir.join('empty.pcap'))
+    await CaptureWriter(path, loop=loop).close()
+    assert len(read_capture(path)) == 0
+
+
+async def test_flushes_on_interval(loop, tmpdir):
+    path = str(tmpdir.join('slow.pcap'))
+    writer = CaptureWriter(path, flush_interval=0.01, loop=loop)
+    for frametime, packet in packets(3):
+        writer.write(frametime, bytes(packet), SRC, DST)
+    await asyncio.sleep(0.1)
+    assert writer.written == 3
+    await writer.close()
+
+
+async def test_drops_when_disk_falls_behind(loop, tmpdir):
+    writer = CaptureWriter(str(tmpdir.join('full.pcap')), batch_size=1,
+                           max_pending=0, loop=loop)
+    writer.write(0, b'x' * 12, SRC, DST)
+    assert writer.dropped == 1
+    await writer.close()
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+async def test_stream_records_both_directions(loop, tmpdir):
+    scheduler = aiortp.RTPScheduler()
+    ports = free_port(), free_port()
+    receiver, sender = (
+        scheduler.create_new_stream(('127.0.0.1', port), loop=loop)
+        for port in ports)
+
+    sdp = 'c=IN IP4 127.0.0.1\r\nm=audio {} RTP/AVP 0\r\n'
+    await receiver.negotiate(sdp.format(ports[1]))
+    await sender.negotiate(sdp.format(ports[0]))
+
+    received = str(tmpdir.join('received.pcap'))
+    sent = str(tmpdir.join('sent.pcap'))
+    receiver.record(received)
+
+    # Start recording an already playing stream
+    source = aiortp.Tone(1000, 0.2, 160, loop=loop)
+    source.future = loop.create_future()
+    scheduler.add(sender.transport, source)
+    sender.record(sent, sent=True)
+    await source.future
+    await asyncio.sleep(0.05)
+    await sender.close()
+    await receiver.close()
+
+    sent_batch, received_batch = read_capture(sent), read_capture(received)
+    assert len(sent_batch) == 10
+    assert (received_batch.headers['seq'] ==
+            sent_batch.headers['seq']).all()
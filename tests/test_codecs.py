@@ -0,0 +1,42 @@
+import numpy as np
+
+from aiortp import codecs
+import pytest
+
+
+try:
+    import audioop
+except ImportError:  # pragma: no cover
+    audioop = None
+
+
+ALL_SAMPLES = np.arange(-32768, 32768, dtype=np.int16)
+
+
+@pytest.mark.parametrize('codec', [codecs.PCMU, codecs.PCMA])
+def test_roundtrip_is_stable(codec):
+    encoded = codec.encode(ALL_SAMPLES)
+    decoded = codec.decode(encoded)
+
+    assert len(encoded) == ALL_SAMPLES.size
+    assert codec.encode(decoded) == encoded
+    assert np.max(np.abs(decoded.astype(int) - ALL_SAMPLES)) <= 1024
+
+
+@pytest.mark.skipif(audioop is None, reason='audioop not available')
+@pytest.mark.parametrize('codec,encode,decode', [
+    (codecs.PCMU, 'lin2ulaw', 'ulaw2lin'),
+    (codecs.PCMA, 'lin2alaw', 'alaw2lin'),
+])
+def test_matches_audioop(codec, encode, decode):
+    samples = ALL_SAMPLES.tobytes()
+    assert codec.encode(samples) == getattr(audioop, encode)(samples, 2)
+
+    data = bytes(range(256))
+    assert codec.decode(data).tobytes() == getattr(audioop, decode)(data, 2)
+
+
+def test_get_codec():
+    assert codecs.get_codec(8) is codecs.PCMA
+    with pytest.raises(ValueError):
+        codecs.get_codec(18)
@@ -0,0 +1,58 @@
+import asyncio
+
+from aiortp.delivery import (DROP_NEWEST, DROP_OLDEST, LATEST, PacketQueue,
+                             UNBOUNDED)
+import pytest
+
+
+def fill(queue, count):
+    for item in range(count):
+        queue.put_nowait(item)
+
+
+async def test_drop_oldest(loop):
+    queue = PacketQueue(DROP_OLDEST, 3, loop=loop)
+    fill(queue, 5)
+
+    assert queue.dropped == 2
+    assert await queue.get_batch() == [2, 3, 4]
+
+
+async def test_drop_newest(loop):
+    queue = PacketQueue(DROP_NEWEST, 3, loop=loop)
+    fill(queue, 5)
+
+    assert queue.dropped == 2
+    assert await queue.get_batch() == [0, 1, 2]
+
+
+async def test_latest(loop):
+    queue = PacketQueue(LATEST, loop=loop)
+    fill(queue, 5)
+
+    assert queue.dropped == 4
+    assert await queue.get() == 4
+
+
+async def test_unbounded_batches(loop):
+    queue = PacketQueue(UNBOUNDED, loop=loop)
+    fill(queue, 5)
+
+    assert queue.dropped == 0
+    assert await queue.get_batch(2) == [0, 1]
+    assert await queue.get_batch(10) == [2, 3, 4]
+
+
+async def test_get_waits_for_packet(loop):
+    queue = PacketQueue(loop=loop)
+    getter = loop.create_task(queue.get())
+    await asyncio.sleep(0)
+    assert not getter.done()
+
+    queue.put_nowait('packet')
+    assert await getter == 'packet'
+
+
+def test_unknown_policy(loop):
+    with pytest.raises(ValueError):
+        PacketQueue('bogus', loop=loop)
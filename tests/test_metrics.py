@@ -0,0 +1,73 @@
+from aiortp.metrics import (COUNTER, GAUGE, Histogram, HISTOGRAM, Metric,
+                            prometheus, snapshot)
+from aiortp.packet import RTP
+from aiortp.scheduler import RTPProtocol
+
+
+def sample_metrics():
+    histogram = Histogram([1, 5])
+    for value in (0.5, 2, 10):
+        histogram.observe(value)
+
+    return [
+        Metric('sent_total', COUNTER, 'Packets sent', 3, (('stream', 'a'),)),
+        Metric('depth', GAUGE, 'Queue depth', 1.5),
+        Metric('sent_total', COUNTER, 'Packets sent', 4, (('stream', 'b'),)),
+        Metric('skew_ms', HISTOGRAM, 'Send skew', histogram),
+    ]
+
+
+def test_histogram():
+    histogram = Histogram([1, 5])
+    for value in (0.5, 1, 2, 10):
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [(1, 2), (5, 3), (float('inf'), 4)]
+    assert histogram.mean == 13.5 / 4
+    assert histogram.max == 10
+
+
+def test_snapshot():
+    metrics = snapshot(sample_metrics())
+
+    assert metrics['sent_total{stream="a"}'] == 3
+    assert metrics['depth'] == 1.5
+    assert metrics['skew_ms']['count'] == 3
+    assert metrics['skew_ms']['buckets'][-1] == (float('inf'), 3)
+
+
+def test_prometheus_groups_families():
+    assert prometheus(sample_metrics()) == '\n'.join([
+        '# HELP sent_total Packets sent',
+        '# TYPE sent_total counter',
+        'sent_total{stream="a"} 3',
+        'sent_total{stream="b"} 4',
+        '# HELP depth Queue depth',
+        '# TYPE depth gauge',
+        'depth 1.5',
+        '# HELP skew_ms Send skew',
+        '# TYPE skew_ms histogram',
+        'skew_ms_bucket{le="1"} 1',
+        'skew_ms_bucket{le="5"} 2',
+        'skew_ms_bucket{le="+Inf"} 3',
+        'skew_ms_sum 12.5',
+        'skew_ms_count 3',
+    ]) + '\n'
+
+
+def test_prometheus_escapes_labels():
+    text = prometheus([Metric('x', GAUGE, 'X', 1, (('peer', 'a"b\\'),))])
+    assert 'x{peer="a\\"b\\\\"} 1' in text
+
+
+def test_protocol_metrics(loop):
+    protocol = RTPProtocol(None, loop=loop)
+    data = bytes(RTP(seq=1, payload=b'\xff' * 160))
+    for _ in range(3):
+        protocol.datagram_received(data, ('127.0.0.1', 5000))
+
+    metrics = snapshot(protocol.collect((('stream', 's'),)))
+    assert metrics['aiortp_stream_packets_received_total{stream="s"}'] == 3
+    assert metrics['aiortp_stream_bytes_received_total{stream="s"}'] == \
+        3 * len(data)
+    assert metrics['aiortp_stream_queue_depth{stream="s"}'] == 3
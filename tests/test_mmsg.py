@@ -0,0 +1,62 @@
+import asyncio
+
+from aiortp import mmsg
+import pytest
+
+
+class Collector(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.received = []
+
+    def datagram_received(self, data, addr):
+        self.received.append(data)
+
+
+async def endpoints(loop):
+    receiver, collector = await loop.create_datagram_endpoint(
+        Collector, local_addr=('127.0.0.1', 0))
+    sender, _ = await loop.create_datagram_endpoint(
+        asyncio.DatagramProtocol,
+        remote_addr=receiver.get_extra_info('sockname'))
+    return sender, receiver, collector
+
+
+@pytest.mark.skipif(not mmsg.HAVE_SENDMMSG, reason='needs sendmmsg')
+async def test_batch_sender(loop):
+    sender, receiver, collector = await endpoints(loop)
+    batch = mmsg.BatchSender()
+
+    datagrams = [bytes([idx]) * 172 for idx in range(10)]
+    datagrams.append(bytearray(b'mutable'))
+    for data in datagrams:
+        batch.add(sender, data)
+    batch.flush()
+
+    await asyncio.sleep(0.05)
+    assert collector.received == [bytes(data) for data in datagrams]
+    assert batch.syscalls == 1
+    assert batch.datagrams == 11
+
+    sender.close()
+    receiver.close()
+
+
+@pytest.mark.skipif(not mmsg.HAVE_SENDMMSG, reason='needs sendmmsg')
+async def test_batch_sender_read_only_buffers(loop):
+    sender, receiver, collector = await endpoints(loop)
+    batch = mmsg.BatchSender()
+
+    # A cached prompt hands out read-only views of its bytes
+    prompt = bytes(range(256)) * 4
+    datagrams = [b'plain bytes', memoryview(prompt)[160:320],
+                 memoryview(bytearray(b'writable')).toreadonly()]
+    for data in datagrams:
+        batch.add(sender, data)
+    batch.flush()
+
+    await asyncio.sleep(0.05)
+    assert collector.received == [bytes(data) for data in datagrams]
+    assert batch.syscalls == 1
+
+    sender.close()
+    receiver.close()
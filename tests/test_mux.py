@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import socket
+
+from aiortp.mux import LATCH_AFTER, SharedEndpoint
+from aiortp.packet import RTP
+
+
+class Collector(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.received = []
+
+    def datagram_received(self, data, addr):
+        self.received.append(RTP.parse(data).seq)
+
+
+def peer():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    return sock
+
+
+async def test_shared_endpoint_demux(loop):
+    endpoint = SharedEndpoint(('127.0.0.1', 0), loop=loop)
+    local_addr = endpoint.get_extra_info('sockname')
+    peers = [peer(), peer()]
+    collectors = [Collector(), Collector()]
+    transports = [endpoint.register(sock.getsockname(), collector)
+                  for sock, collector in zip(peers, collectors)]
+
+    for seq in range(10):
+        for idx, sock in enumerate(peers):
+            sock.sendto(bytes(RTP(seq=seq, ssrc=idx)), local_addr)
+    await asyncio.sleep(0.05)
+
+    assert collectors[0].received == list(range(10))
+    assert collectors[1].received == list(range(10))
+
+    # A known SSRC from a new address is latched on to after a few packets
+    roaming = peer()
+    roaming.sendto(bytes(RTP(seq=0, ssrc=42)), local_addr)
+    for seq in range(10, 10 + LATCH_AFTER):
+        roaming.sendto(bytes(RTP(seq=seq, ssrc=1)), local_addr)
+    await asyncio.sleep(0.05)
+
+    assert collectors[1].received[-1] == 10 + LATCH_AFTER - 1
+    assert endpoint.unmatched == LATCH_AFTER
+    transports[1].sendto(b'moved')
+    assert roaming.recv(100) == b'moved'
+
+    transports[0].sendto(b'hello')
+    assert peers[0].recv(100) == b'hello'
+
+    for transport in transports:
+        transport.close()
+    assert endpoint.sock.fileno() == -1
+    for sock in peers + [roaming]:
+        sock.close()
+
+
+async def test_spoofed_ssrc_is_not_latched(loop):
+    endpoint = SharedEndpoint(('127.0.0.1', 0), loop=loop)
+    local_addr = endpoint.get_extra_info('sockname')
+    genuine, spoofer = peer(), peer()
+    collector = Collector()
+    transport = endpoint.register(genuine.getsockname(), collector)
+
+    genuine.sendto(bytes(RTP(seq=0, ssrc=7)), local_addr)
+    await asyncio.sleep(0.01)
+    # The real peer keeps talking, so the spoofer never gets a full run
+    for seq in range(1, 4 * LATCH_AFTER):
+        sock = genuine if seq % (LATCH_AFTER - 1) == 0 else spoofer
+        sock.sendto(bytes(RTP(seq=seq, ssrc=7)), local_addr)
+        await asyncio.sleep(0.005)
+    await asyncio.sleep(0.02)
+
+    assert all(seq % (LATCH_AFTER - 1) == 0 for seq in collector.received)
+    assert transport.remote_addr == genuine.getsockname()
+
+    transport.close()
+    genuine.close()
+    spoofer.close()
+
+
+class Fragile(Collector):
+    def datagram_received(self, data, addr):
+        if data[12:] == b'boom':
+            raise ValueError('bad payload')
+        if data[12:] == b'bug':
+            raise RuntimeError('not the packet\'s fault')
+        super().datagram_received(data, addr)
+
+
+async def test_bad_datagrams_do_not_abort_the_batch(loop, caplog):
+    endpoint = SharedEndpoint(('127.0.0.1', 0), loop=loop)
+    local_addr = endpoint.get_extra_info('sockname')
+    sock = peer()
+    collector = Fragile()
+    transport = endpoint.register(sock.getsockname(), collector)
+
+    loop.remove_reader(endpoint.sock.fileno())
+    sock.sendto(bytes(RTP(seq=1, ssrc=1)), local_addr)
+    sock.sendto(b'\x80\x00', local_addr)
+    sock.sendto(bytes(RTP(seq=2, ssrc=1, payload=b'boom')), local_addr)
+    sock.sendto(b'\x00' * 20, local_addr)
+    sock.sendto(bytes(RTP(seq=3, ssrc=1, payload=b'bug')), local_addr)
+    sock.sendto(bytes(RTP(seq=4, ssrc=1)), local_addr)
+    await asyncio.sleep(0.02)
+    with caplog.at_level(logging.ERROR, logger='aiortp.mux'):
+        endpoint._drain()
+
+    assert collector.received == [1, 4]
+    # Bugs in the protocol are logged, not passed off as bad packets
+    assert endpoint.invalid == 3
+    assert 'RuntimeError' in caplog.text
+
+    transport.close()
+    sock.close()
+
+
+async def test_forget_drops_only_the_streams_ssrcs(loop):
+    endpoint = SharedEndpoint(('127.0.0.1', 0), loop=loop)
+    local_addr = endpoint.get_extra_info('sockname')
+    peers = [peer(), peer()]
+    transports = [endpoint.register(sock.getsockname(), Collector())
+                  for sock in peers]
+
+    for idx, sock in enumerate(peers):
+        for ssrc in (idx * 10, idx * 10 + 1):
+            sock.sendto(bytes(RTP(ssrc=ssrc)), local_addr)
+    await asyncio.sleep(0.05)
+    assert transports[0].ssrcs == {bytes(4), (1).to_bytes(4, 'big')}
+
+    transports[0].close()
+    assert sorted(endpoint._by_ssrc) == [(10).to_bytes(4, 'big'),
+                                         (11).to_bytes(4, 'big')]
+
+    transports[1].close()
+    for sock in peers:
+        sock.close()
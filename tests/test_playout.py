@@ -0,0 +1,131 @@
+import asyncio
+
+from aiortp.packet import RTP
+from aiortp.playout import PlayoutBuffer, REPEAT
+import pytest
+
+
+def packet(seq, payload=b'\x01' * 160):
+    return RTP(seq=seq & 0xffff, timestamp=seq * 160, payload=payload)
+
+
+def play(buffer, ticks):
+    return [buffer.tick() for _ in range(ticks)]
+
+
+def test_reorders_and_skips_filler(loop):
+    buffer = PlayoutBuffer(20, min_delay=60, loop=loop)
+    for seq in (10, 12, 11):
+        buffer.push(0, packet(seq))
+
+    frames = play(buffer, 3)
+    assert [frame.seq for frame in frames] == [10, 11, 12]
+    assert not any(frame.concealed for frame in frames)
+
+
+def test_buffers_up_to_target_depth(loop):
+    buffer = PlayoutBuffer(20, min_delay=60, loop=loop)
+    buffer.push(0, packet(1))
+
+    filler = buffer.tick()
+    assert filler.seq is None and filler.concealed
+    assert filler.payload is None
+
+    buffer.push(0, packet(2))
+    buffer.push(0, packet(3))
+    assert buffer.tick().seq == 1
+
+
+def test_conceals_gaps_with_silence(loop):
+    buffer = PlayoutBuffer(20, loop=loop)
+    for seq in (65534, 65535, 65537):
+        buffer.push(0, packet(seq))
+
+    frames = play(buffer, 4)
+    assert [frame.seq for frame in frames] == [65534, 65535, 0, 1]
+    assert frames[2].concealed
+    assert frames[2].timestamp == 65536 * 160
+    assert frames[2].payload == b'\xff' * 160
+    assert buffer.lost == 1
+
+
+def test_conceals_by_repeating(loop):
+    buffer = PlayoutBuffer(20, conceal=REPEAT, loop=loop)
+    for seq in (1, 3):
+        buffer.push(0, packet(seq, bytes([seq]) * 160))
+
+    frames = play(buffer, 3)
+    assert frames[1].payload == b'\x01' * 160
+
+
+def test_late_and_duplicate_packets(loop):
+    buffer = PlayoutBuffer(20, loop=loop)
+    for seq in (1, 2, 3):
+        buffer.push(0, packet(seq))
+    play(buffer, 2)
+
+    buffer.push(0, packet(1))
+    buffer.push(0, packet(3))
+    assert buffer.late == 1
+    assert buffer.duplicates == 1
+
+
+def test_underrun_rebuffers(loop):
+    buffer = PlayoutBuffer(20, loop=loop)
+    for seq in (1, 2):
+        buffer.push(0, packet(seq))
+    play(buffer, 2)
+
+    assert buffer.tick().seq is None
+    buffer.push(0, packet(3))
+    assert buffer.tick().seq is None
+    assert buffer.underruns == 1
+
+
+def test_depth_adapts_to_jitter(loop):
+    buffer = PlayoutBuffer(20, loop=loop)
+    frametime = 0
+    for seq in range(50):
+        # Alternate 0ms and 40ms arrival gaps for 20ms packets
+        frametime += 0.04 if seq % 2 else 0
+        buffer.push(frametime, packet(seq))
+
+    assert buffer.target_delay > buffer.min_delay
+    assert buffer.target_depth > 2
+
+    # A deep backlog is trimmed a frame at a time
+    play(buffer, 10)
+    assert buffer.discarded > 0
+    assert buffer.depth <= buffer.target_depth + 1
+
+
+def test_resyncs_when_far_ahead(loop):
+    buffer = PlayoutBuffer(20, max_delay=100, loop=loop)
+    buffer.push(0, packet(1))
+    buffer.push(0, packet(100))
+
+    assert buffer.depth == 5
+    assert buffer.discarded == 95
+
+
+async def test_frames_paced_by_ptime(loop):
+    buffer = PlayoutBuffer(10, min_delay=10, loop=loop)
+    for seq in range(5):
+        buffer.push(0, packet(seq))
+    buffer.close()
+
+    start = loop.time()
+    frames = [frame async for frame in buffer.frames()]
+    assert [frame.seq for frame in frames] == list(range(5))
+    assert loop.time() - start == pytest.approx(0.05, abs=0.03)
+
+
+async def test_frames_waits_for_first_packet(loop):
+    buffer = PlayoutBuffer(10, min_delay=10, loop=loop)
+    frames = buffer.frames()
+
+    loop.call_later(0.01, buffer.push, 0, packet(7))
+    loop.call_later(0.02, buffer.close)
+    assert (await frames.__anext__()).seq == 7
+    with pytest.raises(StopAsyncIteration):
+        await asyncio.wait_for(frames.__anext__(), 1)
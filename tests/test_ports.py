@@ -0,0 +1,130 @@
+import asyncio
+import errno
+import socket
+
+import aiortp
+from aiortp.ports import DSCP_EF, PortAllocator
+import pytest
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def ports_of(pair):
+    return tuple(sock.getsockname()[1] for sock in pair)
+
+
+def close(pair):
+    for sock in pair:
+        sock.close()
+
+
+def test_hands_out_prebound_port_pairs():
+    allocator = PortAllocator('127.0.0.1', (40001, 40011), pool_size=2)
+    pairs = [allocator.acquire() for _ in range(4)]
+    try:
+        assert [ports_of(pair) for pair in pairs] == [
+            (40002, 40003), (40004, 40005), (40006, 40007), (40008, 40009)]
+        assert allocator.in_use == 4
+        with pytest.raises(OSError) as exc:
+            allocator.acquire()
+        assert exc.value.errno == errno.EADDRNOTAVAIL
+    finally:
+        for pair in pairs:
+            close(pair)
+        allocator.close()
+
+
+def test_released_ports_wait_out_quarantine():
+    clock = Clock()
+    allocator = PortAllocator('127.0.0.1', (40020, 40024), pool_size=0,
+                              quarantine=2, clock=clock)
+    first = allocator.acquire()
+    close(first)
+    allocator.release(40020)
+
+    second = allocator.acquire()
+    assert ports_of(second) == (40022, 40023)
+    close(second)
+    allocator.release(40022)
+    assert allocator.quarantined == 2
+
+    with pytest.raises(OSError):
+        allocator.acquire()
+    clock.now = 2
+    third = allocator.acquire()
+    assert ports_of(third) == (40020, 40021)
+    close(third)
+
+
+@pytest.mark.parametrize('held_port', [40030, 40031])
+def test_skips_pairs_held_elsewhere(held_port):
+    held = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    held.bind(('127.0.0.1', held_port))
+    allocator = PortAllocator('127.0.0.1', (40030, 40034), pool_size=0)
+    try:
+        pair = allocator.acquire()
+        assert ports_of(pair) == (40032, 40033)
+        close(pair)
+    finally:
+        held.close()
+
+
+def test_sockets_are_tuned():
+    allocator = PortAllocator('127.0.0.1', (40040, 40042), pool_size=1,
+                              rcvbuf=65536, dscp=DSCP_EF)
+    pair = allocator.acquire()
+    try:
+        for sock in pair:
+            assert sock.getsockopt(socket.SOL_SOCKET,
+                                   socket.SO_RCVBUF) >= 65536
+            assert sock.getsockopt(socket.IPPROTO_IP, socket.IP_TOS) == 0xb8
+    finally:
+        close(pair)
+
+
+async def test_stream_keeps_its_socket(loop):
+    scheduler = aiortp.RTPScheduler(port_range=(40050, 40060))
+    receiver = scheduler.create_new_stream(('127.0.0.1', None), loop=loop)
+    sender = scheduler.create_new_stream(('127.0.0.1', None), loop=loop)
+    assert receiver.local_addr == ('127.0.0.1', 40050)
+    assert sender.local_addr == ('127.0.0.1', 40052)
+
+    await receiver.negotiate(sender.describe())
+    await sender.negotiate(receiver.describe())
+    transport = sender.transport
+    await sender.schedule(aiortp.Tone(1000, 0.1, 160, loop=loop))
+    assert sender.transport is transport
+    assert receiver.protocol.received == 5
+
+    allocator = scheduler.allocators['127.0.0.1']
+    sender.close()
+    receiver.close()
+    assert allocator.in_use == 0
+    assert allocator.quarantined == 2
+
+
+async def test_rtcp_uses_the_allocated_pair(loop):
+    scheduler = aiortp.RTPScheduler(port_range=(40070, 40080))
+    a, b = (scheduler.create_new_stream(('127.0.0.1', None), rtcp='port',
+                                        loop=loop)
+            for _ in range(2))
+    # Something else grabbing a port after allocation can't break setup
+    held = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    held.bind(('127.0.0.1', 40074))
+    try:
+        await a.negotiate(b.describe())
+        await b.negotiate(a.describe())
+        assert a.rtcp.transport.get_extra_info('sockname')[1] == 40071
+
+        b.rtcp._send_report()
+        await asyncio.sleep(0.05)
+        assert a.rtcp.received == 1
+    finally:
+        held.close()
+        a.close()
+        b.close()
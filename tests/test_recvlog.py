@@ -0,0 +1,70 @@
+from aiortp.packet import RTP
+from aiortp.recvlog import ReceiveLog
+from aiortp.stats import JitterBuffer
+
+
+def fill(log, count):
+    for seq in range(count):
+        payload = bytes([seq % 256]) * 160
+        log.append(seq * 0.02, RTP(seq=seq, timestamp=seq * 160,
+                                   payload=payload))
+
+
+def test_receive_log_grows():
+    log = ReceiveLog(capacity=4)
+    fill(log, 100)
+
+    batch = log.batch()
+    assert len(log) == len(batch) == 100
+    assert batch.headers['seq'].tolist() == list(range(100))
+    assert bytes(batch[42].packet.payload) == bytes([42]) * 160
+
+
+def test_receive_log_ring():
+    log = ReceiveLog(10, payload_size=100)
+    fill(log, 25)
+
+    batch = log.batch()
+    assert len(log) == 10
+    assert log.dropped == 15
+    assert batch.headers['seq'].tolist() == list(range(15, 25))
+    # The 160 byte payloads don't fit, so the slots grow
+    assert log.payload_size == 200
+    assert log.truncated == 0
+    assert bytes(batch[0].packet.payload) == bytes([15]) * 160
+
+
+def test_receive_log_ring_grows_slots_for_long_payloads():
+    log = ReceiveLog(4, payload_size=160, max_payload_size=500)
+    fill(log, 3)
+    before = log.batch()
+    log.append(0.06, RTP(seq=3, payload=b'x' * 480))
+    # A batch taken before the slots grew still sees its payloads
+    assert [bytes(payload) for payload in before.payloads] == [
+        bytes([seq]) * 160 for seq in range(3)]
+    log.append(0.08, RTP(seq=4, payload=b'y' * 600))
+
+    batch = log.batch()
+    assert log.payload_size == 500
+    assert log.truncated == 1
+    assert bytes(batch[0].packet.payload) == bytes([1]) * 160
+    assert bytes(batch[2].packet.payload) == b'x' * 480
+    assert bytes(batch[3].packet.payload) == b'y' * 500
+
+
+def test_receive_log_views_survive_growth():
+    log = ReceiveLog(capacity=2)
+    fill(log, 2)
+    batch = log.batch()
+    fill(log, 50)
+
+    assert bytes(batch[1].packet.payload) == bytes([1]) * 160
+
+
+def test_jitter_buffer_from_receive_log():
+    log = ReceiveLog()
+    fill(log, 20)
+
+    buffer = JitterBuffer(log)
+    assert len(buffer) == 20
+    assert buffer.loss == 0
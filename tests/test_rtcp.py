@@ -0,0 +1,187 @@
+import asyncio
+import socket
+import types
+
+import aiortp
+from aiortp import rtcp
+from aiortp.packet import RTP
+from aiortp.rtcp import (Bye, ReceiverReport, ReportBlock, RTCPSession,
+                         SenderReport, SourceDescription)
+from aiortp.sdp import Format
+from aiortp.stats import LiveStats
+import pytest
+
+
+BLOCK = ReportBlock(ssrc=0x1234, fraction_lost=25, lost=-3,
+                    highest_seq=0x10005, jitter=80, lsr=0xabcd, dlsr=0x10)
+
+
+def test_compound_round_trip():
+    packets = [
+        SenderReport(0x42, rtcp.ntp_time(1e9), 8000, 50, 8000, (BLOCK,)),
+        ReceiverReport(0x43, (BLOCK, BLOCK._replace(ssrc=1))),
+        SourceDescription(((0x42, ((rtcp.SDES_CNAME, b'abc@host'),)),
+                           (0x43, ()))),
+        Bye((0x42, 0x43), b'done'),
+    ]
+    data = b''.join(bytes(packet) for packet in packets)
+
+    assert len(data) % 4 == 0
+    assert rtcp.parse(data) == packets
+
+
+def test_rtcp_is_told_apart_from_rtp():
+    assert rtcp.is_rtcp(bytes(ReceiverReport(1)))
+    assert not rtcp.is_rtcp(bytes(RTP(p_type=0)))
+    assert not rtcp.is_rtcp(bytes(RTP(p_type=101, marker=1)))
+
+
+def test_parse_rejects_truncated():
+    with pytest.raises(ValueError):
+        rtcp.parse(bytes(ReceiverReport(1, (BLOCK,)))[:-4])
+
+
+def test_interval_follows_rfc3550():
+    fixed = dict(rng=lambda: 0.5)
+    # Small sessions are held to the minimum interval
+    assert rtcp.rtcp_interval(2, 1, 400, True, 100, False, **fixed) == \
+        pytest.approx(5 / rtcp.COMPENSATION)
+    assert rtcp.rtcp_interval(2, 1, 400, True, 100, True, **fixed) == \
+        pytest.approx(2.5 / rtcp.COMPENSATION)
+    # Large sessions scale with membership and the report size
+    assert rtcp.rtcp_interval(1000, 0, 400, False, 100, False, **fixed) == \
+        pytest.approx(1000 * 100 / (400 * 0.75) / rtcp.COMPENSATION)
+
+
+class FakeTransport:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data):
+        self.sent.append(data)
+
+    def is_closing(self):
+        return False
+
+
+def stream_with(stats=None, entry=None):
+    transport = FakeTransport()
+    scheduler = types.SimpleNamespace(
+        _entries={transport: entry} if entry else {})
+    protocol = types.SimpleNamespace(stats=stats or LiveStats())
+    return types.SimpleNamespace(scheduler=scheduler, transport=transport,
+                                 protocol=protocol)
+
+
+def test_receiver_report_from_live_stats(loop):
+    stats = LiveStats()
+    for seq in (65534, 65535, 2, 3):
+        stats.update(seq * 0.02, RTP(seq=seq, timestamp=seq * 160, ssrc=7))
+    session = RTCPSession(stream_with(stats), cname='me', loop=loop)
+
+    report, sdes = rtcp.parse(session.build_report())
+    assert isinstance(report, ReceiverReport)
+    block, = report.reports
+    assert block.ssrc == 7
+    assert block.lost == 2
+    assert block.fraction_lost == 2 * 256 // 6
+    assert block.highest_seq == 0x10003
+    assert sdes.cname(report.ssrc) == b'me'
+
+    # Fraction lost only covers the latest interval
+    stats.update(0.1, RTP(seq=4, timestamp=640, ssrc=7))
+    block, = rtcp.parse(session.build_report())[0].reports
+    assert block.fraction_lost == 0
+    assert block.lost == 2
+
+
+def test_sender_report_and_rtt(loop):
+    source = types.SimpleNamespace(ssrc=99, timestamp=16160)
+    entry = types.SimpleNamespace(source=source, packets=100,
+                                  bytes=100 * 172, sent_at=loop.time(),
+                                  timestamp=16000)
+    session = RTCPSession(stream_with(entry=entry), loop=loop)
+
+    report = rtcp.parse(session.build_report(now=1000.0))[0]
+    assert report._replace(rtp_timestamp=0) == SenderReport(
+        99, rtcp.ntp_time(1000.0), 0, 100, 16000)
+    assert report.rtp_timestamp == pytest.approx(16000, abs=8)
+
+    # The peer echoes our SR back 0.5s later, having held it for 0.25s
+    lsr = (report.ntp_timestamp >> 16) & 0xFFFFFFFF
+    block = BLOCK._replace(ssrc=99, lsr=lsr, dlsr=65536 // 4)
+    session._remote_report(block, 1000.5)
+    assert session.rtt == pytest.approx(0.25, abs=1e-4)
+    assert session.remote_report == block
+
+
+def test_sender_report_timestamp_is_extrapolated(loop):
+    source = types.SimpleNamespace(ssrc=99, timestamp=0)
+    # The last packet went out half a second ago, at a 16 kHz clock
+    entry = types.SimpleNamespace(source=source, packets=10, bytes=1720,
+                                  sent_at=loop.time() - 0.5,
+                                  timestamp=0xFFFFF000)
+    stream = stream_with(entry=entry)
+    stream.format = Format(9, 'G722', 16000)
+    session = RTCPSession(stream, loop=loop)
+
+    report = rtcp.parse(session.build_report())[0]
+    expected = (0xFFFFF000 + 8000) & 0xFFFFFFFF
+    assert report.rtp_timestamp == pytest.approx(expected, abs=160)
+
+
+def test_remote_sender_report_sets_lsr(loop):
+    session = RTCPSession(stream_with(), loop=loop)
+    ntp = rtcp.ntp_time(500.0)
+    session.datagram_received(
+        bytes(SenderReport(5, ntp, 0, 1, 160))
+        + bytes(SourceDescription(((5, ((rtcp.SDES_CNAME, b'peer'),)),))),
+        None)
+
+    assert session.remote_ssrc == 5
+    assert session.remote_cname == b'peer'
+    assert session._lsr == (ntp >> 16) & 0xFFFFFFFF
+
+
+def free_ports():
+    """Two free, even ports, each followed by a free odd one."""
+    ports = []
+    while len(ports) < 2:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1] & ~1
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as rtp, \
+                    socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as rtcp_:
+                rtp.bind(('127.0.0.1', port))
+                rtcp_.bind(('127.0.0.1', port + 1))
+        except OSError:
+            continue
+        ports.append(port)
+    return ports
+
+
+@pytest.mark.parametrize('mode', ['mux', 'port'])
+async def test_reports_reach_the_peer(loop, mode):
+    scheduler = aiortp.RTPScheduler()
+    ports = free_ports()
+    streams = [scheduler.create_new_stream(('127.0.0.1', port), rtcp=mode,
+                                           loop=loop)
+               for port in ports]
+    sdp = 'c=IN IP4 127.0.0.1\r\nm=audio {} RTP/AVP 0\r\n'
+    for stream, port in zip(streams, reversed(ports)):
+        await stream.negotiate(sdp.format(port))
+
+    a, b = streams
+    try:
+        b.rtcp._send_report()
+        await asyncio.sleep(0.05)
+        assert a.rtcp.received == 1
+        assert a.rtcp.remote_ssrc == b.rtcp.ssrc
+        assert a.protocol.received == 0
+
+        b.close()
+        await asyncio.sleep(0.05)
+        assert a.rtcp.bye.ssrcs == (b.rtcp.ssrc,)
+    finally:
+        a.close()
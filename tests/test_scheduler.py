@@ -0,0 +1,217 @@
+import asyncio
+import time
+
+import aiortp
+from aiortp.metrics import snapshot
+from aiortp.packet import RTP
+from aiortp.wheel import TimingWheel
+import pytest
+
+
+class FakeTransport:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data):
+        self.sent.append(data)
+
+
+class CountingSource:
+    def __init__(self, frames):
+        self.frames = iter(range(frames))
+        self.stopped = False
+        self.skipped = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return RTP(seq=next(self.frames))
+
+    def skip(self):
+        next(self.frames)
+        self.skipped += 1
+
+    def stop(self):
+        self.stopped = True
+
+
+@pytest.fixture
+def scheduler(loop, request):
+    options = getattr(request, 'param', {})
+    scheduler = aiortp.RTPScheduler(interval=10, **options)
+    yield scheduler
+    if scheduler._timer:
+        scheduler._timer.close()
+
+
+def test_timing_wheel():
+    wheel = TimingWheel(slots=4)
+    wheel.schedule('a', 1)
+    wheel.schedule('b', 2)
+    wheel.schedule('c', 6)
+
+    assert wheel.advance() == ['a']
+    assert wheel.advance() == ['b']
+    assert [wheel.advance() for _ in range(3)] == [[], [], []]
+    assert wheel.advance() == ['c']
+    assert len(wheel) == 0
+
+
+def test_mixed_ptimes(scheduler):
+    transports = {ptime: FakeTransport() for ptime in (10, 20, 30, 40)}
+    for ptime, transport in transports.items():
+        scheduler.add(transport, CountingSource(100), ptime=ptime)
+
+    for _ in range(120):
+        scheduler._protocol.timer_ticked()
+
+    assert {ptime: len(transport.sent)
+            for ptime, transport in transports.items()} == {
+        10: 100, 20: 60, 30: 40, 40: 30
+    }
+
+
+def test_finished_source_is_removed(scheduler, loop):
+    transport = FakeTransport()
+    source = CountingSource(3)
+    source.future = loop.create_future()
+    scheduler.add(transport, source, ptime=20)
+
+    for _ in range(10):
+        scheduler._protocol.timer_ticked()
+
+    assert len(transport.sent) == 3
+    assert source.future.done()
+    assert transport not in scheduler.streams
+
+
+class BrokenSource(CountingSource):
+    def __next__(self):
+        raise RuntimeError('broken')
+
+
+def test_failing_source_does_not_stall_others(scheduler, loop):
+    transports = [FakeTransport() for _ in range(3)]
+    sources = [CountingSource(100), BrokenSource(100), CountingSource(100)]
+    for transport, source in zip(transports, sources):
+        source.future = loop.create_future()
+        scheduler.add(transport, source, ptime=20)
+
+    for _ in range(20):
+        scheduler._protocol.timer_ticked()
+
+    assert [len(transport.sent) for transport in transports] == [10, 0, 10]
+    assert isinstance(sources[1].future.exception(), RuntimeError)
+    assert transports[1] not in scheduler.streams
+    assert not sources[0].future.done()
+
+
+def test_unregister(scheduler):
+    transport = FakeTransport()
+    source = CountingSource(100)
+    scheduler.add(transport, source, ptime=20)
+    scheduler._protocol.timer_ticked()
+    scheduler.unregister(transport)
+
+    for _ in range(10):
+        scheduler._protocol.timer_ticked()
+
+    assert len(transport.sent) == 1
+    assert source.stopped
+
+
+def test_ptime_must_align(scheduler):
+    with pytest.raises(ValueError):
+        scheduler.add(FakeTransport(), CountingSource(1), ptime=25)
+
+
+def run_overrun(scheduler, overruns, ticks=0):
+    transport = FakeTransport()
+    source = CountingSource(100)
+    scheduler.add(transport, source, ptime=10)
+
+    scheduler._protocol.timer_ticked()
+    assert scheduler._protocol.timer_overrun(overruns)
+    for _ in range(ticks):
+        scheduler._protocol.timer_ticked()
+
+    assert scheduler.overruns == 1
+    assert scheduler.missed_ticks == overruns
+    return transport, source
+
+
+@pytest.mark.parametrize('scheduler', [{'overrun': 'burst'}], indirect=True)
+def test_overrun_burst(scheduler):
+    transport, source = run_overrun(scheduler, 5)
+    assert len(transport.sent) == 6
+    assert source.skipped == 0
+
+
+@pytest.mark.parametrize('scheduler', [{'overrun': 'burst',
+                                        'max_catchup': 2}], indirect=True)
+def test_overrun_burst_capped(scheduler):
+    transport, source = run_overrun(scheduler, 5)
+    assert len(transport.sent) == 3
+    assert source.skipped == 3
+
+
+@pytest.mark.parametrize('scheduler', [{'overrun': 'skip'}], indirect=True)
+def test_overrun_skip(scheduler):
+    transport, source = run_overrun(scheduler, 5)
+    assert len(transport.sent) == 1
+    assert source.skipped == 5
+
+
+@pytest.mark.parametrize('scheduler', [{'overrun': 'smear',
+                                        'smear_rate': 2}], indirect=True)
+def test_overrun_smear(scheduler):
+    transport, source = run_overrun(scheduler, 5, ticks=3)
+    # 4 regular ticks, plus the 5 missed ones spread over 3 ticks
+    assert len(transport.sent) == 9
+    assert scheduler._protocol.backlog == 0
+
+
+@pytest.mark.parametrize('scheduler', [{'overrun': 'burst'}], indirect=True)
+async def test_real_stall_is_caught_up(scheduler, loop):
+    transport = FakeTransport()
+    scheduler.add(transport, CountingSource(1000), ptime=10)
+
+    start = loop.time()
+    await asyncio.sleep(0.05)
+    time.sleep(0.3)
+    await asyncio.sleep(0.05)
+    elapsed = loop.time() - start
+
+    # aiotimer reports a one-tick overrun for the whole stall; a loaded
+    # machine may add another elsewhere
+    assert 1 <= scheduler.overruns <= 3
+    assert scheduler.missed_ticks >= 25
+    assert len(transport.sent) >= int(elapsed / 0.01) - 2
+
+
+def test_lateness_recorded(scheduler):
+    scheduler.add(FakeTransport(), CountingSource(100), ptime=20)
+    for _ in range(5):
+        scheduler._protocol.timer_ticked()
+
+    assert scheduler.lateness.count == 5
+
+
+def test_send_metrics(scheduler):
+    transport = FakeTransport()
+    scheduler.add(transport, CountingSource(100), ptime=20)
+    for _ in range(10):
+        scheduler._protocol.timer_ticked()
+
+    metrics = snapshot(scheduler.collect())
+    assert metrics['aiortp_scheduler_ticks_total'] == 10
+    assert metrics['aiortp_scheduler_packets_sent_total'] == 5
+    assert metrics['aiortp_scheduler_bytes_sent_total'] == sum(
+        len(data) for data in transport.sent)
+    assert metrics['aiortp_scheduler_tick_duration_ms']['count'] == 10
+
+    entry = scheduler._entries[transport]
+    stream = snapshot(entry.collect((('stream', 'a'),)))
+    assert stream['aiortp_stream_packets_sent_total{stream="a"}'] == 5
+    assert stream['aiortp_stream_send_skew_ms{stream="a"}']['count'] == 5
@@ -0,0 +1,102 @@
+from aiortp import sdp
+from aiortp.sdp import Format, SDP
+import pytest
+
+
+OFFER = '''v=0\r
+o=alice 2890844526 2890844526 IN IP6 2001:db8::1\r
+s=-\r
+c=IN IP6 2001:db8::1\r
+t=0 0\r
+a=ptime:30\r
+m=video 51372 RTP/AVP 31\r
+m=audio 49170 RTP/AVP 8 0 96 13\r
+c=IN IP4 203.0.113.5/127\r
+a=rtpmap:8 PCMA/8000\r
+a=rtpmap:96 telephone-event/8000\r
+a=fmtp:96 0-16\r
+a=ptime:40\r
+a=recvonly\r
+a=maxptime:60\r
+'''
+
+
+def test_parse_multiple_media():
+    offer = SDP.parse(OFFER)
+
+    assert offer.origin.startswith('alice ')
+    assert offer.connection == '2001:db8::1'
+    assert offer.ptime == 30
+    video, audio = offer.media
+    assert video.kind == 'video'
+    assert offer.address(video) == ('2001:db8::1', 51372)
+
+    assert offer.audio() is audio
+    assert offer.address(audio) == ('203.0.113.5', 49170)
+    assert audio.formats == (
+        Format(8, 'PCMA', 8000), Format(0), Format(96, 'telephone-event',
+                                                   8000, fmtp='0-16'),
+        Format(13))
+    assert audio.formats[1].name == 'PCMU'
+    assert audio.ptime == 40
+    assert audio.direction == 'recvonly'
+    assert audio.attributes == (('maxptime', '60'),)
+
+
+def test_offer_renders_and_caches():
+    offer = SDP.offer(('127.0.0.1', 16384), 20)
+    text = str(offer)
+
+    assert text == '''v=0\r
+o=user1 53655765 2353687637 IN IP4 127.0.0.1\r
+s=-\r
+t=0 0\r
+i=aiortp media stream\r
+m=audio 16384 RTP/AVP 0 101 13\r
+c=IN IP4 127.0.0.1\r
+a=rtpmap:0 PCMU/8000/1\r
+a=rtpmap:101 telephone-event/8000\r
+a=fmtp:101 0-15\r
+a=ptime:20\r
+a=sendrecv\r
+'''
+    assert str(offer) is text
+    assert str(SDP.parse(text)) == text
+
+
+def test_negotiate_follows_offer_preference():
+    local = SDP.offer(('127.0.0.1', 16384), 20,
+                      (sdp.PCMU, sdp.PCMA, sdp.DTMF))
+    result = sdp.negotiate(local, SDP.parse(OFFER))
+
+    assert result.remote_addr == ('203.0.113.5', 49170)
+    assert result.format.payload_type == 8
+    assert result.telephone_event.payload_type == 96
+    assert result.ptime == 40
+
+
+def test_negotiate_minimal_answer():
+    local = SDP.offer(('127.0.0.1', 16384), 20)
+    remote = SDP.parse('c=IN IP4 10.0.0.2\r\nm=audio 4000 RTP/AVP 0\r\n')
+    result = sdp.negotiate(local, remote)
+
+    assert result == sdp.Negotiated(('10.0.0.2', 4000), Format(0), None, 20)
+
+
+def test_negotiate_ignores_case_of_special_formats():
+    local = SDP.offer(('127.0.0.1', 16384), 20,
+                      (sdp.PCMU, sdp.DTMF, Format(97, 'cn', 8000)))
+    remote = SDP.parse('c=IN IP4 10.0.0.2\r\n'
+                       'm=audio 4000 RTP/AVP 96 97 0\r\n'
+                       'a=rtpmap:96 telephone-Event/8000\r\n'
+                       'a=rtpmap:97 cn/8000\r\n')
+    result = sdp.negotiate(local, remote)
+
+    assert result.format == Format(0)
+    assert result.telephone_event.payload_type == 96
+
+
+def test_negotiate_without_common_codec():
+    local = SDP.offer(('127.0.0.1', 16384), 20)
+    with pytest.raises(ValueError):
+        sdp.negotiate(local, SDP.parse(OFFER.replace(' 8 0 96', ' 8 96')))
@@ -1,6 +1,7 @@
 from hypothesis import given
-from hypothesis.strategies import binary
-from aiortp.packet import RTP, RTPEvent, rtphdr, rtpevent
+from hypothesis.strategies import binary, lists
+from aiortp.packet import (RTP, RTPBatch, RTPEvent, RTPTemplate, rtphdr,
+                           rtpevent)
 
 
 @given(binary(min_size=rtphdr.size, max_size=rtphdr.size + 1000))
@@ -9,6 +10,28 @@ def test_rtp_decode_inverts_encode(pkt):
     assert bytes(rtp) == pkt
 
 
+@given(binary(min_size=rtphdr.size, max_size=rtphdr.size + 1000))
+def test_rtp_pack_into_matches_bytes(pkt):
+    rtp = RTP.parse(pkt)
+    buffer = bytearray(2000)
+    size = rtp.pack_into(buffer, 10)
+    assert buffer[10:10 + size] == pkt
+
+
+@given(lists(binary(min_size=rtphdr.size, max_size=rtphdr.size + 1600),
+             min_size=1, max_size=5))
+def test_rtp_template_matches_bytes(pkts):
+    first = RTP.parse(pkts[0])
+    template = RTPTemplate(first.p_type, first.ssrc, size=200)
+    for pkt in pkts:
+        rtp = RTP.parse(pkt)._replace(version=2, padding=0, ext=0,
+                                      csrc_items=0, p_type=first.p_type,
+                                      ssrc=first.ssrc)
+        data = template.render(rtp.seq, rtp.timestamp, rtp.payload,
+                               rtp.marker)
+        assert data == bytes(rtp)
+
+
 @given(binary(min_size=rtpevent.size, max_size=rtpevent.size))
 def test_rtpevent_decode_inverts_encode(pkt):
     rtpevent = RTPEvent.parse(pkt)
@@ -33,3 +56,13 @@ def test_rtpevent_inside_rtp_decode_inverts_encode(pkt):
         ssrc=rtp.ssrc,
         payload=bytes(rtpevent)
     ))
+
+
+@given(lists(binary(min_size=rtphdr.size, max_size=rtphdr.size + 100)))
+def test_rtp_batch_matches_parse(pkts):
+    batch = RTPBatch.parse_many(pkts)
+
+    assert len(batch) == len(pkts)
+    for (_, rtp), pkt in zip(batch, pkts):
+        assert rtp == RTP.parse(pkt)
+        assert bytes(rtp) == pkt
@@ -0,0 +1,90 @@
+import asyncio
+import socket
+
+from aiortp.shard import ShardedScheduler
+from aiortp.sources import Tone
+import pytest
+
+
+def remote_sdp(port):
+    return ('v=0\r\nc=IN IP4 127.0.0.1\r\n'
+            'm=audio {} RTP/AVP 0\r\n'.format(port))
+
+
+@pytest.fixture
+def sink():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.setblocking(False)
+    yield sock
+    sock.close()
+
+
+def drain(sock):
+    count = 0
+    while True:
+        try:
+            sock.recv(2048)
+        except BlockingIOError:
+            return count
+        count += 1
+
+
+async def test_streams_spread_over_workers(loop, sink):
+    sharded = ShardedScheduler(2, loop=loop)
+    try:
+        streams = [sharded.create_new_stream(('127.0.0.1', 0))
+                   for _ in range(4)]
+        assert [stream.shard.index for stream in streams] == [0, 1, 0, 1]
+
+        sdp = remote_sdp(sink.getsockname()[1])
+        await asyncio.gather(*(stream.negotiate(sdp) for stream in streams))
+        await asyncio.gather(*(stream.schedule(Tone, 1000, 0.1, 160)
+                               for stream in streams))
+
+        load = await sharded.load()
+        assert len({worker['pid'] for worker in load}) == 2
+        assert [worker['streams'] for worker in load] == [2, 2]
+        assert drain(sink) >= 4 * 5
+    finally:
+        await sharded.close()
+
+    assert not any(shard.process.is_alive() for shard in sharded.shards)
+
+
+async def test_stop_interrupts_playback(loop, sink):
+    sharded = ShardedScheduler(1, loop=loop)
+    try:
+        stream = sharded.create_new_stream(('127.0.0.1', 0))
+        await stream.negotiate(remote_sdp(sink.getsockname()[1]))
+        playing = loop.create_task(stream.schedule(Tone, 1000, 60, 160))
+
+        await asyncio.sleep(0.1)
+        await stream.stop()
+        await asyncio.wait_for(playing, 5)
+        assert sharded.shards[0].streams == 0
+    finally:
+        await sharded.close()
+
+
+async def test_worker_errors_are_raised(loop):
+    sharded = ShardedScheduler(1, loop=loop)
+    try:
+        stream = sharded.create_new_stream(('127.0.0.1', 0))
+        with pytest.raises(KeyError):
+            await stream.stats()
+    finally:
+        await sharded.close()
+
+
+@pytest.mark.parametrize('port', [None, 0])
+async def test_port_placement_needs_a_port(loop, port):
+    sharded = ShardedScheduler(1, placement='port', loop=loop)
+    try:
+        with pytest.raises(ValueError):
+            sharded.create_new_stream(('127.0.0.1', port))
+        assert sharded.shards[0].streams == 0
+        stream = sharded.create_new_stream(('127.0.0.1', 40090))
+        assert stream.shard is sharded.shards[0]
+    finally:
+        await sharded.close()
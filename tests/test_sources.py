@@ -0,0 +1,111 @@
+import threading
+import time
+
+import numpy as np
+
+import aiortp
+from aiortp import tones
+from aiortp.tones import tone_loop
+
+from .test_cache import write_prompt
+
+
+def test_streaming_audio_file_matches_audio_file(tmpdir):
+    path = write_prompt(tmpdir.join('long.wav'), seconds=3)
+    expected = [bytes(pkt.payload)
+                for pkt in aiortp.AudioFile(path, 160, cache=None)]
+    source = aiortp.StreamingAudioFile(path, 160, block_frames=7)
+    streamed = [bytes(pkt.payload) for pkt in source]
+
+    # Reads that fall behind are covered with silence
+    silence = b'\xff' * 160
+    assert len(streamed) == len(expected) + source.underruns
+    assert [payload for payload in streamed if payload != silence] == \
+        expected
+    assert source.stopped
+    assert not source._blocks
+
+
+def test_streaming_audio_file_does_not_wait_on_the_disk(tmpdir):
+    path = write_prompt(tmpdir.join('long.wav'), seconds=1)
+    source = aiortp.StreamingAudioFile(path, 160, block_frames=2)
+    source._pending.result()
+
+    # Every read from now on is stuck until released
+    release = threading.Event()
+    read = source._read
+    source._read = lambda count: release.wait() and read(count)
+    try:
+        packets = [next(source) for _ in range(2)]
+        start = time.monotonic()
+        packet = next(source)
+        assert time.monotonic() - start < 0.1
+        assert bytes(packet.payload) == b'\xff' * 160
+        assert packet.timestamp == packets[-1].timestamp + 160
+        assert source.underruns == 1
+    finally:
+        release.set()
+        source.stop()
+
+
+def test_tone_codec():
+    pcmu = aiortp.Tone(440, 1, 160)
+    pcma = aiortp.Tone(440, 1, 160, codec=8)
+
+    assert next(pcma).p_type == 8
+    assert bytes(pcma.media) != bytes(pcmu.media)
+    assert len(pcma.media) == len(pcmu.media)
+
+
+def test_tone_loop_is_cached_and_periodic():
+    first = tone_loop((440, 480), 10000, 8000, 0, None)
+    assert tone_loop((440, 480), 10000, 8000, 0, None) is first
+
+    period = tones.period((440, 480), 8000)
+    assert period == 200
+    assert len(first) % period == 0
+
+    samples = tones.synthesize((440, 480), 2 * period)
+    assert np.array_equal(samples[:period], samples[period:])
+
+
+def test_infinite_tone_wraps_loop():
+    source = aiortp.Tone(tones.DTMF_FREQUENCIES['5'], None, 160)
+    frames = [bytes(next(source).payload) for _ in range(1000)]
+
+    loop = bytes(source.media)
+    stream = (loop * (len(frames) * 160 // len(loop) + 1))
+    assert b''.join(frames) == stream[:len(frames) * 160]
+    assert not source.stopped
+
+
+def test_tone_cadence():
+    on, off = 100, 300
+    source = aiortp.Tone(tones.BUSY[0], 0.8, 160, cadence=(on, off))
+    frames = [bytes(packet.payload) for packet in source]
+
+    assert len(frames) == 40
+    silence = b'\xff' * 160
+    assert [frame == silence for frame in frames[:20]] == \
+        [False] * 5 + [True] * 15
+
+
+def test_render_matches_packets(tmpdir):
+    prompt = write_prompt(tmpdir.join('prompt.wav'))
+    for make in (lambda: aiortp.AudioFile(prompt, 160),
+                 lambda: aiortp.Tone(1000, 1, 160),
+                 lambda: aiortp.DTMF('123')):
+        packets = [bytes(packet) for packet in make()]
+        source = make()
+        rendered = []
+        while True:
+            try:
+                rendered.append(bytes(source.render()))
+            except StopIteration:
+                break
+        assert rendered == packets
+
+
+def test_dtmf_sequence_numbers_increase():
+    seqs = [packet.seq for packet in aiortp.DTMF('12')]
+    assert seqs == list(range(seqs[0], seqs[0] + len(seqs)))
@@ -1,8 +1,11 @@
 import itertools
 
-from aiortp.packet import RTP
+from aiortp.codecs import PCMA
+from aiortp.packet import RTP, RTPBatch
 from aiortp.scheduler import PacketData
-from aiortp.stats import JitterBuffer
+from aiortp.sources import Tone
+from aiortp.stats import _calc_jitter, JitterBuffer, LiveStats, StreamStats
+import numpy as np
 import pytest
 
 
@@ -60,6 +63,35 @@ def test_jitter_buffer_detect_loss_and_duplicates():
     assert buffer.duplicates == 10 / 20
 
 
+def test_jitter_buffer_from_batch():
+    data = [bytes(RTP(seq=seq)) for seq in range(1, 21, 2) for _ in range(2)]
+    batch = RTPBatch.parse_many(data, frametimes=range(len(data)))
+    buffer = JitterBuffer(batch)
+
+    assert len(buffer) == 10
+    assert buffer.loss == 9 / 20
+    assert buffer.duplicates == 10 / 20
+    assert buffer[1].packet.seq == 3
+
+
+def test_jitter_buffer_wraparound():
+    seqs = [65533, 65534, 65535, 0, 2, 3]
+    buffer = build_buffer([RTP(seq=seq) for seq in seqs])
+
+    assert len(buffer) == 6
+    assert buffer.lost == 1
+    assert buffer.duplicates == 0
+
+
+def test_jitter_buffer_late_packets_are_not_lost():
+    seqs = [1, 2, 5, 3, 4, 6, 9, 10]
+    buffer = build_buffer([RTP(seq=seq) for seq in seqs])
+
+    assert [packet.packet.seq for packet in buffer] == [1, 2, 5, 6, 9, 10]
+    assert buffer.lost == 2
+    assert buffer.duplicates == 0
+
+
 @pytest.mark.xfail
 def test_jitter_buffer_backwards_data():
     # Jitter buffer window size is 10, so only generate 10 packets
@@ -69,3 +101,157 @@ def test_jitter_buffer_backwards_data():
     assert len(buffer) == 10
     assert buffer.loss == 0
     assert buffer.duplicates == 0
+
+
+def test_stream_stats_decodes_negotiated_codec():
+    source = Tone(1000, 1, 160, codec=8)
+    packets = [PacketData(frametime=frametime, packet=packet)
+               for frametime, packet in zip(frametimes(20), source)]
+    stats = StreamStats(packets)
+
+    assert stats.codec.name == 'PCMA'
+    assert stats.pcm.size == 8000
+    # A 10000 peak sine sits about 13 dB below full scale
+    assert stats.level == pytest.approx(-13.3, abs=0.2)
+
+
+def live_stats(sequence, *, ptime=20):
+    stats = LiveStats()
+    for frametime, seq in zip(frametimes(ptime), sequence):
+        stats.update(frametime, RTP(seq=seq & 0xffff, timestamp=seq * 160,
+                                    payload=b'\xff' * 160))
+    return stats.snapshot()
+
+
+def test_live_stats():
+    snapshot = live_stats(range(65500, 65600))
+
+    assert snapshot.received == snapshot.expected == 100
+    assert snapshot.lost == snapshot.duplicates == snapshot.reordered == 0
+    assert snapshot.jitter == pytest.approx(0, abs=1e-6)
+    assert snapshot.mean_delta == pytest.approx(20)
+    assert snapshot.duration.total_seconds() == pytest.approx(1.98)
+
+
+def test_live_stats_loss_duplicates_and_reordering():
+    snapshot = live_stats([1, 2, 2, 4, 3, 6, 7, 7, 10])
+
+    assert snapshot.received == 7
+    assert snapshot.duplicates == 2
+    assert snapshot.reordered == 1
+    assert snapshot.expected == 10
+    assert snapshot.lost == 3
+
+
+def test_live_stats_ignores_unconfirmed_jumps():
+    # A stray packet far ahead is ignored, as is one far behind
+    snapshot = live_stats([1, 2, 3, 20000, 4, 5, 60000, 6])
+    assert snapshot.received == snapshot.expected == 6
+    assert snapshot.lost == 0
+
+    # Two packets in sequence after the jump restart the counts there
+    snapshot = live_stats([1, 2, 3, 20000, 20001, 20002])
+    assert snapshot.received == snapshot.expected == 3
+
+
+def test_live_stats_probation_for_new_sources():
+    stats = LiveStats()
+    stats.update(0.0, RTP(seq=100, ssrc=1))
+    assert stats.received == stats.expected == 0
+
+    for idx, seq in enumerate((101, 102, 103)):
+        stats.update(0.02 * (idx + 1), RTP(seq=seq, ssrc=1))
+    assert stats.received == stats.expected == 4
+
+    # The sender restarts with a new SSRC and sequence
+    stats.update(0.1, RTP(seq=7, ssrc=2))
+    assert stats.received == 0
+    stats.update(0.12, RTP(seq=8, ssrc=2))
+    assert stats.ssrc == 2
+    assert stats.received == stats.expected == 2
+    assert stats.highest_seq == 8
+
+
+def test_live_stats_level_is_opt_in():
+    payload = PCMA.encode(np.full(160, 1000, dtype=np.int16))
+    plain, tracked = LiveStats(), LiveStats(track_level=True)
+    for stats in (plain, tracked):
+        for seq in range(5):
+            stats.update(seq * 0.02, RTP(seq=seq, p_type=8,
+                                         timestamp=seq * 160,
+                                         payload=payload))
+
+    assert plain.snapshot().level is None
+    assert tracked.snapshot().level == pytest.approx(-30.3, abs=0.2)
+
+
+def test_live_stats_start_afresh_for_a_new_ssrc():
+    stats = LiveStats()
+    for idx in range(10):
+        stats.update(idx * 0.02, RTP(seq=1000 + idx, timestamp=idx * 160,
+                                     ssrc=1, payload=b'\xff' * 160))
+    stats.update(0.1, RTP(seq=1005, timestamp=800, ssrc=1))
+
+    # The sender comes back a few seconds later as a new source
+    for idx in range(50):
+        stats.update(5 + idx * 0.02, RTP(seq=7 + idx, timestamp=idx * 160,
+                                         ssrc=2, payload=b'\xff' * 160))
+
+    snapshot = stats.snapshot()
+    assert snapshot.received == snapshot.expected == 50
+    assert snapshot.duplicates == 0
+    assert snapshot.mean_delta == pytest.approx(20)
+    assert snapshot.max_delta == pytest.approx(20)
+    assert snapshot.duration.total_seconds() == pytest.approx(0.98)
+
+
+def test_live_stats_restart_after_a_jump():
+    stats = LiveStats()
+    for idx in range(10):
+        stats.update(idx * 0.02, RTP(seq=idx, timestamp=idx * 160))
+    for idx in range(10, 20):
+        stats.update(idx * 0.02, RTP(seq=30000 + idx, timestamp=idx * 160))
+
+    snapshot = stats.snapshot()
+    assert snapshot.received == snapshot.expected == 10
+    assert snapshot.duration.total_seconds() == pytest.approx(0.18)
+    assert snapshot.mean_delta == pytest.approx(20)
+
+
+def test_live_stats_matches_stream_stats_jitter():
+    # Packets arrive every 20ms but carry 30ms worth of timestamps
+    stats = LiveStats()
+    packets = []
+    for frametime, seq in zip(frametimes(20), range(200)):
+        packet = RTP(seq=seq, timestamp=seq * 240, payload=b'\xff' * 160)
+        stats.update(frametime, packet)
+        packets.append(PacketData(frametime=frametime, packet=packet))
+
+    assert stats.snapshot().jitter == pytest.approx(
+        StreamStats(packets).jitter[-1])
+
+
+def test_calc_jitter_matches_recurrence():
+    deltas = np.abs(np.random.default_rng(0).normal(0, 5, 1000))
+    expected, last = [], 0
+    for delta in deltas:
+        last += (delta - last) / 16
+        expected.append(last)
+
+    assert _calc_jitter(deltas) == pytest.approx(expected, rel=1e-12)
+
+
+@pytest.mark.parametrize('clock_rate', [8000, 16000, 48000])
+def test_stream_stats_clock_rate(clock_rate):
+    # 20ms packets, with the RTP clock wrapping partway through
+    step = clock_rate // 50
+    start = 2 ** 32 - 10 * step
+    packets = [PacketData(frametime=frametime,
+                          packet=RTP(seq=seq, p_type=96,
+                                     timestamp=(start + seq * step) % 2 ** 32,
+                                     payload=b'\xff' * 160))
+               for frametime, seq in zip(frametimes(20), range(50))]
+    stats = StreamStats(packets, clock_rate=clock_rate)
+
+    assert stats.sample_rate == clock_rate
+    assert stats.jitter.max() == pytest.approx(0, abs=1e-6)
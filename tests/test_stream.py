@@ -1,4 +1,11 @@
+import asyncio
+import contextlib
+import socket
+
 import aiortp
+from aiortp import sdp
+from aiortp.codecs import PCMA
+from aiortp.packet import RTP
 import pytest
 
 
@@ -52,3 +59,69 @@ a=fmtp:101 0-15\r
 a=ptime:20\r
 a=sendrecv\r
 '''
+
+
+def test_tone_frames_are_views():
+    source = aiortp.Tone(440, 1, 160)
+    packets = list(source)
+
+    assert len(packets) == 50
+    assert all(isinstance(pkt.payload, memoryview) for pkt in packets)
+    assert [pkt.seq - packets[0].seq for pkt in packets] == list(range(50))
+    assert b''.join(pkt.payload for pkt in packets) == bytes(source.media) * 5
+
+
+@pytest.fixture
+def sink():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(1)
+    yield sock
+    sock.close()
+
+
+async def test_negotiated_codec_is_sent(rtp_server, loop, sink):
+    stream = rtp_server.create_new_stream(
+        ('127.0.0.1', None), loop=loop,
+        formats=(sdp.PCMU, sdp.PCMA, sdp.DTMF))
+    await stream.negotiate(
+        'c=IN IP4 127.0.0.1\r\n'
+        'm=audio {} RTP/AVP 8 96\r\n'
+        'a=rtpmap:96 telephone-event/8000\r\n'.format(
+            sink.getsockname()[1]))
+    assert stream.codec is PCMA
+    assert stream.telephone_event.payload_type == 96
+
+    with pytest.raises(ValueError):
+        await stream.schedule(aiortp.Tone(1000, 0.04, 160, loop=loop))
+
+    await stream.schedule(aiortp.Tone(1000, 0.04, 160, codec=8, loop=loop))
+    await stream.schedule(aiortp.DTMF('1', loop=loop))
+    stream.close()
+    rtp_server._timer.close()
+
+    p_types = set()
+    with contextlib.suppress(socket.timeout):
+        while True:
+            p_types.add(RTP.parse(sink.recv(2048)).p_type)
+            sink.settimeout(0.1)
+    assert p_types == {8, 96}
+
+
+@pytest.mark.parametrize('how', ['stop', 'close', 'scheduler'])
+async def test_schedule_returns_when_stopped(rtp_server, loop, sink, how):
+    stream = rtp_server.create_new_stream(('127.0.0.1', None), loop=loop)
+    await stream.negotiate('c=IN IP4 127.0.0.1\r\nm=audio {} RTP/AVP 0\r\n'
+                           .format(sink.getsockname()[1]))
+    playing = loop.create_task(
+        stream.schedule(aiortp.Tone(1000, 60, 160, loop=loop)))
+    await asyncio.sleep(0.05)
+
+    if how == 'scheduler':
+        rtp_server.stop()
+    else:
+        getattr(stream, how)()
+    await asyncio.wait_for(playing, 1)
+
+    stream.close()
+    rtp_server._timer.close()